@@ -0,0 +1,61 @@
+"""
+Measures Docker Compose generation time for large scenarios.
+
+Usage:
+    python -m benchmarks.compose_generation_bench [nodes] [masters]
+"""
+
+import ipaddress
+import os
+import sys
+import tempfile
+import time
+
+from src.docker_compose_generator import DockerComposeGenerator
+
+
+def build_scenario(nodes: int, masters: int, network: str = "172.28.0.0/16"):
+    """
+    Builds a scenario where every other slave has an explicit IP and the rest are allocated dynamically.
+    """
+    base = ipaddress.ip_network(network).network_address
+    scenario_nodes = [{"role": "master"} for _ in range(masters)]
+    for i in range(nodes - masters):
+        node = {"role": "slave"}
+        if i % 2 == 0:
+            node["ip"] = str(base + 2 + nodes - i)
+        scenario_nodes.append(node)
+    return {"protocol": "modbus", "ip_network": network, "nodes": scenario_nodes}
+
+
+def run(nodes: int = 5000, masters: int = 50):
+    scenario = build_scenario(nodes, masters)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "docker-compose.yml")
+        generator = DockerComposeGenerator("modbus", path, "/tmp/ICSCommEmulator")
+
+        start = time.perf_counter()
+        generator.parse(scenario, path, "/tmp/ICSCommEmulator")
+        total = time.perf_counter() - start
+
+        # Addressing and service construction alone, without validation and YAML output
+        generator = DockerComposeGenerator("modbus", path, "/tmp/ICSCommEmulator")
+        generator.add_network("icscommemulator", scenario["ip_network"])
+        start = time.perf_counter()
+        masters_nodes = [n for n in scenario["nodes"] if n["role"] == "master"]
+        slaves_nodes = [n for n in scenario["nodes"] if n["role"] == "slave"]
+        ips = generator.assign_addresses(masters_nodes, slaves_nodes)
+        addressing = time.perf_counter() - start
+        for i in range(len(slaves_nodes)):
+            generator.add_node("slave", i, ip=ips[("slave", i)])
+        services = time.perf_counter() - start - addressing
+
+    print(f"nodes={nodes} masters={masters}")
+    print(f"  addressing:      {addressing * 1000:9.1f} ms")
+    print(f"  slave services:  {services * 1000:9.1f} ms")
+    print(f"  full parse:      {total * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
@@ -0,0 +1,81 @@
+"""
+Measures per-node configuration generation time for large scenarios.
+
+Usage:
+    python -m benchmarks.config_generation_bench [nodes] [masters] [messages]
+"""
+
+import copy
+import os
+import sys
+import tempfile
+import time
+
+from src.scenario_config_generator import ScenarioConfigGenerator
+
+
+def build_scenario(nodes: int, masters: int, messages: int):
+    """
+    Builds a scenario where every master polls every slave in turn.
+    """
+    slaves = nodes - masters
+    scenario_nodes = [
+        {
+            "role": "master",
+            "messages": [
+                {
+                    "slave_id": j % slaves,
+                    "function": 3 if j % 2 else 6,
+                    "address": j % 100,
+                    "count": "1",
+                    "values": None if j % 2 else [j],
+                    "interval": 1.0,
+                }
+                for j in range(messages)
+            ],
+        }
+        for _ in range(masters)
+    ]
+    for i in range(slaves):
+        scenario_nodes.append(
+            {
+                "role": "slave",
+                "name": f"slave{i}",
+                "ip": f"172.28.{i // 250}.{i % 250 + 2}",
+                "port": 502,
+                "holding_registers": {"start": 0, "values": list(range(16))},
+            }
+        )
+    return {"protocol": "modbus", "nodes": scenario_nodes}
+
+
+def _time(scenario, config_path, max_workers):
+    generator = ScenarioConfigGenerator(copy.deepcopy(scenario), config_path)
+    start = time.perf_counter()
+    changed = generator.generate(max_workers=max_workers)
+    return time.perf_counter() - start, len(changed)
+
+
+def run(nodes: int = 1000, masters: int = 100, messages: int = 200):
+    scenario = build_scenario(nodes, masters, messages)
+    print(
+        f"nodes={nodes} masters={masters} messages/master={messages} cpus={os.cpu_count()}"
+    )
+    for max_workers in (1, None):
+        with tempfile.TemporaryDirectory() as folder:
+            config_path = os.path.join(folder, "ICSCommEmulator")
+            cold, written = _time(scenario, config_path, max_workers)
+            warm, _ = _time(scenario, config_path, max_workers)
+            scenario["nodes"][-1]["port"] = 5020
+            one, _ = _time(scenario, config_path, max_workers)
+            scenario["nodes"][-1]["port"] = 502
+        label = "sequential" if max_workers == 1 else "threaded"
+        print(f"  {label}:")
+        print(f"    first generation ({written} files): {cold * 1000:9.1f} ms")
+        print(f"    unchanged scenario:        {warm * 1000:9.1f} ms")
+        print(f"    one node changed:          {one * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
@@ -0,0 +1,82 @@
+"""
+Measures Cytoscape-to-scenario conversion time on large graphs.
+
+Usage:
+    python -m benchmarks.cytoscape_conversion_bench [max_nodes] [messages_per_edge]
+"""
+
+import ipaddress
+import sys
+import time
+
+from src.cytoscape_adapter import (
+    PROTOCOL,
+    cytoscape_to_scenario,
+    generate_network_nodes,
+    parse_cytoscape_json,
+)
+
+
+def build_graph(nodes: int, messages_per_edge: int, masters: int = None):
+    """
+    Builds a graph where every slave is polled by one master.
+    """
+    masters = masters or max(1, nodes // 20)
+    network = ipaddress.ip_network("10.0.0.0/8")
+    graph_nodes, edges = generate_network_nodes(
+        PROTOCOL.MODBUS.value, network.network_address + 2, masters, nodes - masters
+    )
+    for i in range(nodes - masters):
+        edges.append(
+            {
+                "data": {
+                    "id": f"edge_{i}",
+                    "source": f"master_{i % masters}",
+                    "target": f"slave_{i}",
+                    "messages": [
+                        {
+                            "timestamp": j,
+                            "recurrent": j % 2 == 0,
+                            "interval": 1,
+                            "function_code": 3,
+                            "start_address": j % 100,
+                            "count": 1,
+                        }
+                        for j in range(messages_per_edge)
+                    ],
+                }
+            }
+        )
+    return {
+        "protocol": PROTOCOL.MODBUS.value,
+        "ip_network": str(network),
+        "nodes": graph_nodes,
+        "edges": edges,
+    }
+
+
+def run(max_nodes: int = 5000, messages_per_edge: int = 40):
+    print(f"messages/edge={messages_per_edge}")
+    nodes = 625
+    while nodes <= max_nodes:
+        graph = build_graph(nodes, messages_per_edge)
+        messages = sum(len(edge["data"]["messages"]) for edge in graph["edges"])
+
+        start = time.perf_counter()
+        cytoscape_to_scenario(graph)
+        convert = time.perf_counter() - start
+        start = time.perf_counter()
+        parse_cytoscape_json(graph)
+        total = time.perf_counter() - start
+
+        print(
+            f"  nodes={nodes:6d} messages={messages:8d}"
+            f"  convert {convert * 1000:8.1f} ms ({convert / messages * 1e6:5.2f} us/message)"
+            f"  with YAML {total * 1000:9.1f} ms"
+        )
+        nodes *= 2
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
@@ -0,0 +1,195 @@
+"""
+Measures the cost of master logging at a high request rate.
+
+A ModbusMaster runs a schedule of requests spaced evenly at the target rate
+(10k req/s by default), with requests answered instantly instead of being
+sent, so only scheduling, metrics and logging are measured. Log lines go to a
+pipe drained by another process, as container logs are. The logging modes are:
+
+* none: nothing is logged;
+* sync: every request is written unbuffered from the master thread, as with
+  the former per-message print and PYTHONUNBUFFERED;
+* queued: every request is logged through setup_logging (queue, buffered
+  stream written by a listener thread);
+* sampled: one request in 100 is logged through setup_logging.
+
+Every mode reports the CPU time per request of the master process (both
+threads), the share of a CPU it represents at the target rate, the overhead
+over "none" and the lateness of the requests against their schedule.
+
+Usage:
+    python -m benchmarks.logging_bench [--rate 10000] [--requests 50000] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import io
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+from benchmarks.results import check, save_report
+from protocols.modbus.master.master import ModbusMaster, setup_logging
+from src.scenario_config_generator import ScenarioConfigGenerator
+
+MODES = {
+    "none": None,
+    "sync": 1,
+    "queued": 1,
+    "sampled": 100,
+}
+
+THRESHOLDS = {
+    "cpu_us_per_request": 0.30,
+}
+
+
+class Response:
+    def isError(self):
+        return False
+
+
+class NullMaster(ModbusMaster):
+    """
+    ModbusMaster whose requests are answered at once, without being sent.
+    """
+
+    RESPONSE = Response()
+
+    def _send_message(self, *args, **kwargs):
+        return self.RESPONSE
+
+
+def write_schedule(folder: str, requests: int, rate: float) -> str:
+    messages = [
+        {
+            "timestamp": i / rate,
+            "recurrent": False,
+            "interval": 1,
+            "ip": "127.0.0.1",
+            "port": 502,
+            "slave_id": 1,
+            "function_code": 3,
+            "start_address": 0,
+            "count": 10,
+            "values": [],
+        }
+        for i in range(requests)
+    ]
+    path, content = ScenarioConfigGenerator(None, folder)._craft_master(messages, 0)
+    csv_file = os.path.join(folder, path)
+    os.makedirs(os.path.dirname(csv_file), exist_ok=True)
+    with open(csv_file, "w") as f:
+        f.write(content)
+    return csv_file
+
+
+def quantile(histogram, q: float) -> float:
+    """
+    Returns the upper bound of the bucket holding the quantile q of a histogram.
+    """
+    total = sum(histogram.counts)
+    seen = 0
+    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+        seen += count
+        if seen >= q * total:
+            return bound
+    return float("inf")
+
+
+def run_mode(mode: str, csv_file: str) -> dict:
+    """
+    Runs the schedule with a logging mode, writing the logs to a drained pipe.
+    """
+    read_fd, write_fd = os.pipe()
+    drain = subprocess.Popen(["cat"], stdin=read_fd, stdout=subprocess.DEVNULL)
+    os.close(read_fd)
+    root = logging.getLogger()
+    handlers, level = root.handlers, root.level
+    listener = None
+    if mode == "sync":
+        stream = io.TextIOWrapper(io.FileIO(write_fd, "w"), write_through=True)
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        root.handlers = [handler]
+        root.setLevel(logging.INFO)
+    elif mode in ("queued", "sampled"):
+        stream = io.TextIOWrapper(io.BufferedWriter(io.FileIO(write_fd, "w")))
+        listener = setup_logging("INFO", stream=stream)
+    else:
+        stream = io.TextIOWrapper(io.FileIO(write_fd, "w"))
+        root.handlers = []
+        root.setLevel(logging.WARNING)
+
+    master = NullMaster(csv_file, log_sample=MODES[mode] or 1)
+    try:
+        cpu = time.process_time()
+        start = time.perf_counter()
+        master.loop()
+        if listener:
+            listener.stop()
+        cpu = time.process_time() - cpu
+        elapsed = time.perf_counter() - start
+    finally:
+        root.handlers, root.level = handlers, level
+        stream.close()
+        drain.wait()
+
+    requests = len(master.responses)
+    lateness = master.metrics.lateness
+    return {
+        "mode": mode,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        "cpu_us_per_request": round(cpu / requests * 1e6, 2),
+        "mean_lateness_ms": round(lateness.sum / requests * 1000, 3),
+        "p99_lateness_ms": quantile(lateness, 0.99) * 1000,
+    }
+
+
+def run(
+    rate: float = 10000,
+    requests: int = 50000,
+    output: str = "logging_bench.json",
+    baseline: str = None,
+):
+    results = []
+    print(
+        f"{'mode':>8} {'req/s':>8} {'cpu us/req':>10} {'cpu %':>6} {'overhead us':>11}"
+        f" {'mean late ms':>12} {'p99 late ms':>11}"
+    )
+    with tempfile.TemporaryDirectory() as folder:
+        csv_file = write_schedule(folder, requests, rate)
+        for mode in MODES:
+            result = run_mode(mode, csv_file)
+            result["rate"] = rate
+            result["cpu_share"] = round(result["cpu_us_per_request"] * rate / 1e6, 3)
+            result["overhead_us_per_request"] = round(
+                (
+                    result["cpu_us_per_request"] - results[0]["cpu_us_per_request"]
+                    if results
+                    else 0.0
+                ),
+                2,
+            )
+            results.append(result)
+            print(
+                f"{mode:>8} {result['requests_per_second']:8.1f} {result['cpu_us_per_request']:10.2f}"
+                f" {result['cpu_share'] * 100:6.1f} {result['overhead_us_per_request']:11.2f}"
+                f" {result['mean_lateness_ms']:12.3f} {result['p99_lateness_ms']:11.1f}"
+            )
+
+    save_report(output, results, THRESHOLDS)
+    if baseline:
+        check(results, baseline, ["mode", "rate"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rate", type=float, default=10000)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--output", default="logging_bench.json")
+    parser.add_argument("--compare", dest="baseline", help="previous results file")
+    run(**vars(parser.parse_args()))
@@ -0,0 +1,267 @@
+"""
+Measures Modbus request throughput and latency end to end, without Docker.
+
+Slaves run as local processes serving on 127.0.0.1, each on its own port, and
+a ModbusMaster sends its whole schedule to them from this process, as fast as
+the schedule allows (every message is due at once). The parameters are swept
+one at a time around a base case:
+
+* schedule size: number of messages in master.csv;
+* slaves: number of slaves the messages are spread over;
+* function-code mix: read (3), write (6 and 16) or mixed (1, 3, 4, 6 and 16);
+* register block size: registers or coils read or written per request.
+
+Every case reports requests/s, p50/p99 latency, CPU time and RSS of the
+master and the slaves. Results are saved as JSON; given a previous results
+file, cases slower than its thresholds are reported as regressions and the
+exit status is 1.
+
+Usage:
+    python -m benchmarks.modbus_bench [--output FILE] [--compare FILE] [--quick]
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import socket
+import statistics
+import tempfile
+import time
+
+from benchmarks.results import check, save_report
+from protocols.modbus.master.master import ModbusMaster
+from protocols.modbus.slave.slave import ModbusSlave
+from src.scenario_config_generator import ScenarioConfigGenerator
+
+BASE_PORT = 15020
+REGISTERS = 256
+
+BASE_CASE = {"messages": 500, "slaves": 1, "mix": "read", "block": 1}
+SWEEP = {
+    "messages": [100, 500, 2000],
+    "slaves": [1, 2, 4, 8],
+    "mix": ["read", "write", "mixed"],
+    "block": [1, 16, 125],
+}
+QUICK_SWEEP = {
+    "messages": [100, 500],
+    "slaves": [1, 4],
+    "mix": ["read", "mixed"],
+    "block": [1, 125],
+}
+
+# Function codes of the messages, in turn
+MIXES = {
+    "read": [3],
+    "write": [6, 16],
+    "mixed": [3, 1, 4, 6, 16],
+}
+
+# Allowed change against a baseline before a case counts as a regression
+THRESHOLDS = {
+    "requests_per_second": -0.20,
+    "p99_ms": 0.50,
+}
+
+
+class TimedMaster(ModbusMaster):
+    """
+    ModbusMaster recording the latency of every request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.latencies = []
+        self.errors = 0
+        super().__init__(*args, **kwargs)
+
+    def _send_message(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = super()._send_message(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        if not result or result.isError():
+            self.errors += 1
+        return result
+
+
+def message(i: int, function_code: int, block: int, slaves: int) -> dict:
+    """
+    Builds the scenario message number i, as found in a master node.
+    """
+    write = function_code in (5, 6, 15, 16)
+    if function_code in (5, 6):
+        values = [i % 2 if function_code == 5 else i % 1000]
+    elif write:
+        values = [(i + k) % (2 if function_code == 15 else 1000) for k in range(block)]
+    else:
+        values = []
+    return {
+        "timestamp": 0,
+        "recurrent": False,
+        "interval": 1,
+        "ip": "127.0.0.1",
+        "port": BASE_PORT + i % slaves,
+        "slave_id": 1,
+        "function_code": function_code,
+        "start_address": 0,
+        "count": 0 if write else block,
+        "values": values,
+    }
+
+
+def slave_config(port: int) -> dict:
+    values = {"type": "sequential", "values": list(range(REGISTERS))}
+    bits = {"type": "sequential", "values": [i % 2 for i in range(REGISTERS)]}
+    return {
+        "ip": "127.0.0.1",
+        "port": port,
+        "slave_id": 1,
+        "holding_registers": values,
+        "input_registers": values,
+        "coils": bits,
+        "discrete_inputs": bits,
+        "identity": {},
+    }
+
+
+def _serve(config_file: str, lock_file: str):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        ModbusSlave(config_file, lock_file).start()
+
+
+def _accepts_connections(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+
+def _process_stats(pid: int) -> tuple[float, float]:
+    # CPU seconds and RSS in MiB of a process, from procfs
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    return cpu, rss
+
+
+def start_slaves(folder: str, count: int) -> list[multiprocessing.Process]:
+    generator = ScenarioConfigGenerator(None, folder)
+    processes = []
+    for i in range(count):
+        path, content = generator._craft_slave(slave_config(BASE_PORT + i), i)
+        config_file = os.path.join(folder, path)
+        os.makedirs(os.path.dirname(config_file), exist_ok=True)
+        with open(config_file, "w") as f:
+            f.write(content)
+        lock_file = os.path.join(os.path.dirname(config_file), "app_running.lock")
+        process = multiprocessing.Process(
+            target=_serve, args=(config_file, lock_file), daemon=True
+        )
+        process.start()
+        processes.append(process)
+
+    deadline = time.monotonic() + 10
+    while not all(_accepts_connections(BASE_PORT + i) for i in range(count)):
+        if time.monotonic() > deadline:
+            raise Exception("Slaves not ready after 10s")
+        time.sleep(0.05)
+    return processes
+
+
+def run_case(case: dict) -> dict:
+    """
+    Runs one benchmark case.
+
+    Args:
+        case (dict): Values of the swept parameters.
+
+    Returns:
+        dict: The case and its measurements.
+    """
+    mix = MIXES[case["mix"]]
+    messages = [
+        message(i, mix[i % len(mix)], case["block"], case["slaves"])
+        for i in range(case["messages"])
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        path, content = ScenarioConfigGenerator(None, folder)._craft_master(messages, 0)
+        csv_file = os.path.join(folder, path)
+        os.makedirs(os.path.dirname(csv_file), exist_ok=True)
+        with open(csv_file, "w") as f:
+            f.write(content)
+
+        slaves = start_slaves(folder, case["slaves"])
+        try:
+            slaves_cpu = sum(_process_stats(p.pid)[0] for p in slaves)
+            master = TimedMaster(csv_file)
+            cpu = time.process_time()
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                master.loop()
+            elapsed = time.perf_counter() - start
+            cpu = time.process_time() - cpu
+            slave_stats = [_process_stats(p.pid) for p in slaves]
+        finally:
+            for process in slaves:
+                process.terminate()
+            for process in slaves:
+                process.join()
+
+    latencies = sorted(master.latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        **case,
+        "requests": len(latencies),
+        "errors": master.errors,
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+        "master_cpu_seconds": round(cpu, 3),
+        "master_rss_mb": round(_process_stats(os.getpid())[1], 1),
+        "slaves_cpu_seconds": round(sum(c for c, _ in slave_stats) - slaves_cpu, 3),
+        "slaves_rss_mb": round(sum(r for _, r in slave_stats), 1),
+    }
+
+
+def cases(sweep: dict) -> list[dict]:
+    """
+    Returns the base case followed by the cases varying one parameter of it.
+    """
+    result = [dict(BASE_CASE)]
+    for parameter, values in sweep.items():
+        for value in values:
+            case = {**BASE_CASE, parameter: value}
+            if case not in result:
+                result.append(case)
+    return result
+
+
+def run(output: str = "modbus_bench.json", baseline: str = None, quick: bool = False):
+    results = []
+    print(
+        f"{'messages':>8} {'slaves':>6} {'mix':>6} {'block':>5}"
+        f" {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'cpu s':>6} {'rss MB':>7} {'errors':>6}"
+    )
+    for case in cases(QUICK_SWEEP if quick else SWEEP):
+        result = run_case(case)
+        results.append(result)
+        print(
+            f"{result['messages']:8d} {result['slaves']:6d} {result['mix']:>6} {result['block']:5d}"
+            f" {result['requests_per_second']:8.1f} {result['p50_ms']:8.3f} {result['p99_ms']:8.3f}"
+            f" {result['master_cpu_seconds']:6.2f} {result['master_rss_mb']:7.1f} {result['errors']:6d}"
+        )
+
+    save_report(output, results, THRESHOLDS)
+    if baseline:
+        check(results, baseline, list(BASE_CASE))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default="modbus_bench.json")
+    parser.add_argument("--compare", dest="baseline", help="previous results file")
+    parser.add_argument("--quick", action="store_true", help="run fewer cases")
+    run(**vars(parser.parse_args()))
@@ -0,0 +1,164 @@
+"""
+Measures how the stages of scenario preparation scale with the scenario size.
+
+Synthetic scenarios are built with TopologyGenerator: one master per 20 nodes,
+every slave polled by one master with the "mixed" profile (4 messages per
+edge) and the "counters" register template. For every size, each stage runs
+once timed and once under tracemalloc for its peak memory:
+
+* parse_cytoscape_json: conversion of the editor graph to the YAML scenario;
+* validate_cytoscape_scenario: WARNING-level validation of the graph;
+* DockerComposeGenerator.parse: compose file generation, with in-process
+  validation only (the docker compose CLI check is not run);
+* ScenarioConfigGenerator.generate: node configuration files.
+
+The scaling exponent of a stage between two sizes is log(t2 / t1) / log(n2 / n1):
+about 1 for linear stages, 2 for quadratic ones. Exponents above 1.5 are
+flagged. Results are saved as JSON and can be compared with a previous run.
+
+Usage:
+    python -m benchmarks.pipeline_bench [--sizes 10 100 1000 10000] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.results import check, save_report
+from src.cytoscape_adapter import (
+    LEVEL,
+    cytoscape_to_scenario,
+    parse_cytoscape_json,
+    validate_cytoscape_scenario,
+)
+from src.docker_compose_generator import DockerComposeGenerator
+from src.scenario_config_generator import ScenarioConfigGenerator
+from src.topology_generator import TopologyGenerator
+
+SIZES = [10, 100, 1000, 10000]
+# Exponents above this are reported as superlinear
+SUPERLINEAR = 1.5
+
+THRESHOLDS = {
+    "seconds": 0.50,
+    "peak_mb": 0.30,
+}
+
+
+def build_graph(nodes: int) -> dict:
+    """
+    Builds the editor graph of a scenario with the given number of nodes.
+    """
+    masters = max(1, nodes // 20)
+    generator = TopologyGenerator(
+        masters,
+        nodes - masters,
+        ip_network="10.0.0.0/16",
+        polling="mixed",
+        registers="counters",
+    )
+    return {
+        "protocol": generator.protocol,
+        "ip_network": str(generator.ip_network),
+        "nodes": [node for node, _ in generator.nodes()],
+        "edges": list(generator.edges()),
+    }
+
+
+def stages(graph: dict, folder: str) -> dict:
+    """
+    Returns the stages to measure, as functions of a run label keeping the outputs of runs apart.
+    """
+    scenario = cytoscape_to_scenario(graph)
+
+    def compose(run):
+        path = os.path.join(folder, f"docker-compose-{run}.yml")
+        config_path = os.path.join(folder, f"config-{run}")
+        DockerComposeGenerator(scenario["protocol"], path, config_path).parse(
+            scenario, path, config_path, cli_validation=False
+        )
+
+    def config(run):
+        ScenarioConfigGenerator(
+            scenario, os.path.join(folder, f"config-{run}")
+        ).generate()
+
+    return {
+        "parse_cytoscape_json": lambda run: parse_cytoscape_json(graph),
+        "validate_cytoscape_scenario": lambda run: validate_cytoscape_scenario(
+            graph, LEVEL.WARNING
+        ),
+        "docker_compose_parse": compose,
+        "scenario_config_generate": config,
+    }
+
+
+def measure(stage) -> tuple[float, float]:
+    """
+    Runs a stage twice, for its time and for its peak memory.
+
+    Returns:
+        tuple[float, float]: Seconds, and peak traced memory in MiB.
+    """
+    start = time.perf_counter()
+    stage("timed")
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        stage("traced")
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak / 2**20
+
+
+def run(sizes: list[int] = None, output: str = "pipeline_bench.json", baseline=None):
+    results = []
+    previous = {}
+    print(
+        f"{'stage':<28} {'nodes':>6} {'messages':>8} {'time ms':>10} {'peak MiB':>9} {'exponent':>8}"
+    )
+    for nodes in sizes or SIZES:
+        graph = build_graph(nodes)
+        messages = sum(len(edge["data"]["messages"]) for edge in graph["edges"])
+        with tempfile.TemporaryDirectory() as folder:
+            for name, stage in stages(graph, folder).items():
+                seconds, peak = measure(stage)
+                exponent = None
+                if name in previous:
+                    before_nodes, before_seconds = previous[name]
+                    exponent = math.log(seconds / before_seconds) / math.log(
+                        nodes / before_nodes
+                    )
+                previous[name] = (nodes, seconds)
+                results.append(
+                    {
+                        "stage": name,
+                        "nodes": nodes,
+                        "messages": messages,
+                        "seconds": round(seconds, 6),
+                        "peak_mb": round(peak, 3),
+                        "exponent": None if exponent is None else round(exponent, 2),
+                    }
+                )
+                flag = " superlinear" if exponent and exponent > SUPERLINEAR else ""
+                print(
+                    f"{name:<28} {nodes:6d} {messages:8d} {seconds * 1000:10.1f} {peak:9.2f}"
+                    f" {'' if exponent is None else f'{exponent:8.2f}'}{flag}"
+                )
+
+    save_report(output, results, THRESHOLDS)
+    if baseline:
+        check(results, baseline, ["stage", "nodes"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--output", default="pipeline_bench.json")
+    parser.add_argument("--compare", dest="baseline", help="previous results file")
+    run(**vars(parser.parse_args()))
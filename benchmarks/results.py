@@ -0,0 +1,104 @@
+"""
+Saving of benchmark results and comparison with a previous run.
+
+Results are lists of flat dicts, one per case, holding the parameters of the
+case and its metrics. A report adds the commit and platform they were measured
+on and the regression thresholds: the relative change of a metric allowed
+against a baseline, negative for metrics that must not drop (throughput) and
+positive for metrics that must not grow (time, memory).
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any
+
+
+def save_report(
+    output: str, results: list[dict[str, Any]], thresholds: dict[str, float]
+) -> dict[str, Any]:
+    """
+    Writes a results report as JSON.
+
+    Args:
+        output (str): Path of the report.
+        results (list[dict]): Results of every case.
+        thresholds (dict[str, float]): Allowed relative change of each metric.
+
+    Returns:
+        dict: The report.
+    """
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "thresholds": thresholds,
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+    return report
+
+
+def compare(
+    results: list[dict[str, Any]], baseline: dict[str, Any], keys: list[str]
+) -> list[str]:
+    """
+    Compares results against a previous report, using the thresholds stored in it.
+
+    Args:
+        results (list[dict]): Results of every case.
+        baseline (dict): Previous report.
+        keys (list[str]): Parameters identifying a case.
+
+    Returns:
+        list[str]: Descriptions of the metrics beyond their threshold.
+    """
+    previous = {tuple(r[k] for k in keys): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = tuple(result[k] for k in keys)
+        before = previous.get(key)
+        if before is None:
+            continue
+        for metric, allowed in baseline["thresholds"].items():
+            if not before.get(metric) or metric not in result:
+                continue
+            change = result[metric] / before[metric] - 1
+            if (allowed < 0 and change < allowed) or (allowed > 0 and change > allowed):
+                regressions.append(
+                    f"{dict(zip(keys, key))}: {metric} {before[metric]} -> "
+                    f"{result[metric]} ({change:+.0%}, allowed {allowed:+.0%})"
+                )
+    return regressions
+
+
+def check(results: list[dict[str, Any]], baseline_path: str, keys: list[str]):
+    """
+    Prints the regressions against a previous report and exits with status 1 if there are any.
+    """
+    with open(baseline_path) as f:
+        regressions = compare(results, json.load(f), keys)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions against {baseline_path}")
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
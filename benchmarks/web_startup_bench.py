@@ -0,0 +1,49 @@
+"""
+Measures the cold-start time and memory of the web server process.
+
+Each sample runs a fresh interpreter that imports the server module and
+builds the Flask application, then reports the elapsed time and peak RSS.
+
+Usage:
+    python -m benchmarks.web_startup_bench [samples]
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, resource, time
+start = time.perf_counter()
+from web.web import NetworkAPI
+NetworkAPI()
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": sorted(m for m in ("pandas", "numpy", "yaml", "flask") if m in __import__("sys").modules),
+}))
+"""
+
+
+def run(samples: int = 5):
+    results = []
+    for _ in range(samples):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD], capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"samples={samples}")
+    print(
+        f"  import + app:  {statistics.median(r['seconds'] for r in results) * 1000:8.1f} ms (median)"
+    )
+    print(
+        f"  peak RSS:      {statistics.median(r['max_rss_kb'] for r in results) / 1024:8.1f} MiB (median)"
+    )
+    print(f"  loaded:        {', '.join(results[-1]['modules'])}")
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:]])
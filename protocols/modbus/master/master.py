@@ -1,14 +1,241 @@
+import bisect
 import csv
+import heapq
+import http.server
+import logging
+import logging.handlers
+import math
+import os
+import queue
+import signal
 import sys
+import threading
 import time
 from pymodbus.client import ModbusTcpClient
 from pymodbus.client.modbusclientprotocol import ModbusClientProtocol
 from pymodbus.constants import DeviceInformation
+from pymodbus.exceptions import (
+    ConnectionException,
+    ModbusException,
+    ModbusIOException,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the histogram buckets
+DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+)
+LATENESS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets, exported as a cumulative Prometheus histogram.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            yield f"{name}_bucket", {**labels, "le": le}, total
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, total
+
+
+class RequestStats:
+    """
+    Outcomes of the requests sent to a target with a function code.
+    """
+
+    def __init__(self, target, function_code):
+        self.labels = {"target": target, "function_code": str(function_code)}
+        self.requests = 0
+        self.exception_responses = 0
+        self.timeouts = 0
+        self.connection_failures = 0
+        self.errors = 0
+        self.duration = Histogram(DURATION_BUCKETS)
+
+
+class MasterMetrics:
+    """
+    Metrics of a master, in the Prometheus text format.
+
+    Recording a request costs a few integer increments and a bisect over the
+    buckets. The stats of every target and function code are created with the
+    schedule, so snapshots taken from another thread never see them change size.
+    """
+
+    COUNTERS = (
+        ("requests", "Requests sent."),
+        ("exception_responses", "Requests answered with a Modbus exception."),
+        ("timeouts", "Requests left without a response."),
+        ("connection_failures", "Requests whose connection to the target failed."),
+        ("errors", "Requests failed for another reason."),
+    )
+
+    def __init__(self):
+        self.stats = {}
+        self.lateness = Histogram(LATENESS_BUCKETS)
+
+    def request_stats(self, target, function_code):
+        key = (target, function_code)
+        if key not in self.stats:
+            self.stats[key] = RequestStats(target, function_code)
+        return self.stats[key]
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        stats = list(self.stats.values())
+        for attribute, description in self.COUNTERS:
+            name = f"modbus_master_{attribute}_total"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            lines += [_sample(name, s.labels, getattr(s, attribute)) for s in stats]
+
+        name = "modbus_master_request_duration_seconds"
+        lines += [
+            f"# HELP {name} Time from connecting to the target to receiving its response.",
+            f"# TYPE {name} histogram",
+        ]
+        for s in stats:
+            lines += [_sample(*sample) for sample in s.duration.samples(name, s.labels)]
+
+        name = "modbus_master_lateness_seconds"
+        lines += [
+            f"# HELP {name} Delay between the scheduled and the actual send time of requests.",
+            f"# TYPE {name} histogram",
+        ]
+        lines += [_sample(*sample) for sample in self.lateness.samples(name, {})]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Writes the metrics to a file, replacing it atomically so readers never see a partial file.
+        """
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(self.render())
+        os.replace(temporary, path)
+
+    def serve(self, port):
+        """
+        Serves the metrics over HTTP on a port, from a daemon thread.
+        """
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _sample(name, labels, value):
+    if not labels:
+        return f"{name} {value}"
+    text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return f"{name}{{{text}}} {value}"
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """
+    Stream handler flushing its stream at most once per interval instead of after every record.
+    """
+
+    def __init__(self, stream=None, flush_interval=1.0):
+        super().__init__(stream)
+        self.flush_interval = flush_interval
+        self._flushed = time.monotonic()
+
+    def flush(self):
+        now = time.monotonic()
+        if now - self._flushed >= self.flush_interval:
+            super().flush()
+            self._flushed = now
+
+    def close(self):
+        super().flush()
+        super().close()
+
+
+def setup_logging(level="INFO", flush_interval=1.0, stream=None):
+    """
+    Sends the log records to a stream, stdout by default, from a background thread.
+
+    The logging thread only formats the message and queues the record; the
+    line is laid out and written to the buffered stream by the listener thread.
+
+    Returns:
+        logging.handlers.QueueListener: The started listener, to stop on exit.
+    """
+    handler = BufferedStreamHandler(stream or sys.stdout, flush_interval)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    root.setLevel(level)
+    # pymodbus logs every failed connection; failures are logged sampled instead
+    if root.getEffectiveLevel() > logging.DEBUG:
+        logging.getLogger("pymodbus").setLevel(logging.CRITICAL)
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    return listener
 
 
 class ModbusMaster:
-    def __init__(self, csv_file="master.csv"):
+    def __init__(
+        self,
+        csv_file="master.csv",
+        source_address=None,
+        metrics_file=None,
+        metrics_interval=10.0,
+        log_sample=1,
+        summary_interval=10.0,
+    ):
         self.csv_file = csv_file
+        self.source_address = (source_address, 0) if source_address else None
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.metrics = MasterMetrics()
+        self.log_sample = max(1, int(log_sample))
+        self.summary_interval = summary_interval
+        self._summarized = (time.monotonic(), 0, 0, 0, 0.0, 0)
         self.responses = []
         self._clients = {}
         self._rows = []
@@ -43,17 +270,33 @@ class ModbusMaster:
                 )
 
                 self._clients[(row["ip"], int(row["port"]))] = ModbusTcpClient(
-                    row["ip"], port=int(row["port"])
+                    row["ip"],
+                    port=int(row["port"]),
+                    source_address=self.source_address,
                 )
-                self._rows.append(row)
+                row["stats"] = self.metrics.request_stats(
+                    f"{row['ip']}:{row['port']}", row["function_code"]
+                )
+                # Rows are ordered by timestamp, then by position in the file
+                self._rows.append((row["timestamp"], len(self._rows), row))
 
-        self._rows.sort(key=lambda x: x["timestamp"])
+        heapq.heapify(self._rows)
 
     def _send_message(
         self, client, function_code, start_address, slave_id, values=None, count=None
     ):
         result = False
         client.connect()
+        try:
+            result = self._request(
+                client, function_code, start_address, slave_id, values, count
+            )
+        finally:
+            client.close()
+        return result
+
+    def _request(self, client, function_code, start_address, slave_id, values, count):
+        result = False
         if function_code in [1, 2, 3, 4]:
             if function_code == 1:
                 result = client.read_coils(start_address, count=count, slave=slave_id)
@@ -80,64 +323,186 @@ class ModbusMaster:
                 result = client.write_registers(start_address, values, slave=slave_id)
         elif function_code == 43:
             result = client.read_device_information(DeviceInformation.REGULAR, slave_id)
-        client.close()
         return result
 
     def loop(self):
-        current_time = 0
-        while True:
-            if not self._rows:
-                break
+        """
+        Sends the scheduled messages until none is left.
 
-            row = self._rows.pop(0)
+        Timestamps are relative to the start of the loop, so time spent sending
+        does not delay the rest of the schedule; a master that falls behind sends
+        its late messages at once, and the delay is recorded as lateness.
+        """
+        start = time.monotonic()
+        self._next_export = start if self.metrics_file else math.inf
+        self._next_summary = start + self.summary_interval
+        self._summarized = (start, 0, 0, 0, 0.0, 0)
+        next_tick = min(self._next_export, self._next_summary)
+        sequence = len(self._rows)
+        sent = failed = 0
+        try:
+            while self._rows:
+                timestamp, _, row = heapq.heappop(self._rows)
 
-            timestamp = row["timestamp"]
-            ip = row["ip"]
-            port = row["port"]
-            function_code = row["function_code"]
-            start_address = row["start_address"]
-            slave_id = row["slave_id"]
-            recurrent = row["recurrent"]
+                ip = row["ip"]
+                port = row["port"]
+                function_code = row["function_code"]
+                start_address = row["start_address"]
+                slave_id = row["slave_id"]
+                values = row["values"]
+                count = row["count"]
+                stats = row["stats"]
 
-            count = row["count"]
-            values = row["values"]
+                due = start + timestamp
+                while True:
+                    now = time.monotonic()
+                    if now >= next_tick:
+                        next_tick = self._periodic(now)
+                    if now >= due:
+                        break
+                    time.sleep(min(due, next_tick) - now)
+                self.metrics.lateness.observe(now - due)
 
-            interval = row["interval"]
+                # The first message and then one in log_sample are logged
+                if sent % self.log_sample == 0:
+                    logger.info(
+                        "send target=%s:%s function_code=%s start_address=%s slave_id=%s values=%s count=%s lateness_ms=%.3f",
+                        ip,
+                        port,
+                        function_code,
+                        start_address,
+                        slave_id,
+                        values,
+                        count,
+                        (now - due) * 1000,
+                    )
+                sent += 1
 
-            delay = max(0, timestamp - current_time)
-            time.sleep(delay)
-            current_time = timestamp
+                stats.requests += 1
+                started = time.perf_counter()
+                result = None
+                failure = None
+                try:
+                    result = self._send_message(
+                        self._clients[(ip, port)],
+                        function_code,
+                        start_address,
+                        slave_id,
+                        values,
+                        count,
+                    )
+                except ConnectionException as e:
+                    stats.connection_failures += 1
+                    failure = e
+                except ModbusIOException as e:
+                    stats.timeouts += 1
+                    failure = e
+                except ModbusException as e:
+                    stats.errors += 1
+                    failure = e
+                else:
+                    if isinstance(result, ModbusIOException):
+                        stats.timeouts += 1
+                        failure = result
+                    elif not result:
+                        stats.errors += 1
+                        failure = "no request sent"
+                    else:
+                        stats.duration.observe(time.perf_counter() - started)
+                        if result.isError():
+                            stats.exception_responses += 1
+                if failure is not None:
+                    if failed % self.log_sample == 0:
+                        logger.warning(
+                            "failure target=%s:%s function_code=%s error=%s",
+                            ip,
+                            port,
+                            function_code,
+                            failure,
+                        )
+                    failed += 1
+                self.responses.append(result)
 
-            print(
-                f"Sending msg to {ip}:{port} - {function_code} - {start_address} - {slave_id} - {values} - {count}"
-            )
+                # If the row is recurrent, schedule its next occurrence
+                if row["recurrent"]:
+                    row["timestamp"] = timestamp + row["interval"]
+                    heapq.heappush(self._rows, (row["timestamp"], sequence, row))
+                    sequence += 1
+        finally:
+            if self.metrics_file:
+                self.export_metrics()
+            self.log_summary(time.monotonic())
 
-            self.responses.append(
-                self._send_message(
-                    self._clients[(ip, port)],
-                    function_code,
-                    start_address,
-                    slave_id,
-                    values,
-                    count,
-                )
-            )
+    def _periodic(self, now):
+        # Runs the periodic tasks that are due and returns when the next one is
+        if now >= self._next_export:
+            self.export_metrics()
+            self._next_export = now + self.metrics_interval
+        if now >= self._next_summary:
+            self.log_summary(now)
+            self._next_summary = now + self.summary_interval
+        return min(self._next_export, self._next_summary)
 
-            # If the row is recurrent, update its timestamp and reinsert it
-            if recurrent:
-                row["timestamp"] += interval
-                self._rows.append(row)
+    def log_summary(self, now):
+        """
+        Logs the requests sent since the previous summary and how they went.
+        """
+        requests = failures = exceptions = 0
+        for stats in self.metrics.stats.values():
+            requests += stats.requests
+            exceptions += stats.exception_responses
+            failures += stats.timeouts + stats.connection_failures + stats.errors
+        lateness = self.metrics.lateness
+        # Requests sent more than a millisecond late
+        late = sum(lateness.counts[1:])
+        since, *previous = self._summarized
+        self._summarized = (now, requests, failures, exceptions, lateness.sum, late)
+        sent = requests - previous[0]
+        logger.info(
+            "summary requests=%d rate=%.1f/s failures=%d exception_responses=%d mean_lateness_ms=%.3f late_requests=%d",
+            sent,
+            sent / max(now - since, 1e-9),
+            failures - previous[1],
+            exceptions - previous[2],
+            (lateness.sum - previous[3]) * 1000 / max(sent, 1),
+            late - previous[4],
+        )
 
-            # Sort rows again to maintain order after reinserting recurrent rows
-            self._rows.sort(key=lambda x: x["timestamp"])
+    def export_metrics(self):
+        """
+        Writes the metrics to the metrics file, if any.
+        """
+        if not self.metrics_file:
+            return
+        try:
+            self.metrics.write(self.metrics_file)
+        except OSError as e:
+            logger.error("Error writing metrics to %s: %s", self.metrics_file, e)
 
 
 if __name__ == "__main__":
-    print("Starting ModbusMaster...")
-    client = ModbusMaster("master.csv")
+    listener = setup_logging(
+        os.environ.get("MODBUS_LOG_LEVEL", "INFO").upper(),
+        float(os.environ.get("MODBUS_LOG_FLUSH_INTERVAL", "1")),
+    )
+    logger.info("Starting ModbusMaster...")
+    client = ModbusMaster(
+        "master.csv",
+        source_address=os.environ.get("MODBUS_SOURCE_ADDRESS"),
+        metrics_file=os.environ.get("MODBUS_METRICS_FILE", "metrics.prom") or None,
+        metrics_interval=float(os.environ.get("MODBUS_METRICS_INTERVAL", "10")),
+        log_sample=int(os.environ.get("MODBUS_LOG_SAMPLE", "100")),
+        summary_interval=float(os.environ.get("MODBUS_LOG_SUMMARY_INTERVAL", "10")),
+    )
+    if os.environ.get("MODBUS_METRICS_PORT"):
+        client.metrics.serve(int(os.environ["MODBUS_METRICS_PORT"]))
+    # Stopping the container or process still writes the last metrics
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
     try:
         client.loop()
-    except Exception as e:
-        # print whole modbus error
-        print(f"Error during Modbus message loop: {e}")
+    except Exception:
+        logger.exception("Error during Modbus message loop")
         sys.exit(1)
+    finally:
+        listener.stop()
+        logging.shutdown()
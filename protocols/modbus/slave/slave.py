@@ -23,7 +23,7 @@ class ModbusSlave:
                 return ModbusSequentialDataBlock(1, config["values"])
             elif config["type"] == "sparse":
                 return ModbusSparseDataBlock(
-                    {key + 1: value for key, value in config["values"].items()}
+                    {int(key) + 1: value for key, value in config["values"].items()}
                 )
         else:
             return ModbusSparseDataBlock()
@@ -0,0 +1,271 @@
+"""
+In-process validation of generated Docker Compose configurations.
+
+``validate_compose`` checks a compose dictionary against a schema of the
+subset of the Compose specification emitted by ``DockerComposeGenerator``,
+then runs the cross-reference checks ``docker compose config`` would do
+(networks, dependencies, addresses). Results are cached by a hash of the
+configuration content, so validating an unchanged scenario again is free.
+"""
+
+import hashlib
+import ipaddress
+import json
+import re
+from collections import OrderedDict
+from typing import Any
+
+_DURATION = r"^(\d+(\.\d+)?(ns|us|ms|s|m|h))+$"
+_NAME = r"^[a-zA-Z0-9._-]+$"
+
+_STRING = {"type": "string"}
+_STRING_LIST = {"type": "array", "items": _STRING}
+
+SERVICE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "build": {
+            "type": "object",
+            "properties": {"context": _STRING, "dockerfile": _STRING},
+            "required": ["context"],
+            "additionalProperties": False,
+        },
+        "image": _STRING,
+        "container_name": {"type": "string", "pattern": _NAME},
+        "volumes": {
+            "type": "array",
+            "items": {"type": "string", "pattern": r"^[^:]+:/[^:]*(:(ro|rw))?$"},
+        },
+        "networks": {
+            "type": "object",
+            "additionalProperties": {
+                "type": "object",
+                "properties": {
+                    "ipv4_address": _STRING,
+                    "mac_address": {
+                        "type": "string",
+                        "pattern": r"^([0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}$",
+                    },
+                },
+                "additionalProperties": False,
+            },
+        },
+        "environment": _STRING_LIST,
+        "expose": {"type": "array", "items": {"type": ["string", "integer"]}},
+        "healthcheck": {
+            "type": "object",
+            "properties": {
+                "test": _STRING_LIST,
+                "interval": {"type": "string", "pattern": _DURATION},
+                "timeout": {"type": "string", "pattern": _DURATION},
+                "start_period": {"type": "string", "pattern": _DURATION},
+                "retries": {"type": "integer"},
+            },
+            "required": ["test"],
+            "additionalProperties": False,
+        },
+        "depends_on": {
+            "type": "object",
+            "additionalProperties": {
+                "type": "object",
+                "properties": {
+                    "condition": {
+                        "type": "string",
+                        "enum": [
+                            "service_started",
+                            "service_healthy",
+                            "service_completed_successfully",
+                        ],
+                    }
+                },
+                "required": ["condition"],
+                "additionalProperties": False,
+            },
+        },
+        "pull_policy": {
+            "type": "string",
+            "enum": ["always", "never", "missing", "build"],
+        },
+    },
+    "additionalProperties": False,
+}
+
+COMPOSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "services": {
+            "type": "object",
+            "propertyNames": _NAME,
+            "additionalProperties": SERVICE_SCHEMA,
+        },
+        "networks": {
+            "type": "object",
+            "propertyNames": _NAME,
+            "additionalProperties": {
+                "type": "object",
+                "properties": {
+                    "name": _STRING,
+                    "ipam": {
+                        "type": "object",
+                        "properties": {
+                            "config": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {"subnet": _STRING},
+                                    "required": ["subnet"],
+                                },
+                            }
+                        },
+                    },
+                },
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["services"],
+    "additionalProperties": False,
+}
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+}
+
+_CACHE_SIZE = 64
+_cache = OrderedDict()
+
+
+def content_hash(config: dict[str, Any]) -> str:
+    """
+    Returns a stable hash of a configuration dictionary.
+
+    Args:
+        config (dict): Configuration to hash.
+
+    Returns:
+        str: Hex SHA-256 digest of the canonical JSON form of the configuration.
+    """
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def validate_compose(config: dict[str, Any]) -> list[str]:
+    """
+    Validates a Docker Compose configuration in-process.
+
+    Args:
+        config (dict): Compose configuration, as it would be written to the file.
+
+    Returns:
+        list[str]: Validation errors; empty if the configuration is valid.
+    """
+    key = content_hash(config)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return list(_cache[key])
+
+    errors = []
+    _check_schema(config, COMPOSE_SCHEMA, "", errors)
+    if not errors:
+        _check_references(config, errors)
+
+    _cache[key] = tuple(errors)
+    if len(_cache) > _CACHE_SIZE:
+        _cache.popitem(last=False)
+    return errors
+
+
+def _check_schema(value: Any, schema: dict[str, Any], path: str, errors: list[str]):
+    types = schema.get("type")
+    if types:
+        types = types if isinstance(types, list) else [types]
+        if not any(
+            isinstance(value, _TYPES[t]) and not isinstance(value, bool) for t in types
+        ):
+            errors.append(f"{path or '/'}: expected {' or '.join(types)}")
+            return
+
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: must be one of {schema['enum']}")
+    if "pattern" in schema and not re.match(schema["pattern"], value):
+        errors.append(f"{path}: invalid value '{value}'")
+
+    if isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}/{name}: required property missing")
+        properties = schema.get("properties", {})
+        additional = schema.get("additionalProperties", True)
+        name_pattern = schema.get("propertyNames")
+        for name, item in value.items():
+            if name_pattern and not re.match(name_pattern, str(name)):
+                errors.append(f"{path}/{name}: invalid name")
+            if name in properties:
+                _check_schema(item, properties[name], f"{path}/{name}", errors)
+            elif additional is False:
+                errors.append(f"{path}/{name}: unknown property")
+            elif isinstance(additional, dict):
+                _check_schema(item, additional, f"{path}/{name}", errors)
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            _check_schema(item, schema["items"], f"{path}/{i}", errors)
+
+
+def _check_references(config: dict[str, Any], errors: list[str]):
+    networks = config.get("networks", {})
+    subnets = {}
+    for name, network in networks.items():
+        for ipam in network.get("ipam", {}).get("config", []):
+            try:
+                subnets.setdefault(name, []).append(
+                    ipaddress.ip_network(ipam["subnet"])
+                )
+            except ValueError:
+                errors.append(f"/networks/{name}: invalid subnet '{ipam['subnet']}'")
+
+    services = config["services"]
+    used_addresses = {}
+    container_names = {}
+    for name, service in services.items():
+        path = f"/services/{name}"
+        if "build" not in service and "image" not in service:
+            errors.append(f"{path}: has neither build nor image")
+
+        container_name = service.get("container_name")
+        if container_name:
+            if container_name in container_names:
+                errors.append(
+                    f"{path}: container_name '{container_name}' already used by {container_names[container_name]}"
+                )
+            container_names[container_name] = name
+
+        for dependency in service.get("depends_on", {}):
+            if dependency not in services:
+                errors.append(f"{path}: depends on undefined service '{dependency}'")
+            elif dependency == name:
+                errors.append(f"{path}: depends on itself")
+
+        for network, options in service.get("networks", {}).items():
+            if network not in networks:
+                errors.append(f"{path}: uses undefined network '{network}'")
+                continue
+            address = (options or {}).get("ipv4_address")
+            if address is None:
+                continue
+            try:
+                ip = ipaddress.ip_address(address)
+            except ValueError:
+                errors.append(f"{path}: invalid ipv4_address '{address}'")
+                continue
+            if subnets.get(network) and not any(ip in s for s in subnets[network]):
+                errors.append(
+                    f"{path}: ipv4_address {ip} is out of the range of network '{network}'"
+                )
+            if (network, ip) in used_addresses:
+                errors.append(
+                    f"{path}: ipv4_address {ip} already used by {used_addresses[(network, ip)]}"
+                )
+            used_addresses[(network, ip)] = name
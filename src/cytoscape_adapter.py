@@ -1,8 +1,11 @@
-import yaml
 from enum import Enum
 from typing import Any
+import copy
 import ipaddress
 import re
+import threading
+
+from .yaml_io import yaml_dumper
 
 
 class LEVEL(Enum):
@@ -14,94 +17,366 @@ class PROTOCOL(Enum):
     MODBUS = "modbus"
 
 
-def validate_cytoscape_scenario(data: dict[str, Any], level: LEVEL) -> list[str]:
-    logs = []
-    # Check if all ids are different
-    if level.value >= LEVEL.ERROR.value:
-        node_ids = [node["data"]["id"] for node in data["nodes"]]
-        if len(node_ids) != len(set(node_ids)):
-            # Find duplicated node IDs
-            from collections import Counter
-
-            duplicates = [
-                item for item, count in Counter(node_ids).items() if count > 1
-            ]
-
-            # Print duplicated node IDs
-            logs.append(
-                f"[ERROR] All node IDs are not unique. Duplicates: {duplicates}"
-            )
+REGISTER_KEYS = ["holding_registers", "coils", "discrete_inputs", "input_registers"]
+EDGE_VALUE_KEYS = ["timestamp", "function_code", "start_address", "input_registers"]
+
+
+class ScenarioValidator:
+    """
+    Validates successive versions of a scenario, re-checking only what changed.
+
+    The results of every node and edge check are cached by element id along with
+    the content they were computed from, and reused as long as the element and
+    the context of the check (IP network, roles of the edge ends) are equal.
+
+    Attributes:
+        accepted (dict, optional): A version of the scenario known to pass
+            ERROR-level validation, such as the stored config.json. Its
+            elements are taken as free of errors without being re-checked.
+    """
 
-        # Check if the edges are made from nodes with different roles
+    def __init__(self, accepted: dict[str, Any] = None):
+        self._nodes = {}
+        self._edges = {}
+        self._lock = threading.Lock()
+        if accepted:
+            self._seed(accepted)
+
+    def _seed(self, data: dict[str, Any]):
+        ip_network = data["ip_network"]
         node_roles = {
             node["data"]["id"]: node["data"]["role"] for node in data["nodes"]
         }
+        for node in data["nodes"]:
+            self._nodes[node["data"]["id"]] = (
+                node["data"],
+                ip_network,
+                LEVEL.ERROR,
+                ([], []),
+            )
         for edge in data["edges"]:
-            source_role = node_roles[edge["data"]["source"]]
-            target_role = node_roles[edge["data"]["target"]]
-            if source_role == target_role:
-                logs.append(
-                    f"[ERROR] Edge {edge['data']['id']} connects nodes with the same role ({source_role})"
-                )
-
-        # Check if there are ips out of range
-        ip_network = ipaddress.ip_network(data["ip_network"])
+            ends = (
+                node_roles.get(edge["data"]["source"]),
+                node_roles.get(edge["data"]["target"]),
+            )
+            self._edges[edge["data"]["id"]] = (
+                edge["data"],
+                ends,
+                LEVEL.ERROR,
+                ([], []),
+            )
+
+    def validate(
+        self,
+        data: dict[str, Any],
+        level: LEVEL,
+        affected: set[tuple[str, str]] = None,
+    ) -> list[str]:
+        """
+        Validates a scenario.
+
+        Args:
+            data (dict): Cytoscape scenario.
+            level (LEVEL): Most verbose level of the messages to report.
+            affected (set[tuple[str, str]], optional): ("node" or "edge", id) of the
+                elements to report on. If given, only the messages of these elements,
+                of the elements whose content or context changed since the last
+                validation and of the scenario as a whole are returned.
+
+        Returns:
+            list[str]: Error messages, followed by warning messages.
+        """
+        with self._lock:
+            return self._validate(data, level, affected)
+
+    def error_free(self) -> bool:
+        """
+        Tells whether no element of the last validated version has errors, reported or not.
+        """
+        with self._lock:
+            return not any(
+                cached[3][0]
+                for elements in (self._nodes, self._edges)
+                for cached in elements.values()
+            )
+
+    def _validate(
+        self,
+        data: dict[str, Any],
+        level: LEVEL,
+        affected: set[tuple[str, str]] = None,
+    ) -> list[str]:
+        logs = []
+        ip_network = data["ip_network"]
+        network = None
+
+        node_roles = {}
+        duplicates = {}
         for node in data["nodes"]:
-            ip = ipaddress.ip_address(node["data"]["ip"])
-            if ip not in ip_network:
-                logs.append(
-                    f"[ERROR] IP {ip} of node {node['data']['id']} is out of range"
-                )
+            node_id = node["data"]["id"]
+            if node_id in node_roles:
+                duplicates[node_id] = None
+            node_roles[node_id] = node["data"]["role"]
+        if duplicates:
+            duplicates = [node_id for node_id in node_roles if node_id in duplicates]
+            logs.append(
+                f"[ERROR] All node IDs are not unique. Duplicates: {duplicates}"
+            )
 
-    if level.value >= LEVEL.WARNING.value:
-        # Check if there is no slave without any defined register
+        node_results = []
+        rechecked = set()
         for node in data["nodes"]:
-            if node["data"]["role"] == "slave":
-                if not any(
-                    node["data"][key]["values"]
-                    for key in [
-                        "holding_registers",
-                        "coils",
-                        "discrete_inputs",
-                        "input_registers",
-                    ]
-                ):
-                    logs.append(
-                        f"[WARNING] Slave node {node['data']['id']} has no defined registers"
-                    )
-        # Check if there is no edge with an empty "messages" field and start_address >= 0
-        for edge in data["edges"]:
+            node_data = node["data"]
+            cached = self._nodes.get(node_data["id"])
             if (
-                not all(
-                    edge["data"][key]
-                    for key in [
-                        "timestamp",
-                        "function_code",
-                        "start_address",
-                        "input_registers",
-                    ]
-                )
-                and not edge["data"]["start_address"] >= 0
+                cached
+                and cached[2].value >= level.value
+                and cached[1] == ip_network
+                and cached[0] == node_data
             ):
-                logs.append(
-                    f"[WARNING] Communication {edge['data']['source']} → {edge['data']['target']} has empty values."
-                )
+                if affected is None or ("node", node_data["id"]) in affected:
+                    node_results.append(cached[3])
+                continue
+            if network is None:
+                network = ipaddress.ip_network(ip_network)
+            result = _check_node(node_data, network, level)
+            self._nodes[node_data["id"]] = (node_data, ip_network, level, result)
+            changed = not (
+                cached and cached[1] == ip_network and cached[0] == node_data
+            )
+            if affected is None or changed or ("node", node_data["id"]) in affected:
+                node_results.append(result)
+                rechecked.add(node_data["id"])
 
-        # Extract source and target IDs from the links
+        edge_results = []
+        edge_ids = set()
         linked_node_ids = set()
         for edge in data["edges"]:
-            linked_node_ids.add(edge["data"]["source"])
-            linked_node_ids.add(edge["data"]["target"])
+            edge_data = edge["data"]
+            edge_ids.add(edge_data["id"])
+            linked_node_ids.add(edge_data["source"])
+            linked_node_ids.add(edge_data["target"])
+            ends = (
+                node_roles.get(edge_data["source"]),
+                node_roles.get(edge_data["target"]),
+            )
+            cached = self._edges.get(edge_data["id"])
+            if (
+                cached
+                and cached[2].value >= level.value
+                and cached[1] == ends
+                and cached[0] == edge_data
+            ):
+                if affected is None or ("edge", edge_data["id"]) in affected:
+                    edge_results.append(cached[3])
+                continue
+            result = _check_edge(edge_data, ends, level)
+            self._edges[edge_data["id"]] = (edge_data, ends, level, result)
+            changed = not (cached and cached[1] == ends and cached[0] == edge_data)
+            if affected is None or changed or ("edge", edge_data["id"]) in affected:
+                edge_results.append(result)
+
+        # Drop the results of elements that were deleted
+        if len(self._nodes) > len(node_roles):
+            for node_id in set(self._nodes) - node_roles.keys():
+                del self._nodes[node_id]
+        if len(self._edges) > len(edge_ids):
+            for edge_id in set(self._edges) - edge_ids:
+                del self._edges[edge_id]
+
+        for errors, _ in edge_results:
+            logs.extend(errors)
+        for errors, _ in node_results:
+            logs.extend(errors)
+
+        if level.value >= LEVEL.WARNING.value:
+            for _, warnings in node_results:
+                logs.extend(warnings)
+            for _, warnings in edge_results:
+                logs.extend(warnings)
+            for node_id in node_roles:
+                if node_id not in linked_node_ids and (
+                    affected is None
+                    or node_id in rechecked
+                    or ("node", node_id) in affected
+                ):
+                    logs.append(f"[WARNING] Node without link: {node_id}")
+        return logs
+
+
+def _check_node(
+    node_data: dict[str, Any], network: ipaddress.IPv4Network, level: LEVEL
+) -> tuple[list[str], list[str]]:
+    errors, warnings = [], []
+    try:
+        ip = ipaddress.ip_address(node_data["ip"])
+        if ip not in network:
+            errors.append(f"[ERROR] IP {ip} of node {node_data['id']} is out of range")
+    except ValueError:
+        errors.append(f"[ERROR] Invalid IP {node_data['ip']} of node {node_data['id']}")
+
+    if level.value >= LEVEL.WARNING.value and node_data["role"] == "slave":
+        if not any(node_data[key]["values"] for key in REGISTER_KEYS):
+            warnings.append(
+                f"[WARNING] Slave node {node_data['id']} has no defined registers"
+            )
+    return errors, warnings
 
-        # Find nodes without links
-        nodes_without_links = [
-            node_id for node_id in node_ids if node_id not in linked_node_ids
-        ]
 
-        # Print nodes without links if any are found
-        for node in nodes_without_links:
-            logs.append(f"[WARNING] Node without link: {node}")
-    return logs
+def _check_edge(
+    edge_data: dict[str, Any], ends: tuple[str, str], level: LEVEL
+) -> tuple[list[str], list[str]]:
+    errors, warnings = [], []
+    source_role, target_role = ends
+    if source_role is None or target_role is None:
+        errors.append(f"[ERROR] Edge {edge_data['id']} connects an unknown node")
+    elif source_role == target_role:
+        errors.append(
+            f"[ERROR] Edge {edge_data['id']} connects nodes with the same role ({source_role})"
+        )
+
+    if level.value >= LEVEL.WARNING.value:
+        start_address = edge_data.get("start_address")
+        if not all(edge_data.get(key) for key in EDGE_VALUE_KEYS) and not (
+            isinstance(start_address, (int, float)) and start_address >= 0
+        ):
+            warnings.append(
+                f"[WARNING] Communication {edge_data['source']} → {edge_data['target']} has empty values."
+            )
+    return errors, warnings
+
+
+def validate_cytoscape_scenario(data: dict[str, Any], level: LEVEL) -> list[str]:
+    return ScenarioValidator().validate(data, level)
+
+
+PATCH_OPERATIONS = ("add", "replace", "remove")
+
+
+def apply_patch(
+    data: dict[str, Any], operations: list[dict[str, Any]]
+) -> set[tuple[str, str]]:
+    """
+    Applies JSON-patch-style operations to a Cytoscape scenario, in place.
+
+    Elements are addressed by id rather than by position: paths are
+    ``/nodes/<id>`` or ``/edges/<id>``, optionally followed by a JSON pointer
+    into the element (e.g. ``/nodes/slave_0/data/ip``), or a top-level field
+    such as ``/ip_network``. Patched elements are copied, never modified in place.
+
+    Args:
+        data (dict): Cytoscape scenario.
+        operations (list[dict]): Operations with "op" (add, replace or remove), "path" and "value".
+
+    Returns:
+        set[tuple[str, str]]: ("node" or "edge", id) of the added, changed and removed elements.
+
+    Raises:
+        ValueError: If an operation is malformed or targets a missing element; no
+            operation is applied in that case.
+    """
+    lists = {"nodes": list(data["nodes"]), "edges": list(data["edges"])}
+    positions = {
+        key: {element["data"]["id"]: i for i, element in enumerate(elements)}
+        for key, elements in lists.items()
+    }
+    fields = {}
+    affected = set()
+
+    for number, operation in enumerate(operations):
+        op, path = operation.get("op"), operation.get("path")
+        if op not in PATCH_OPERATIONS or not isinstance(path, str):
+            raise ValueError(f"Operation {number}: invalid op or path")
+        if op != "remove" and "value" not in operation:
+            raise ValueError(f"Operation {number}: missing value")
+        tokens = [
+            token.replace("~1", "/").replace("~0", "~") for token in path.split("/")[1:]
+        ]
+        if not tokens or not tokens[0]:
+            raise ValueError(f"Operation {number}: invalid path {path}")
+
+        key = tokens[0]
+        if key not in lists:
+            if len(tokens) != 1 or op == "remove":
+                raise ValueError(f"Operation {number}: cannot {op} {path}")
+            fields[key] = operation["value"]
+            continue
+        if len(tokens) < 2:
+            raise ValueError(f"Operation {number}: path {path} needs an element id")
+
+        element_id = tokens[1]
+        kind = key[:-1]
+        index = positions[key].get(element_id)
+        affected.add((kind, element_id))
+
+        if len(tokens) == 2:
+            if op == "add" and index is not None:
+                raise ValueError(f"Operation {number}: {kind} {element_id} exists")
+            if op != "add" and index is None:
+                raise ValueError(f"Operation {number}: no {kind} {element_id}")
+            if op == "remove":
+                lists[key][index] = None
+                del positions[key][element_id]
+                continue
+            element = operation["value"]
+            if not isinstance(element, dict) or not isinstance(
+                element.get("data"), dict
+            ):
+                raise ValueError(f"Operation {number}: {kind} needs a data object")
+            if element["data"].get("id") != element_id:
+                element = {**element, "data": {**element["data"], "id": element_id}}
+            if index is None:
+                positions[key][element_id] = len(lists[key])
+                lists[key].append(element)
+            else:
+                lists[key][index] = element
+            continue
+
+        if index is None:
+            raise ValueError(f"Operation {number}: no {kind} {element_id}")
+        if tokens[2:4] == ["data", "id"]:
+            raise ValueError(f"Operation {number}: ids cannot be patched")
+        element = copy.deepcopy(lists[key][index])
+        _apply_pointer(element, tokens[2:], op, operation.get("value"), number)
+        lists[key][index] = element
+
+    for key, elements in lists.items():
+        data[key] = [element for element in elements if element is not None]
+    data.update(fields)
+    return affected
+
+
+def _apply_pointer(document: Any, tokens: list[str], op: str, value: Any, number: int):
+    parent = document
+    for token in tokens[:-1]:
+        try:
+            parent = parent[int(token) if isinstance(parent, list) else token]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise ValueError(f"Operation {number}: path not found")
+
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        if op != "add" and last not in parent:
+            raise ValueError(f"Operation {number}: path not found")
+        if op == "remove":
+            del parent[last]
+        else:
+            parent[last] = value
+    elif isinstance(parent, list):
+        try:
+            index = len(parent) if last == "-" and op == "add" else int(last)
+        except ValueError:
+            raise ValueError(f"Operation {number}: invalid index {last}")
+        if not 0 <= index <= len(parent) - (op != "add"):
+            raise ValueError(f"Operation {number}: index {last} out of range")
+        if op == "add":
+            parent.insert(index, value)
+        elif op == "remove":
+            del parent[index]
+        else:
+            parent[index] = value
+    else:
+        raise ValueError(f"Operation {number}: path not found")
 
 
 def clean_dict_values(input_dict):
@@ -120,64 +395,126 @@ def clean_dict_values(input_dict):
     return cleaned_dict
 
 
-def parse_cytoscape_json(data: dict[str, Any]) -> str:
-    yaml_data = {"nodes": []}
+def cytoscape_to_scenario(data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Converts a Cytoscape graph into a scenario, leaving the graph untouched.
+
+    Nodes are indexed by id once, so the conversion is linear in the number of
+    nodes and messages.
+    """
+    scenario = {"nodes": []}
 
-    yaml_data["protocol"] = data["protocol"]
-    yaml_data["ip_network"] = data["ip_network"]
+    scenario["protocol"] = data["protocol"]
+    scenario["ip_network"] = data["ip_network"]
+
+    nodes_by_id = {node["data"]["id"]: node["data"] for node in data["nodes"]}
 
     # Create a dictionary to store messages for master nodes
     messages_dict = {
-        node["data"]["id"]: []
-        for node in data["nodes"]
-        if node["data"]["role"] == "master"
+        node_id: []
+        for node_id, node_data in nodes_by_id.items()
+        if node_data["role"] == "master"
     }
 
     # Parse edges to generate messages for master nodes
     for edge in data["edges"]:
+        target_node_data = nodes_by_id[edge["data"]["target"]]
+        messages = messages_dict[edge["data"]["source"]]
         for message in edge["data"]["messages"]:
-            target_node_data = find_first_matching_node(
-                data["nodes"], edge["data"]["target"]
-            )["data"]
-            message = {
-                # "recurrent": edge["data"]["recurrent"],
-                "timestamp": message["timestamp"],
-                "recurrent": message["recurrent"],
-                "interval": message["interval"],
-                "ip": target_node_data["ip"],  # Assuming default IP, modify as needed
-                "port": target_node_data[
-                    "port"
-                ],  # Assuming default port, modify as needed
-                "slave_id": target_node_data["slave_id"],
-                "function_code": message["function_code"],
-                "start_address": message["start_address"],
-                "count": message.get("count", 0),
-                "values": message.get("values", []),
-            }
-            messages_dict[edge["data"]["source"]].append(message)
+            messages.append(scenario_message(message, target_node_data))
 
-    # Add nodes to yaml_data
+    # Add nodes to the scenario
     for node in data["nodes"]:
-        node_data = node["data"]
-        if node_data["role"] == "master":
-            node_data["messages"] = messages_dict[node_data["id"]]
-
-        # Clean data
-
-        if node_data["role"] == "master":
-            for message in node_data["messages"]:
-                message["port"] = int(message["port"])
-                message["slave_id"] = int(message["slave_id"])
-        if node_data["role"] == "slave":
-            node_data["port"] = int(node_data["port"])
-            node_data["slave_id"] = int(node_data["slave_id"])
-            node_data["identity"] = clean_dict_values(node_data["identity"])
-
-        yaml_data["nodes"].append(node_data)
-
-    # Convert to YAML
-    yaml_output = yaml.dump(yaml_data, default_flow_style=False)
-    return yaml_output
+        scenario["nodes"].append(
+            scenario_node(node["data"], messages_dict.get(node["data"]["id"]))
+        )
+
+    return scenario
+
+
+def scenario_message(
+    message: dict[str, Any], target_data: dict[str, Any]
+) -> dict[str, Any]:
+    """
+    Converts a message of an edge into a message of its master, addressed to the target slave.
+    """
+    return {
+        "timestamp": message["timestamp"],
+        "recurrent": message["recurrent"],
+        "interval": message["interval"],
+        "ip": target_data["ip"],
+        "port": int(target_data["port"]),
+        "slave_id": int(target_data["slave_id"]),
+        "function_code": message["function_code"],
+        "start_address": message["start_address"],
+        "count": message.get("count", 0),
+        "values": message.get("values", []),
+    }
+
+
+def scenario_node(
+    node_data: dict[str, Any], messages: list[dict[str, Any]] = None
+) -> dict[str, Any]:
+    """
+    Converts the data of a Cytoscape node into a scenario node.
+
+    Args:
+        node_data (dict): Data of the node.
+        messages (list[dict], optional): Messages sent by the node, if it is a master.
+    """
+    node_data = dict(node_data)
+    if node_data["role"] == "master":
+        node_data["messages"] = messages
+    if node_data["role"] == "slave":
+        node_data["port"] = int(node_data["port"])
+        node_data["slave_id"] = int(node_data["slave_id"])
+        node_data["identity"] = clean_dict_values(node_data["identity"])
+    return node_data
+
+
+def cytoscape_node(
+    role: str,
+    index: int,
+    ip: str,
+    position: dict[str, float],
+    slave_data: dict[str, Any] = None,
+    registers: dict[str, Any] = None,
+) -> dict[str, Any]:
+    """
+    Builds a Cytoscape node named after its role and index, as generated scenarios name them.
+
+    Args:
+        role (str): master or slave.
+        index (int): Index of the node among the nodes of its role.
+        ip (str): IP of the node.
+        position (dict): Position of the node in the layout.
+        slave_data (dict, optional): Port and slave_id of a Modbus slave, which gets
+            the fields of one with an empty identity.
+        registers (dict, optional): Register blocks of the slave, by register table.
+    """
+    data = {"id": f"{role}_{index}", "role": role, "name": f"{role}_{index}", "ip": ip}
+    if slave_data is not None:
+        data.update(slave_data)
+        data["comment"] = ""
+        data.update(registers)
+        data["identity"] = {
+            "major_minor_revision": "",
+            "model_name": "",
+            "product_code": "",
+            "product_name": "",
+            "user_application_name": "",
+            "vendor_name": "",
+            "vendor_url": "",
+        }
+    return {"data": data, "position": position, "classes": role}
+
+
+def parse_cytoscape_json(data: dict[str, Any]) -> str:
+    import yaml
+
+    return yaml.dump(
+        cytoscape_to_scenario(data), Dumper=yaml_dumper(), default_flow_style=False
+    )
 
 
 def find_first_matching_node(
@@ -1,7 +1,19 @@
+import hashlib
+import json
 import subprocess
-import yaml
 import ipaddress
 import os
+import shutil
+
+from .compose_schema import content_hash, validate_compose
+from .ip_allocator import IPAllocator
+from .modbus_codec import WRITE_FUNCTION_CODES
+from .profiling import phase
+from .scenario_config_generator import node_environment
+from .yaml_io import yaml_dumper, yaml_loader
+
+# Results of `docker compose config`, keyed by the hash of the validated file
+_cli_validation_cache = {}
 
 
 class DockerComposeGenerator:
@@ -13,9 +25,13 @@ class DockerComposeGenerator:
         networks (dict): Stores the networks configuration.
         protocol (str): Protocol name used in the Docker Compose configuration.
         ip_base (ipaddress.IPv4Address): Base IP address for the network.
+        network_name (str): Name of the network services are attached to.
+        ip_allocator (IPAllocator): Index of the addresses used in the network.
         path (str): Path to the Docker Compose file.
         config_path (str): Path to the configuration files.
-        last_ip (ipaddress.IPv4Address): Last assigned IP address for dynamic allocation.
+        validation_errors (list[str]): Errors found by the last validation.
+        changed_services (set[str]): Services added or modified by the last generation.
+        removed_services (set[str]): Services dropped by the last generation.
     """
 
     def __init__(self, protocol: str, file_path: str, config_path: str):
@@ -31,9 +47,14 @@ class DockerComposeGenerator:
         self.networks = {}
         self.protocol = protocol
         self.ip_base = None
+        self.network_name = None
+        self.ip_allocator = None
         self.path = file_path
         self.config_path = config_path
-        self.last_ip = None
+        self.validation_errors = []
+        self.changed_services = set()
+        self.removed_services = set()
+        self._image_builders = {}
 
     def add_network(self, name: str, range: str):
         """
@@ -45,7 +66,9 @@ class DockerComposeGenerator:
         """
         self.networks[name] = {"name": name, "ipam": {"config": [{"subnet": range}]}}
         self.ip_base = ipaddress.ip_network(range).network_address
-        self.last_ip = self.ip_base + 1
+        if self.network_name is None:
+            self.network_name = name
+            self.ip_allocator = IPAllocator(range)
 
     def add_node(
         self,
@@ -64,26 +87,41 @@ class DockerComposeGenerator:
             ip (str, optional): IP address of the node. Defaults to None for dynamic allocation.
             mac (str, optional): MAC address of the node. Defaults to None.
             dependencies (dict, optional): Dependencies of the node. Defaults to None.
+
+        Raises:
+            IPAllocationError: If the IP is out of range or already used by another node.
         """
+        name = self.service_name(role, index)
         if not ip:
-            self.last_ip += 1
-            ip = self.last_ip
+            ip = self.ip_allocator.allocate(name)
         else:
-            ip = ipaddress.ip_address(ip)
+            self.ip_allocator.reserve(ip, name)
 
+        image = f"{self.protocol}_{role}_image"
         node = {
-            "build": {
-                "context": f"./protocols/{self.protocol}/{role}",
-                "dockerfile": f"Dockerfile.{role}",
-            },
-            "image": f"{self.protocol}_{role}_image",
+            "image": image,
             "container_name": f"{self.protocol}_{role}_container_{index}",
             "volumes": [
                 f'{self.config_path}/{role}s/{index}/{role}.{"yaml" if role=="slave" else "csv"}:/app/{role}.{"yaml" if role=="slave" else "csv"}:ro'
             ],
-            "networks": {list(self.networks.keys())[0]: {"ipv4_address": str(ip)}},
-            "environment": ["PYTHONUNBUFFERED=1"],
+            "networks": {self.network_name: {"ipv4_address": str(ip)}},
         }
+        environment = node_environment(role)
+        if environment:
+            node["environment"] = [
+                f"{key}={value}" for key, value in environment.items()
+            ]
+
+        # Only the first service of each role builds the image; the rest reuse
+        # it, so build time does not grow with the number of nodes
+        builder = self._image_builders.setdefault(image, name)
+        if builder == name:
+            node["build"] = {
+                "context": f"./protocols/{self.protocol}/{role}",
+                "dockerfile": f"Dockerfile.{role}",
+            }
+        else:
+            node["pull_policy"] = "never"
 
         if role == "slave":
             node["expose"] = ["502"]
@@ -106,50 +144,164 @@ class DockerComposeGenerator:
                     }
 
         if mac:
-            node["networks"][list(self.networks.keys())[0]]["mac_address"] = mac
+            node["networks"][self.network_name]["mac_address"] = mac
+
+        self.services[name] = node
+
+    def service_name(self, role: str, index: int) -> str:
+        """
+        Returns the name of the service of a node.
+
+        Args:
+            role (str): Role of the node (e.g., 'master', 'slave').
+            index (int): Index of the node.
+
+        Returns:
+            str: Name of the service in the Docker Compose configuration.
+        """
+        return f"{self.protocol}_{role}_{index}"
+
+    def compose(self) -> dict:
+        """
+        Returns the Docker Compose configuration as a dictionary.
 
-        self.services[f"{self.protocol}_{role}_{index}"] = node
+        Returns:
+            dict: Services and networks, as they are written to the file.
+        """
+        return {
+            "services": self.services,
+            "networks": self.networks,
+        }
 
     def generate(self):
         """
         Generates the Docker Compose YAML file.
+
+        The service blocks of the previous file are reused for the services
+        whose configuration did not change, so only changed blocks are rendered.
         """
+        import yaml
+
+        hashes = {
+            name: content_hash(service) for name, service in self.services.items()
+        }
+        previous_hashes, previous_blocks = self._load_previous()
+
+        self.changed_services = {
+            name
+            for name, digest in hashes.items()
+            if previous_hashes.get(name) != digest or name not in previous_blocks
+        }
+        self.removed_services = set(previous_hashes) - set(hashes)
+
+        blocks = []
+        for name in sorted(self.services):
+            if name in self.changed_services:
+                blocks.append(_render_service(name, self.services[name]))
+            else:
+                blocks.append(previous_blocks[name])
+
         with open(self.path, "w") as file:
-            yaml.dump(
-                {
-                    "services": self.services,
-                    "networks": self.networks,
-                },
-                file,
-            )
+            yaml.dump({"networks": self.networks}, file, Dumper=yaml_dumper())
+            file.write("services:\n" if blocks else "services: {}\n")
+            file.writelines(blocks)
+        with open(self._hashes_path(), "w") as file:
+            json.dump(hashes, file)
 
-    def validate(self) -> bool:
+    def install(self, source_path: str) -> set[str]:
         """
-        Validates the generated Docker Compose file.
+        Installs a previously generated Docker Compose file, such as the one of a compiled scenario.
+
+        The file and its service hashes are copied over the current ones, and the
+        changed and removed services are computed as in generate.
+
+        Args:
+            source_path (str): Path to the Docker Compose file to install.
 
         Returns:
-            bool: True if the Docker Compose file is valid, False otherwise.
+            set[str]: Names of the services of the installed file.
+        """
+        source = DockerComposeGenerator(self.protocol, source_path, self.config_path)
+        with open(source._hashes_path(), "r") as file:
+            hashes = json.load(file)
+        previous_hashes, previous_blocks = self._load_previous()
+
+        self.changed_services = {
+            name
+            for name, digest in hashes.items()
+            if previous_hashes.get(name) != digest or name not in previous_blocks
+        }
+        self.removed_services = set(previous_hashes) - set(hashes)
+
+        for source_file, target_file in [
+            (source_path, self.path),
+            (source._hashes_path(), self._hashes_path()),
+        ]:
+            shutil.copyfile(source_file, f"{target_file}.tmp")
+            os.replace(f"{target_file}.tmp", target_file)
+        return set(hashes)
+
+    def _hashes_path(self) -> str:
+        folder, name = os.path.split(self.path)
+        return os.path.join(folder, f".{name}.hashes.json")
+
+    def _load_previous(self) -> tuple[dict[str, str], dict[str, str]]:
+        try:
+            with open(self._hashes_path(), "r") as file:
+                hashes = json.load(file)
+            with open(self.path, "r") as file:
+                blocks = _split_service_blocks(file.read())
+        except (OSError, ValueError):
+            return {}, {}
+        if set(hashes) != set(blocks):
+            # The file was edited by hand or is not ours: render everything
+            return {}, {}
+        return hashes, blocks
+
+    def validate(self, cli: bool = False) -> bool:
+        """
+        Validates the Docker Compose configuration in-process.
+
+        Args:
+            cli (bool): Also validate the file with the Docker Compose CLI (slow).
+
+        Returns:
+            bool: True if the Docker Compose configuration is valid, False otherwise.
         """
+        with phase("validate_compose"):
+            self.validation_errors = validate_compose(self.compose())
+        if self.validation_errors or not cli:
+            return not self.validation_errors
+
         exists = os.path.exists(self.path)
         if not exists:
             self.generate()
         res = self._validate_file(self.path)
         if not exists:
             os.remove(self.path)
+            os.remove(self._hashes_path())
+        if not res:
+            self.validation_errors = ["docker compose config rejected the file"]
         return res
 
     @staticmethod
-    def validate_file(file_path: str) -> bool:
+    def validate_file(file_path: str, cli: bool = False) -> bool:
         """
         Static method to validate a given Docker Compose file.
 
         Args:
             file_path (str): Path to the Docker Compose file.
+            cli (bool): Validate with the Docker Compose CLI instead of in-process.
 
         Returns:
             bool: True if the Docker Compose file is valid, False otherwise.
         """
-        return DockerComposeGenerator._validate_file(file_path)
+        if cli:
+            return DockerComposeGenerator._validate_file(file_path)
+        import yaml
+
+        with open(file_path, "r") as file:
+            return not validate_compose(yaml.load(file, Loader=yaml_loader()))
 
     @staticmethod
     def _validate_file(file_path: str) -> bool:
@@ -162,48 +314,122 @@ class DockerComposeGenerator:
         Returns:
             bool: True if the Docker Compose file is valid, False otherwise.
         """
-        result = subprocess.run(
-            ["docker", "compose", "-f", file_path, "config"],
-            capture_output=True,
-            text=True,
-        )
-        return result.returncode == 0
+        with open(file_path, "rb") as file:
+            key = hashlib.sha256(file.read()).hexdigest()
+        if key in _cli_validation_cache:
+            return _cli_validation_cache[key]
+        with phase("validate_compose_cli", python=False):
+            result = subprocess.run(
+                ["docker", "compose", "-f", file_path, "config"],
+                capture_output=True,
+                text=True,
+            )
+        _cli_validation_cache[key] = result.returncode == 0
+        return _cli_validation_cache[key]
 
     def parse(
         self,
         scenario,
         docker_compose_path="docker-compose.yml",
         scenario_config_path="/tmp/ICSCommEmulator",
+        cli_validation=False,
     ):
         """
         Generates a Docker Compose configuration based on the provided scenario.
 
+        The configuration is validated in-process before anything is written.
+
         Args:
             scenario (dict): A dictionary containing the scenario configuration.
             docker_compose_path (str): Path to the Docker Compose file.
             scenario_config_path (str): Path for scenario configuration files.
+            cli_validation (bool): Also validate the written file with the Docker Compose CLI.
         """
         self.path = docker_compose_path
         self.config_path = scenario_config_path
         self.add_network("icscommemulator", scenario["ip_network"])
 
         master_dependencies = self.get_dependencies(scenario["nodes"])
+        masters = list(filter(self.is_master, scenario["nodes"]))
+        slaves = list(filter(self.is_slave, scenario["nodes"]))
+        ips = self.assign_addresses(masters, slaves)
 
-        for i, node in enumerate(filter(self.is_master, scenario["nodes"])):
+        for i, node in enumerate(masters):
             self.add_node(
                 node["role"],
                 i,
-                ip=node.get("ip", None),
+                ip=ips[("master", i)],
                 mac=node.get("mac", None),
                 dependencies=master_dependencies,
             )
 
-        for i, node in enumerate(filter(self.is_slave, scenario["nodes"])):
-            self.add_node(node["role"], i, ip=node.get("ip"), mac=node.get("mac", None))
+        for i, node in enumerate(slaves):
+            self.add_node(
+                node["role"], i, ip=ips[("slave", i)], mac=node.get("mac", None)
+            )
 
-        self.generate()
         if not self.validate():
-            raise Exception("Invalid docker-compose file")
+            raise Exception(f"Invalid docker-compose file: {self.validation_errors}")
+        self.generate()
+        if cli_validation and not self.validate(cli=True):
+            raise Exception("Invalid docker-compose file: rejected by docker compose")
+
+    def assign_addresses(self, masters, slaves):
+        """
+        Validates the explicit IPs of the whole topology in one pass and allocates the missing ones in bulk.
+
+        Args:
+            masters (list): Master node configurations.
+            slaves (list): Slave node configurations.
+
+        Returns:
+            dict: IP address of every node, keyed by (role, index).
+
+        Raises:
+            IPAllocationError: Listing every invalid, out-of-range or repeated IP.
+        """
+        nodes = [("master", i, node) for i, node in enumerate(masters)]
+        nodes += [("slave", i, node) for i, node in enumerate(slaves)]
+
+        self.ip_allocator.reserve_many(
+            (node["ip"], self.service_name(role, i))
+            for role, i, node in nodes
+            if node.get("ip")
+        )
+        dynamic = [(role, i) for role, i, node in nodes if not node.get("ip")]
+        allocated = self.ip_allocator.allocate_many(
+            [self.service_name(role, i) for role, i in dynamic]
+        )
+
+        ips = {(role, i): node["ip"] for role, i, node in nodes if node.get("ip")}
+        ips.update(zip(dynamic, allocated))
+        return ips
+
+    def written_services(self, scenario) -> set[str]:
+        """
+        Returns the services of the slaves whose registers the masters of a scenario write to.
+
+        Containers kept from a previous run keep the registers written then, so
+        these slaves are recreated to start from their configured state.
+
+        Args:
+            scenario (dict): A dictionary containing the scenario configuration.
+
+        Returns:
+            set[str]: Names of the services of the written slaves.
+        """
+        slaves = list(filter(self.is_slave, scenario["nodes"]))
+        targets = {
+            (message["ip"], int(message["port"]))
+            for node in filter(self.is_master, scenario["nodes"])
+            for message in node.get("messages") or []
+            if int(message["function_code"]) in WRITE_FUNCTION_CODES
+        }
+        return {
+            self.service_name("slave", i)
+            for i, node in enumerate(slaves)
+            if (node.get("ip"), int(node.get("port", 502))) in targets
+        }
 
     @staticmethod
     def get_dependencies(nodes):
@@ -254,6 +480,38 @@ class DockerComposeGenerator:
         return node["role"] == "slave"
 
 
+def _render_service(name: str, service: dict) -> str:
+    import yaml
+
+    text = yaml.dump({name: service}, Dumper=yaml_dumper())
+    return "".join("  " + line for line in text.splitlines(True))
+
+
+def _split_service_blocks(text: str) -> dict[str, str]:
+    """
+    Splits a generated Docker Compose file into the YAML blocks of its services.
+
+    Args:
+        text (str): Content of the file.
+
+    Returns:
+        dict[str, str]: Text of each service block, keyed by service name.
+    """
+    blocks = {}
+    current = None
+    in_services = False
+    for line in text.splitlines(True):
+        if not line.startswith(" "):
+            in_services = line.startswith("services:")
+            current = None
+        elif in_services and not line.startswith("   "):
+            current = line.strip().rstrip(":")
+            blocks[current] = [line]
+        elif current is not None:
+            blocks[current].append(line)
+    return {name: "".join(lines) for name, lines in blocks.items()}
+
+
 if __name__ == "__main__":
     scenario = {
         "protocol": "modbus",
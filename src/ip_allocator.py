@@ -0,0 +1,181 @@
+"""
+Address allocation for generated topologies.
+
+``IPAllocator`` keeps an index of the addresses used in a subnet, so explicit
+addresses and dynamically allocated ones can never collide, and hands out
+dynamic addresses in bulk from the free ranges of the subnet.
+"""
+
+import bisect
+import heapq
+import ipaddress
+from typing import Iterable
+
+
+class IPAllocationError(Exception):
+    pass
+
+
+class IPAllocator:
+    """
+    Allocates IPv4 addresses of a subnet to named owners.
+
+    The network address, the broadcast address and the first host address
+    (used by Docker as the bridge gateway) are never handed out.
+
+    Attributes:
+        network (ipaddress.IPv4Network): Subnet addresses are allocated from.
+    """
+
+    def __init__(self, network: str):
+        self.network = ipaddress.ip_network(network)
+        self._first = int(self.network.network_address) + 2
+        self._last = int(self.network.broadcast_address) - 1
+        self._gateway = int(self.network.network_address) + 1
+        self._owners = {}
+        # Owned addresses in ascending order, kept sorted as addresses are added
+        self._used = []
+        self._cursor = self._first
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def owner(self, ip: str | ipaddress.IPv4Address) -> str | None:
+        return self._owners.get(int(ipaddress.ip_address(ip)))
+
+    def check(self, ip: str | ipaddress.IPv4Address, owner: str) -> str | None:
+        """
+        Checks whether an address can be assigned to an owner.
+
+        Args:
+            ip (str | ipaddress.IPv4Address): Address to check.
+            owner (str): Name of the node claiming the address.
+
+        Returns:
+            str | None: Description of the problem, or None if the address is usable.
+        """
+        try:
+            address = int(ipaddress.ip_address(ip))
+        except ValueError:
+            return f"Invalid IP {ip} for {owner}"
+        if not self._first <= address <= self._last:
+            if address == self._gateway:
+                return f"IP {ip} of {owner} is reserved for the gateway"
+            return f"IP {ip} of {owner} is out of range {self.network}"
+        current = self._owners.get(address)
+        if current is not None and current != owner:
+            return f"IP {ip} of {owner} is already used by {current}"
+        return None
+
+    def reserve(self, ip: str | ipaddress.IPv4Address, owner: str):
+        """
+        Assigns an explicit address to an owner. Reserving an address again for the same owner is a no-op.
+
+        Args:
+            ip (str | ipaddress.IPv4Address): Address to reserve.
+            owner (str): Name of the node using the address.
+
+        Raises:
+            IPAllocationError: If the address is invalid, out of range or used by another owner.
+        """
+        error = self.check(ip, owner)
+        if error:
+            raise IPAllocationError(error)
+        self._add({int(ipaddress.ip_address(ip)): owner})
+
+    def reserve_many(self, addresses: Iterable[tuple[str, str]]):
+        """
+        Validates and reserves a whole set of explicit addresses in one pass.
+
+        Args:
+            addresses (Iterable[tuple[str, str]]): Pairs of (address, owner).
+
+        Raises:
+            IPAllocationError: Listing every problem found; nothing is reserved in that case.
+        """
+        errors = []
+        claimed = {}
+        for ip, owner in addresses:
+            error = self.check(ip, owner)
+            if error is None:
+                address = int(ipaddress.ip_address(ip))
+                previous = claimed.get(address)
+                if previous is not None and previous != owner:
+                    error = f"IP {ip} of {owner} is already used by {previous}"
+                claimed[address] = owner
+            if error:
+                errors.append(error)
+        if errors:
+            raise IPAllocationError("; ".join(errors))
+        self._add(claimed)
+
+    def allocate(self, owner: str) -> ipaddress.IPv4Address:
+        """
+        Allocates the lowest free address.
+
+        Args:
+            owner (str): Name of the node using the address.
+
+        Returns:
+            ipaddress.IPv4Address: The allocated address.
+        """
+        return self.allocate_many([owner])[0]
+
+    def allocate_many(self, owners: list[str]) -> list[ipaddress.IPv4Address]:
+        """
+        Allocates one free address per owner, taking whole free ranges at a time.
+
+        Args:
+            owners (list[str]): Names of the nodes needing an address.
+
+        Returns:
+            list[ipaddress.IPv4Address]: Allocated addresses, in the order of the owners.
+
+        Raises:
+            IPAllocationError: If the subnet does not have enough free addresses.
+        """
+        allocated = []
+        needed = len(owners)
+        for start, end in self.free_ranges(self._cursor):
+            take = min(needed - len(allocated), end - start)
+            allocated.extend(range(start, start + take))
+            if len(allocated) == needed:
+                break
+        if len(allocated) < needed:
+            raise IPAllocationError(
+                f"Not enough free addresses in {self.network} for {needed} nodes"
+            )
+        self._add(dict(zip(allocated, owners)))
+        if allocated:
+            self._cursor = allocated[-1] + 1
+        return [ipaddress.IPv4Address(address) for address in allocated]
+
+    def _add(self, owners: dict[int, str]):
+        # Records owners of addresses, merging the new addresses into the sorted index
+        new = sorted(address for address in owners if address not in self._owners)
+        if len(new) == 1:
+            bisect.insort(self._used, new[0])
+        elif new:
+            self._used = list(heapq.merge(self._used, new))
+        self._owners.update(owners)
+
+    def free_ranges(self, start: int = None):
+        """
+        Yields the ranges of free addresses.
+
+        Args:
+            start (int, optional): Integer address to start from. Defaults to the first usable address.
+
+        Yields:
+            tuple[int, int]: Half-open ranges [first, end) of free integer addresses.
+        """
+        current = max(start or self._first, self._first)
+        index = bisect.bisect_left(self._used, current)
+        while index < len(self._used):
+            used = self._used[index]
+            if used > current:
+                yield current, used
+            current = used + 1
+            index += 1
+        if current <= self._last:
+            yield current, self._last + 1
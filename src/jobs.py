@@ -0,0 +1,146 @@
+"""
+Background jobs of the web API.
+
+``JobPool`` runs long operations, such as preparing and launching a scenario,
+on a pool of worker threads, so the request submitting them can return right
+away. A job reports the stage it is in while it runs, and finished jobs are
+kept for a while so their outcome can still be queried.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    """
+    State of a background job.
+
+    Attributes:
+        id (str): Unique identifier of the job.
+        name (str): Name of what the job works on, such as a scenario.
+        state (str): One of pending, running, succeeded or failed.
+        stage (str): Stage the job is in, or was in when it finished.
+        result (Any): Value returned by the job, once it has succeeded.
+        error (str): Reason of the failure, once it has failed.
+    """
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.state = PENDING
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._stages = []
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage: str):
+        """
+        Records that the job entered a new stage.
+
+        Args:
+            stage (str): Name of the stage.
+        """
+        with self._lock:
+            self.stage = stage
+            self._stages.append({"name": stage, "started_at": time.time()})
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "state": self.state,
+                "stage": self.stage,
+                "stages": list(self._stages),
+                "result": self.result,
+                "error": self.error,
+                "submitted_at": self.submitted_at,
+                "finished_at": self.finished_at,
+            }
+
+    def _finish(self, state: str, result: Any = None, error: str = None):
+        with self._lock:
+            self.state = state
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+
+
+class JobPool:
+    """
+    Runs jobs on a fixed number of worker threads.
+
+    Attributes:
+        max_workers (int): Number of jobs run at the same time; later ones wait in the pending state.
+        max_finished (int): Number of finished jobs whose outcome is kept.
+    """
+
+    def __init__(self, max_workers: int = 4, max_finished: int = 100):
+        self.max_workers = max_workers
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+        """
+        Queues a job.
+
+        Args:
+            name (str): Name of what the job works on.
+            fn (Callable): Function run by the job. It is called with the job, to report its stages, followed by args and kwargs; its return value is the result of the job.
+
+        Returns:
+            Job: The queued job.
+        """
+        job = Job(name)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Job, fn: Callable[..., Any], args, kwargs):
+        with job._lock:
+            job.state = RUNNING
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.name}) failed in {job.stage}: {e}")
+            job._finish(FAILED, error=str(e))
+        else:
+            job._finish(SUCCEEDED, result=result)
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            finished = [id for id, job in self._jobs.items() if job.finished]
+            for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
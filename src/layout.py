@@ -0,0 +1,198 @@
+"""
+Server-side layout of scenario graphs.
+
+The editor opens scenarios with cytoscape's preset layout, which reads the
+``position`` of every node; laying out a large graph in the browser instead
+freezes the page. ``layout_scenario`` computes the missing positions so they
+are stored with the scenario:
+
+* a scenario without positions is laid out in layers, masters on a row above
+  the slaves, and slaves ordered by the masters they are connected to, so
+  edges stay short;
+* otherwise only the nodes without a position are placed, next to the nodes
+  they are connected to, and positions set in the editor are kept.
+"""
+
+import math
+from typing import Any
+
+# Distance between neighbouring nodes of a layer
+NODE_SPACING = 120.0
+# Distance between layers
+LAYER_SPACING = 160.0
+# Width to height ratio of the slave layers
+ASPECT_RATIO = 2.0
+# Slots searched on each side of a node before moving it to the next layer
+SEARCH_WIDTH = 8
+
+
+def layout_scenario(data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Gives a position to every node of a cytoscape scenario.
+
+    The scenario is not modified; the returned one shares the nodes that already
+    had a position and holds copies of the others.
+
+    Args:
+        data (dict): Cytoscape scenario.
+
+    Returns:
+        dict: The scenario with a position for every node.
+    """
+    nodes = data.get("nodes") or []
+    positions = [_position(node) for node in nodes]
+    missing = [i for i, position in enumerate(positions) if position is None]
+    if all(position in (None, (0.0, 0.0)) for position in positions):
+        # Nodes all at the origin have never been laid out
+        missing = list(range(len(nodes)))
+    if not missing:
+        return data
+
+    import numpy as np
+
+    index = {node["data"]["id"]: i for i, node in enumerate(nodes)}
+    is_master = np.fromiter(
+        (node["data"].get("role") == "master" for node in nodes), bool, len(nodes)
+    )
+    pairs = [
+        (index[edge["data"]["source"]], index[edge["data"]["target"]])
+        for edge in data.get("edges") or []
+        if edge["data"].get("source") in index and edge["data"].get("target") in index
+    ]
+    edges = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+    if len(missing) == len(nodes):
+        xy = _layered(is_master, edges)
+    else:
+        xy = np.array([p or (0.0, 0.0) for p in positions], dtype=float)
+        _place(xy, np.array(missing), is_master, edges)
+
+    laid_out = list(nodes)
+    for i in missing:
+        x, y = xy[i]
+        laid_out[i] = {**nodes[i], "position": {"x": float(x), "y": float(y)}}
+    return {**data, "nodes": laid_out}
+
+
+def layer_columns(slaves: int) -> int:
+    """
+    Returns the number of slaves per layer of the layered layout.
+    """
+    columns = math.ceil(math.sqrt(slaves * ASPECT_RATIO))
+    return max(1, min(columns, slaves))
+
+
+def layered_position(role: str, index: int, masters: int, slaves: int) -> dict:
+    """
+    Returns the position of a node in the layered layout, for graphs whose slaves are already in polling order.
+
+    Args:
+        role (str): Role of the node.
+        index (int): Index of the node among the nodes of its role.
+        masters (int): Number of masters of the graph.
+        slaves (int): Number of slaves of the graph.
+
+    Returns:
+        dict: Cytoscape position of the node.
+    """
+    columns = layer_columns(slaves)
+    if role == "master":
+        width = max(columns - 1, masters - 1) * NODE_SPACING
+        x = -width / 2 + index * width / (masters - 1) if masters > 1 else 0.0
+        return {"x": x, "y": 0.0}
+    return {
+        "x": (index % columns - (columns - 1) / 2) * NODE_SPACING,
+        "y": (index // columns + 1) * LAYER_SPACING,
+    }
+
+
+def _position(node: dict[str, Any]) -> tuple[float, float] | None:
+    position = node.get("position")
+    try:
+        return float(position["x"]), float(position["y"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _layered(is_master, edges):
+    """
+    Lays out a whole graph: masters on a row, slaves on a grid of layers below.
+    """
+    import numpy as np
+
+    count = len(is_master)
+    masters = np.flatnonzero(is_master)
+    slaves = np.flatnonzero(~is_master)
+    xy = np.zeros((count, 2))
+
+    # Slaves are sorted by the mean rank of the masters polling them
+    rank = np.full(count, np.nan)
+    rank[masters] = np.arange(len(masters))
+    links = np.concatenate([edges, edges[:, ::-1]])
+    links = links[is_master[links[:, 0]] & ~is_master[links[:, 1]]]
+    weight = np.bincount(links[:, 1], weights=rank[links[:, 0]], minlength=count)
+    degree = np.bincount(links[:, 1], minlength=count)
+    key = np.where(degree > 0, weight / np.maximum(degree, 1), np.inf)
+    slaves = slaves[np.argsort(key[slaves], kind="stable")]
+
+    columns = layer_columns(len(slaves))
+    order = np.arange(len(slaves))
+    xy[slaves, 0] = (order % columns - (columns - 1) / 2) * NODE_SPACING
+    xy[slaves, 1] = (order // columns + 1) * LAYER_SPACING
+
+    # Masters span the width of the slave layers
+    width = max(columns - 1, len(masters) - 1) * NODE_SPACING
+    if len(masters) == 1:
+        xy[masters, 0] = 0.0
+    elif len(masters):
+        xy[masters, 0] = np.linspace(-width / 2, width / 2, len(masters))
+    return xy
+
+
+def _place(xy, missing, is_master, edges):
+    """
+    Places the missing nodes of a laid out graph next to their placed neighbours.
+    """
+    import numpy as np
+
+    placed = np.ones(len(xy), bool)
+    placed[missing] = False
+
+    # Mean position of the placed neighbours of every node
+    links = np.concatenate([edges, edges[:, ::-1]])
+    links = links[placed[links[:, 1]]]
+    total = np.zeros_like(xy)
+    np.add.at(total, links[:, 0], xy[links[:, 1]])
+    degree = np.bincount(links[:, 0], minlength=len(xy))
+
+    # Masters go a layer above their slaves, slaves a layer below their masters;
+    # nodes without placed neighbours go on a new layer above or below the graph
+    top, bottom = xy[placed, 1].min(), xy[placed, 1].max()
+    center = xy[placed, 0].mean()
+    offset = np.where(is_master[missing], -LAYER_SPACING, LAYER_SPACING)
+    connected = degree[missing] > 0
+    target = np.empty((len(missing), 2))
+    target[:, 0] = np.where(
+        connected, total[missing, 0] / np.maximum(degree[missing], 1), center
+    )
+    target[:, 1] = np.where(
+        connected,
+        total[missing, 1] / np.maximum(degree[missing], 1) + offset,
+        np.where(is_master[missing], top, bottom) + offset,
+    )
+
+    # Nodes are moved along their layer to the nearest free slot, or to the
+    # next layer away from the graph if their layer is crowded around the target
+    cells = np.stack([xy[:, 0] / NODE_SPACING, xy[:, 1] / LAYER_SPACING], axis=1)
+    occupied = set(map(tuple, np.rint(cells[placed]).astype(int).tolist()))
+    for i, (x, y) in zip(missing.tolist(), target.tolist()):
+        column, row = round(x / NODE_SPACING), round(y / LAYER_SPACING)
+        step = 0
+        while (column + step, row) in occupied:
+            # 0, 1, -1, 2, -2, ...
+            step = -step if step > 0 else 1 - step
+            if abs(step) > SEARCH_WIDTH:
+                step = 0
+                row += -1 if is_master[i] else 1
+        occupied.add((column + step, row))
+        xy[i] = ((column + step) * NODE_SPACING, row * LAYER_SPACING)
@@ -0,0 +1,40 @@
+"""
+Modbus/TCP encoding shared by the capture compiler and the capture synthesizer.
+"""
+
+import struct
+
+# Register table read or written by each function code
+TABLES = {
+    1: "coils",
+    2: "discrete_inputs",
+    3: "holding_registers",
+    4: "input_registers",
+    5: "coils",
+    6: "holding_registers",
+    15: "coils",
+    16: "holding_registers",
+}
+# Function codes that change the registers of a slave
+WRITE_FUNCTION_CODES = (5, 6, 15, 16)
+
+# MBAP header: transaction id, protocol id, length of the rest and unit id
+MBAP = struct.Struct("!HHHB")
+
+
+def pack_bits(bits: list[int]) -> bytes:
+    """
+    Packs coils or discrete inputs, least significant bit first.
+    """
+    data = bytearray((len(bits) + 7) // 8)
+    for i, bit in enumerate(bits):
+        if bit:
+            data[i // 8] |= 1 << (i % 8)
+    return bytes(data)
+
+
+def unpack_bits(data: bytes, count: int) -> list[int]:
+    """
+    Unpacks up to count coils or discrete inputs packed by pack_bits.
+    """
+    return [(data[i // 8] >> (i % 8)) & 1 for i in range(min(count, len(data) * 8))]
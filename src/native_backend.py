@@ -0,0 +1,201 @@
+"""
+Docker-free execution backend.
+
+Masters and slaves are started as local Python processes instead of
+containers. Every scenario IP is added as a /32 alias (on the loopback or on a
+dummy interface), slaves bind to their own address and masters use theirs as
+the source address, so the traffic looks the same as on the Docker bridge.
+Traffic between local addresses is always routed through the loopback device,
+which is therefore the capture interface.
+
+Adding addresses and binding port 502 require root (or CAP_NET_ADMIN and
+CAP_NET_BIND_SERVICE), just like running tcpdump.
+"""
+
+import ipaddress
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any
+
+from .scenario_config_generator import node_environment
+
+logger = logging.getLogger(__name__)
+
+PROTOCOLS_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "protocols"
+)
+
+
+class NativeBackend:
+    """
+    Runs a scenario as local processes bound to aliases of the scenario IPs.
+
+    Attributes:
+        scenario (dict): Scenario configuration, as stored in config.yaml.
+        config_path (str): Path to the generated node configuration files.
+        alias_interface (str): Interface holding the scenario IP aliases.
+        capture_interface (str): Interface on which traffic must be captured.
+    """
+
+    capture_interface = "lo"
+
+    def __init__(
+        self,
+        scenario: dict[str, Any],
+        config_path: str,
+        alias_interface: str = "lo",
+        ready_timeout: float = 30.0,
+    ):
+        self.scenario = scenario
+        self.protocol = scenario["protocol"]
+        self.config_path = config_path
+        self.alias_interface = alias_interface
+        self.ready_timeout = ready_timeout
+        self._masters = [n for n in scenario["nodes"] if n["role"] == "master"]
+        self._slaves = [n for n in scenario["nodes"] if n["role"] == "slave"]
+        self._processes = []
+        self._added_addresses = []
+        self._created_interface = False
+
+    def capture_filter(self) -> str:
+        """
+        Returns a tcpdump filter matching only the scenario traffic.
+        """
+        return f"net {self.scenario['ip_network']}"
+
+    def start_slaves(self):
+        """
+        Adds the IP aliases and starts every slave, waiting until all of them accept connections.
+        """
+        self._setup_addresses()
+        for i, node in enumerate(self._slaves):
+            cwd = os.path.join(self.config_path, "slaves", str(i))
+            lock_file = os.path.join(cwd, "app_running.lock")
+            if os.path.exists(lock_file):
+                os.remove(lock_file)
+            self._spawn("slave", cwd)
+        self._wait_for_slaves()
+
+    def start_masters(self):
+        """
+        Starts every master, using its scenario IP as the source address.
+        """
+        for i, node in enumerate(self._masters):
+            cwd = os.path.join(self.config_path, "masters", str(i))
+            env = {}
+            if node.get("ip"):
+                env["MODBUS_SOURCE_ADDRESS"] = node["ip"]
+            self._spawn("master", cwd, env)
+
+    def stop(self, timeout: float = 3.0):
+        """
+        Terminates every process and removes the aliases added by start_slaves.
+
+        Args:
+            timeout (float): Seconds given to processes to exit before they are killed.
+        """
+        for process in self._processes:
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            try:
+                process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self._processes = []
+        self._teardown_addresses()
+
+    def _spawn(self, role: str, cwd: str, env: dict[str, str] = None):
+        script = os.path.join(PROTOCOLS_FOLDER, self.protocol, role, f"{role}.py")
+        log_file = open(os.path.join(cwd, f"{role}.log"), "w")
+        process = subprocess.Popen(
+            [sys.executable, script],
+            cwd=cwd,
+            env={**os.environ, **node_environment(role), **(env or {})},
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+        )
+        log_file.close()
+        self._processes.append(process)
+        return process
+
+    def _wait_for_slaves(self):
+        pending = {
+            i: (node["ip"], int(node["port"])) for i, node in enumerate(self._slaves)
+        }
+        deadline = time.monotonic() + self.ready_timeout
+        while pending:
+            for i, address in list(pending.items()):
+                lock_file = os.path.join(
+                    self.config_path, "slaves", str(i), "app_running.lock"
+                )
+                if os.path.exists(lock_file) and _accepts_connections(address):
+                    del pending[i]
+            if not pending:
+                break
+            if any(p.poll() is not None for p in self._processes):
+                raise Exception("A slave process exited during startup")
+            if time.monotonic() > deadline:
+                raise Exception(f"Slaves not ready after {self.ready_timeout}s")
+            time.sleep(0.02)
+
+    def _setup_addresses(self):
+        if self.alias_interface != "lo" and not _interface_exists(self.alias_interface):
+            _ip("link", "add", self.alias_interface, "type", "dummy")
+            _ip("link", "set", self.alias_interface, "up")
+            self._created_interface = True
+
+        assigned = _assigned_addresses()
+        for node in self._masters + self._slaves:
+            if not node.get("ip"):
+                raise Exception(
+                    f"Node {node.get('name', node['role'])} needs an IP to run natively"
+                )
+            ip = ipaddress.ip_address(node["ip"])
+            if ip.is_loopback or str(ip) in assigned:
+                continue
+            _ip("addr", "add", f"{ip}/32", "dev", self.alias_interface)
+            assigned.add(str(ip))
+            self._added_addresses.append(str(ip))
+
+    def _teardown_addresses(self):
+        for ip in self._added_addresses:
+            _ip("addr", "del", f"{ip}/32", "dev", self.alias_interface, check=False)
+        self._added_addresses = []
+        if self._created_interface:
+            _ip("link", "del", self.alias_interface, check=False)
+            self._created_interface = False
+
+
+def _ip(*args, check: bool = True):
+    result = subprocess.run(["ip", *args], capture_output=True, text=True)
+    if check and result.returncode != 0:
+        raise Exception(f"'ip {' '.join(args)}' failed: {result.stderr.strip()}")
+    return result
+
+
+def _assigned_addresses() -> set[str]:
+    result = _ip("-o", "-4", "addr", "show")
+    return {
+        line.split()[3].split("/")[0]
+        for line in result.stdout.splitlines()
+        if len(line.split()) > 3
+    }
+
+
+def _interface_exists(name: str) -> bool:
+    return os.path.exists(os.path.join("/sys/class/net", name))
+
+
+def _accepts_connections(address: tuple[str, int]) -> bool:
+    try:
+        with socket.create_connection(address, timeout=0.2):
+            return True
+    except OSError:
+        return False
@@ -0,0 +1,307 @@
+"""
+Streaming helpers for libpcap capture files.
+
+The parser is push-based: bytes are fed as they become available (from a
+growing file written by ``tcpdump -U`` or any other byte stream) and complete
+records are returned as soon as they can be decoded, so memory use stays
+bounded by the largest single record. ``PcapWriter`` writes captures in the
+same format.
+"""
+
+import os
+import socket
+import struct
+from typing import NamedTuple
+
+PCAP_GLOBAL_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+
+_MAGIC_MICRO = 0xA1B2C3D4
+_MAGIC_NANO = 0xA1B23C4D
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+
+
+class PcapError(Exception):
+    pass
+
+
+class PcapRecord(NamedTuple):
+    timestamp: float
+    orig_len: int
+    data: bytes
+
+
+class PacketInfo(NamedTuple):
+    timestamp: float
+    length: int
+    src: str
+    dst: str
+    proto: int
+    sport: int
+    dport: int
+    payload: bytes
+
+
+class PcapStreamParser:
+    """
+    Incremental parser for the classic pcap format.
+
+    Attributes:
+        linktype (int): Link-layer header type, known once the global header is parsed.
+        endian (str): Struct byte order prefix of the capture.
+        snaplen (int): Maximum length of the captured frames.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.linktype = None
+        self.endian = None
+        self.snaplen = None
+        self._ts_divisor = 1e6
+
+    def feed(self, chunk: bytes) -> list[PcapRecord]:
+        """
+        Appends a chunk of the capture and returns the records completed by it.
+
+        Args:
+            chunk (bytes): Next bytes of the capture stream.
+
+        Returns:
+            list[PcapRecord]: Records fully contained in the data seen so far.
+        """
+        self._buffer += chunk
+        records = []
+        offset = 0
+        if self.linktype is None:
+            if len(self._buffer) < PCAP_GLOBAL_HEADER_LEN:
+                return records
+            self._parse_global_header(self._buffer[:PCAP_GLOBAL_HEADER_LEN])
+            offset = PCAP_GLOBAL_HEADER_LEN
+
+        record_header = struct.Struct(self.endian + "IIII")
+        size = len(self._buffer)
+        while size - offset >= PCAP_RECORD_HEADER_LEN:
+            ts_sec, ts_frac, incl_len, orig_len = record_header.unpack_from(
+                self._buffer, offset
+            )
+            end = offset + PCAP_RECORD_HEADER_LEN + incl_len
+            if end > size:
+                break
+            records.append(
+                PcapRecord(
+                    ts_sec + ts_frac / self._ts_divisor,
+                    orig_len,
+                    bytes(self._buffer[offset + PCAP_RECORD_HEADER_LEN : end]),
+                )
+            )
+            offset = end
+        del self._buffer[:offset]
+        return records
+
+    def _parse_global_header(self, header: bytes):
+        for endian in ("<", ">"):
+            magic = struct.unpack(endian + "I", header[:4])[0]
+            if magic in (_MAGIC_MICRO, _MAGIC_NANO):
+                self.endian = endian
+                self._ts_divisor = 1e9 if magic == _MAGIC_NANO else 1e6
+                self.snaplen, self.linktype = struct.unpack(
+                    endian + "II", header[16:24]
+                )
+                return
+        raise PcapError("Not a pcap capture (unknown magic number)")
+
+
+class PcapWriter:
+    """
+    Writer of captures in the classic pcap format.
+
+    Attributes:
+        file (BinaryIO): Stream the capture is written to.
+        resolution (int): Timestamp units per second: 10**6, or 10**9 for nanosecond captures.
+    """
+
+    def __init__(
+        self,
+        file,
+        linktype: int = LINKTYPE_ETHERNET,
+        nanosecond: bool = False,
+        snaplen: int = 262144,
+        endian: str = "<",
+    ):
+        self.file = file
+        self.resolution = 10**9 if nanosecond else 10**6
+        self._record_header = struct.Struct(endian + "IIII")
+        magic = _MAGIC_NANO if nanosecond else _MAGIC_MICRO
+        file.write(
+            struct.pack(endian + "IHHiIII", magic, 2, 4, 0, 0, snaplen, linktype)
+        )
+
+    def write(self, timestamp: float, data: bytes, orig_len: int = None):
+        """
+        Writes a record.
+
+        Args:
+            timestamp (float): Capture time, in seconds since the epoch.
+            data (bytes): Captured frame.
+            orig_len (int, optional): Length of the frame on the wire, if it was truncated.
+        """
+        seconds, fraction = divmod(round(timestamp * self.resolution), self.resolution)
+        self.file.write(
+            self._record_header.pack(
+                seconds, fraction, len(data), orig_len or len(data)
+            )
+        )
+        self.file.write(data)
+
+
+def rescale_timestamps(file_path: str, factor: float, chunk_size: int = 1 << 20):
+    """
+    Stretches the time between the first record of a capture and every other record by a factor, in place.
+
+    Args:
+        file_path (str): Path to the capture.
+        factor (float): Factor applied to the time elapsed since the first record.
+        chunk_size (int): Number of bytes read per iteration.
+    """
+    parser = PcapStreamParser()
+    temporary = f"{file_path}.tmp"
+    writer = origin = None
+    with open(file_path, "rb") as source, open(temporary, "wb") as target:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            for record in parser.feed(chunk):
+                if writer is None:
+                    writer = PcapWriter(
+                        target,
+                        parser.linktype,
+                        nanosecond=parser._ts_divisor == 1e9,
+                        snaplen=parser.snaplen,
+                        endian=parser.endian,
+                    )
+                    origin = record.timestamp
+                writer.write(
+                    origin + (record.timestamp - origin) * factor,
+                    record.data,
+                    record.orig_len,
+                )
+    if writer is None:
+        # Empty capture, or global header only
+        os.remove(temporary)
+        return
+    os.replace(temporary, file_path)
+
+
+def iter_records(file_path: str, chunk_size: int = 1 << 20):
+    """
+    Streams the records of a pcap file without loading it into memory.
+
+    Args:
+        file_path (str): Path to the capture.
+        chunk_size (int): Number of bytes read per iteration.
+
+    Yields:
+        tuple[PcapStreamParser, PcapRecord]: The parser (for the link type) and each record.
+    """
+    parser = PcapStreamParser()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            for record in parser.feed(chunk):
+                yield parser, record
+
+
+def decode_packet(linktype: int, record: PcapRecord) -> PacketInfo | None:
+    """
+    Decodes the IPv4/TCP/UDP headers of a captured frame.
+
+    Args:
+        linktype (int): Link-layer header type of the capture.
+        record (PcapRecord): Captured record.
+
+    Returns:
+        PacketInfo | None: Decoded packet, or None for non-IPv4 traffic.
+    """
+    data = record.data
+    if linktype == LINKTYPE_ETHERNET:
+        if len(data) < 14:
+            return None
+        ethertype = struct.unpack_from("!H", data, 12)[0]
+        offset = 14
+        if ethertype == ETHERTYPE_VLAN and len(data) >= 18:
+            ethertype = struct.unpack_from("!H", data, 16)[0]
+            offset = 18
+        if ethertype != ETHERTYPE_IPV4:
+            return None
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(data) < 16 or struct.unpack_from("!H", data, 14)[0] != ETHERTYPE_IPV4:
+            return None
+        offset = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if len(data) < 20 or struct.unpack_from("!H", data, 0)[0] != ETHERTYPE_IPV4:
+            return None
+        offset = 20
+    elif linktype == LINKTYPE_NULL:
+        offset = 4
+    elif linktype == LINKTYPE_RAW:
+        offset = 0
+    else:
+        return None
+
+    if len(data) < offset + 20 or data[offset] >> 4 != 4:
+        return None
+    ihl = (data[offset] & 0x0F) * 4
+    total_length = struct.unpack_from("!H", data, offset + 2)[0]
+    proto = data[offset + 9]
+    src = socket.inet_ntoa(data[offset + 12 : offset + 16])
+    dst = socket.inet_ntoa(data[offset + 16 : offset + 20])
+    ip_end = min(len(data), offset + total_length) if total_length else len(data)
+    transport = offset + ihl
+
+    sport = dport = 0
+    payload = b""
+    if proto == IP_PROTO_TCP and ip_end >= transport + 20:
+        sport, dport = struct.unpack_from("!HH", data, transport)
+        data_offset = (data[transport + 12] >> 4) * 4
+        payload = data[transport + data_offset : ip_end]
+    elif proto == IP_PROTO_UDP and ip_end >= transport + 8:
+        sport, dport = struct.unpack_from("!HH", data, transport)
+        payload = data[transport + 8 : ip_end]
+
+    return PacketInfo(
+        record.timestamp, record.orig_len, src, dst, proto, sport, dport, payload
+    )
+
+
+def is_modbus_request(packet: PacketInfo, ports=(502,)) -> bool:
+    """
+    Checks whether a packet carries a Modbus/TCP request (MBAP header plus function code).
+
+    Args:
+        packet (PacketInfo): Decoded packet.
+        ports (Iterable[int]): Ports Modbus servers listen on.
+
+    Returns:
+        bool: True if the packet is a request sent to a Modbus server.
+    """
+    payload = packet.payload
+    return (
+        packet.proto == IP_PROTO_TCP
+        and packet.dport in ports
+        and len(payload) >= 8
+        and payload[2] == 0
+        and payload[3] == 0
+    )
@@ -0,0 +1,462 @@
+"""
+Compilation of captured Modbus/TCP traffic into a scenario replaying it.
+
+``PcapReplay`` streams a capture with ``iter_records`` and groups the requests
+by master, slave and request (function code, addresses, count and written
+values). A request repeated at a steady interval becomes a single recurrent
+message; other requests become one message per occurrence, at their original
+time relative to the first request of the capture. Slaves expose the first
+value seen for every address, read from responses or written by requests.
+
+Memory is bounded by the number of distinct requests, not by the length of the
+capture: the first pass keeps running statistics of the intervals of every
+request, and the occurrences of the irregular ones are collected by a second
+pass over the capture, only if there are any.
+"""
+
+import argparse
+import ipaddress
+import logging
+import math
+import struct
+from array import array
+from collections import Counter
+from typing import Any, Iterator, NamedTuple
+
+from .cytoscape_adapter import (
+    PROTOCOL,
+    REGISTER_KEYS,
+    cytoscape_node,
+    scenario_message,
+    scenario_node,
+)
+from .ip_allocator import IPAllocationError, IPAllocator
+from .layout import layered_position
+from .modbus_codec import MBAP, TABLES, unpack_bits
+from .pcap import IP_PROTO_TCP, decode_packet, iter_records
+from .scenario_handler import save_scenario_stream
+
+logger = logging.getLogger(__name__)
+
+MODBUS_PORTS = (502,)
+# Requests whose intervals vary less than this fraction of their mean are recurrent
+JITTER = 0.1
+# Occurrences needed before a request counts as recurrent
+MIN_REPEATS = 3
+# Irregular requests seen more often are replayed at their mean interval
+MAX_OCCURRENCES = 10000
+# Requests waiting for their response; the oldest are dropped beyond this
+MAX_PENDING = 65536
+# Widest network computed for a capture; wider ones mix unrelated subnets
+MIN_PREFIX = 16
+
+SUPPORTED_FUNCTION_CODES = set(TABLES) | {43}
+
+
+class Request(NamedTuple):
+    master: str
+    slave: str
+    port: int
+    function_code: int
+    start_address: int
+    count: int
+    values: tuple[int, ...]
+
+
+class _Series:
+    """
+    Occurrences of a request, with the running mean and variance of their intervals (Welford).
+    """
+
+    __slots__ = ("first", "last", "occurrences", "mean", "m2")
+
+    def __init__(self, timestamp: float):
+        self.first = self.last = timestamp
+        self.occurrences = 1
+        self.mean = self.m2 = 0.0
+
+    def add(self, timestamp: float):
+        gap = timestamp - self.last
+        self.last = timestamp
+        self.occurrences += 1
+        delta = gap - self.mean
+        self.mean += delta / (self.occurrences - 1)
+        self.m2 += delta * (gap - self.mean)
+
+    def is_recurrent(self, jitter: float, min_repeats: int) -> bool:
+        if self.occurrences < max(min_repeats, 2) or self.mean <= 0:
+            return False
+        deviation = math.sqrt(self.m2 / (self.occurrences - 1))
+        return deviation <= jitter * self.mean
+
+
+def parse_request(payload: bytes) -> tuple[int, int, int, int, int, tuple] | None:
+    """
+    Decodes a Modbus/TCP request.
+
+    Returns:
+        tuple | None: Transaction id, unit id, function code, start address, count and
+            written values, or None for malformed or unsupported requests.
+    """
+    if len(payload) < 8:
+        return None
+    transaction, protocol, length, unit = MBAP.unpack_from(payload)
+    pdu = payload[7 : 6 + length]
+    if protocol != 0 or not pdu or pdu[0] not in SUPPORTED_FUNCTION_CODES:
+        return None
+    function_code = pdu[0]
+    if function_code == 43:
+        return transaction, unit, function_code, 0, 0, ()
+    if len(pdu) < 5:
+        return None
+    start, quantity = struct.unpack_from("!HH", pdu, 1)
+    if function_code <= 4:
+        return transaction, unit, function_code, start, quantity, ()
+    if function_code == 5:
+        return transaction, unit, function_code, start, 0, (int(quantity == 0xFF00),)
+    if function_code == 6:
+        return transaction, unit, function_code, start, 0, (quantity,)
+    data = pdu[6 : 6 + pdu[5]] if len(pdu) > 5 else b""
+    if function_code == 15:
+        values = unpack_bits(data, quantity)
+    else:
+        values = struct.unpack_from(f"!{len(data) // 2}H", data)[:quantity]
+    if len(values) < quantity:
+        return None
+    return transaction, unit, function_code, start, 0, tuple(values)
+
+
+def parse_response(payload: bytes, function_code: int, count: int) -> list[int] | None:
+    """
+    Decodes the values returned by a response to a read request.
+
+    Returns:
+        list[int] | None: Values read, or None for exception or mismatched responses.
+    """
+    if len(payload) < 9 or payload[7] != function_code or function_code > 4:
+        return None
+    data = payload[9 : 9 + payload[8]]
+    if function_code <= 2:
+        values = unpack_bits(data, count)
+    else:
+        values = struct.unpack_from(f"!{len(data) // 2}H", data)[:count]
+    return list(values) if len(values) == count else None
+
+
+class PcapReplay:
+    """
+    Compiles the Modbus/TCP requests of a capture into a scenario.
+
+    Attributes:
+        file_path (str): Path of the capture.
+        ports (tuple[int]): Ports Modbus servers listen on.
+        jitter (float): Largest standard deviation of the intervals of a recurrent
+            request, as a fraction of their mean.
+        min_repeats (int): Occurrences needed before a request counts as recurrent.
+        max_occurrences (int): Occurrences of an irregular request kept one by one;
+            requests seen more often are replayed at their mean interval.
+        start (float): Capture time of the first request.
+        requests (dict[Request, _Series]): Occurrences of every request.
+        masters (dict[str, int]): Index of every master IP, in order of appearance.
+        slaves (dict[tuple[str, int], int]): Index of every slave address, in order of appearance.
+        registers (dict[tuple[str, int], dict[str, dict[int, int]]]): Values of the
+            registers of every slave, by table and address.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        ports=MODBUS_PORTS,
+        jitter: float = JITTER,
+        min_repeats: int = MIN_REPEATS,
+        max_occurrences: int = MAX_OCCURRENCES,
+    ):
+        self.file_path = file_path
+        self.ports = tuple(ports)
+        self.jitter = jitter
+        self.min_repeats = min_repeats
+        self.max_occurrences = max_occurrences
+        self.start = None
+        self.requests = {}
+        self.masters = {}
+        self.slaves = {}
+        self.registers = {}
+        self._units = {}
+        self._by_master = {}
+        self._occurrences = {}
+
+    def scan(self) -> "PcapReplay":
+        """
+        Reads the capture, twice if some requests are irregular.
+
+        Returns:
+            PcapReplay: The compiler, for chaining.
+        """
+        pending = {}
+        for request, unit, timestamp in self._requests(pending):
+            series = self.requests.get(request)
+            if series is None:
+                self.requests[request] = _Series(timestamp)
+                self.masters.setdefault(request.master, len(self.masters))
+                self._by_master.setdefault(request.master, []).append(request)
+                slave = (request.slave, request.port)
+                self.slaves.setdefault(slave, len(self.slaves))
+                self._units.setdefault(slave, Counter())
+            else:
+                series.add(timestamp)
+            self._units[(request.slave, request.port)][unit] += 1
+
+        irregular = {
+            request: array("d")
+            for request, series in self.requests.items()
+            if 1 < series.occurrences <= self.max_occurrences
+            and not series.is_recurrent(self.jitter, self.min_repeats)
+        }
+        if irregular:
+            for request, _, timestamp in self._requests(None):
+                if request in irregular:
+                    irregular[request].append(timestamp)
+        self._occurrences = irregular
+        logger.info(
+            f"Compiled {sum(s.occurrences for s in self.requests.values())} requests "
+            f"of {len(self.masters)} masters to {len(self.slaves)} slaves: "
+            f"{len(self.requests)} distinct requests, {len(irregular)} irregular"
+        )
+        return self
+
+    def _requests(self, pending: dict | None) -> Iterator[tuple[Request, int, float]]:
+        # Yields the requests of the capture; with pending, also records the
+        # registers of the slaves from the responses to them
+        for parser, record in iter_records(self.file_path):
+            packet = decode_packet(parser.linktype, record)
+            if packet is None or packet.proto != IP_PROTO_TCP or not packet.payload:
+                continue
+            if packet.dport in self.ports:
+                parsed = parse_request(packet.payload)
+                if parsed is None:
+                    continue
+                transaction, unit, function_code, start, count, values = parsed
+                if self.start is None:
+                    self.start = packet.timestamp
+                request = Request(
+                    packet.src,
+                    packet.dst,
+                    packet.dport,
+                    function_code,
+                    start,
+                    count,
+                    values,
+                )
+                if pending is not None:
+                    if values:
+                        self._record(request, values)
+                    connection = (packet.src, packet.sport, packet.dst, packet.dport)
+                    pending[connection + (transaction,)] = request
+                    if len(pending) > MAX_PENDING:
+                        del pending[next(iter(pending))]
+                yield request, unit, packet.timestamp
+            elif pending is not None and packet.sport in self.ports:
+                if len(packet.payload) < 8:
+                    continue
+                transaction = MBAP.unpack_from(packet.payload)[0]
+                connection = (packet.dst, packet.dport, packet.src, packet.sport)
+                request = pending.pop(connection + (transaction,), None)
+                if request is None:
+                    continue
+                values = parse_response(
+                    packet.payload, request.function_code, request.count
+                )
+                if values:
+                    self._record(request, values)
+
+    def _record(self, request: Request, values):
+        table = TABLES.get(request.function_code)
+        if table is None:
+            return
+        tables = self.registers.setdefault((request.slave, request.port), {})
+        registers = tables.setdefault(table, {})
+        for address, value in enumerate(values, request.start_address):
+            # Slaves start from the first state seen in the capture
+            registers.setdefault(address, value)
+
+    def messages(self, master: str) -> Iterator[tuple[tuple[str, int], dict[str, Any]]]:
+        """
+        Yields the messages of a master, in order of first occurrence.
+
+        Yields:
+            tuple[tuple[str, int], dict]: Address of the slave and the message, as found in an edge.
+        """
+        for request in self._by_master.get(master, []):
+            series = self.requests[request]
+            message = {
+                "function_code": request.function_code,
+                "start_address": request.start_address,
+                "count": request.count,
+                "values": list(request.values),
+            }
+            slave = (request.slave, request.port)
+            timestamps = self._occurrences.get(request)
+            if timestamps is None:
+                recurrent = series.occurrences > 1
+                yield slave, {
+                    "timestamp": round(series.first - self.start, 6),
+                    "recurrent": recurrent,
+                    "interval": round(series.mean, 6) if recurrent else 1,
+                    **message,
+                }
+                continue
+            for timestamp in timestamps:
+                yield slave, {
+                    "timestamp": round(timestamp - self.start, 6),
+                    "recurrent": False,
+                    "interval": 1,
+                    **message,
+                    "values": list(request.values),
+                }
+
+    def ip_network(self) -> ipaddress.IPv4Network:
+        """
+        Returns the smallest network of at least 256 addresses holding every node.
+
+        Raises:
+            ValueError: If the nodes span more than a /16, such as hosts of unrelated subnets.
+        """
+        addresses = [int(ipaddress.ip_address(ip)) for ip in self.masters]
+        addresses += [int(ipaddress.ip_address(ip)) for ip, _ in self.slaves]
+        low, high = min(addresses), max(addresses)
+        prefix = min(24, 32 - (low ^ high).bit_length())
+        network = ipaddress.ip_network(
+            f"{ipaddress.ip_address(low)}/{prefix}", strict=False
+        )
+        if prefix < MIN_PREFIX:
+            raise ValueError(
+                f"Nodes from {ipaddress.ip_address(low)} to {ipaddress.ip_address(high)} "
+                f"span {network}, wider than a /{MIN_PREFIX}"
+            )
+        return network
+
+    def nodes(self) -> Iterator[tuple[dict[str, Any], dict[str, Any]]]:
+        """
+        Yields every node, masters first.
+
+        Yields:
+            tuple[dict, dict]: The Cytoscape node and its scenario node, with the messages of masters.
+        """
+        for master, i in self.masters.items():
+            node = self._node("master", i, master)
+            messages = [
+                scenario_message(message, self._slave_data(slave))
+                for slave, message in sorted(
+                    self.messages(master), key=lambda item: item[1]["timestamp"]
+                )
+            ]
+            yield node, scenario_node(node["data"], messages)
+        for (ip, port), j in self.slaves.items():
+            node = self._node("slave", j, ip, port)
+            yield node, scenario_node(node["data"])
+
+    def edges(self) -> Iterator[dict[str, Any]]:
+        """
+        Yields one edge per master and slave it sends requests to.
+        """
+        for master, i in self.masters.items():
+            edges = {}
+            for slave, message in self.messages(master):
+                edges.setdefault(slave, []).append(message)
+            for slave, messages in edges.items():
+                j = self.slaves[slave]
+                messages.sort(key=lambda message: message["timestamp"])
+                yield {
+                    "data": {
+                        "id": f"edge_{i}_{j}",
+                        "source": f"master_{i}",
+                        "target": f"slave_{j}",
+                        "messages": messages,
+                    }
+                }
+
+    def save(self, name: str, ip_network: str = None) -> tuple[int, int]:
+        """
+        Saves the compiled scenario to the scenario store, scanning the capture first if needed.
+
+        Args:
+            name (str): Name of the scenario.
+            ip_network (str, optional): Network of the scenario; by default the smallest holding every node.
+
+        Returns:
+            tuple[int, int]: Number of nodes and edges saved.
+
+        Raises:
+            ValueError: If the capture has no requests, or its nodes cannot run in
+                the network: addresses out of it or reserved for its gateway, and
+                addresses shared by several nodes, such as a server answering on two ports.
+        """
+        if self.start is None:
+            self.scan()
+        if not self.requests:
+            raise ValueError(f"No Modbus/TCP requests found in {self.file_path}")
+        network = ipaddress.ip_network(ip_network or self.ip_network())
+        # Every node runs on its own address, as the emulator assigns them
+        addresses = [(ip, f"master_{i}") for ip, i in self.masters.items()]
+        addresses += [
+            (ip, f"slave_{j} (port {port})") for (ip, port), j in self.slaves.items()
+        ]
+        try:
+            IPAllocator(str(network)).reserve_many(addresses)
+        except IPAllocationError as e:
+            raise ValueError(f"{self.file_path} cannot be replayed: {e}") from e
+        fields = {"protocol": PROTOCOL.MODBUS.value, "ip_network": str(network)}
+        return save_scenario_stream(name, fields, self.nodes(), self.edges())
+
+    def _slave_data(self, slave: tuple[str, int]) -> dict[str, Any]:
+        # Fields of a slave used to address messages to it
+        ip, port = slave
+        unit = self._units[slave].most_common(1)[0][0]
+        return {"ip": ip, "port": str(port), "slave_id": str(unit)}
+
+    def _node(self, role: str, index: int, ip: str, port: int = None) -> dict[str, Any]:
+        position = layered_position(role, index, len(self.masters), len(self.slaves))
+        if role == "master":
+            return cytoscape_node(role, index, ip, position)
+        tables = self.registers.get((ip, port), {})
+        return cytoscape_node(
+            role,
+            index,
+            ip,
+            position,
+            self._slave_data((ip, port)),
+            {key: _register_block(tables.get(key)) for key in REGISTER_KEYS},
+        )
+
+
+def _register_block(registers: dict[int, int] | None) -> dict[str, Any]:
+    # Sequential from address 0 unless most of the addresses would be padding
+    if not registers:
+        return {"type": "sequential", "values": ""}
+    size = max(registers) + 1
+    if size <= 2 * len(registers):
+        return {
+            "type": "sequential",
+            "values": [registers.get(address, 0) for address in range(size)],
+        }
+    return {"type": "sparse", "values": dict(sorted(registers.items()))}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Compiles the Modbus/TCP requests of a capture into a scenario."
+    )
+    parser.add_argument("capture", help="pcap file")
+    parser.add_argument("name", help="name of the scenario to save")
+    parser.add_argument("--ports", type=int, nargs="+", default=list(MODBUS_PORTS))
+    parser.add_argument("--jitter", type=float, default=JITTER)
+    parser.add_argument("--min-repeats", type=int, default=MIN_REPEATS)
+    parser.add_argument("--max-occurrences", type=int, default=MAX_OCCURRENCES)
+    parser.add_argument("--ip-network", help="network of the scenario")
+    args = parser.parse_args()
+    replay = PcapReplay(
+        args.capture, args.ports, args.jitter, args.min_repeats, args.max_occurrences
+    )
+    nodes, edges = replay.save(args.name, args.ip_network)
+    print(f"Saved scenario {args.name} with {nodes} nodes and {edges} edges")
@@ -0,0 +1,802 @@
+"""
+Offline generation of Modbus/TCP captures from a scenario.
+
+``PcapSynthesizer`` walks the schedule of every master in virtual time and
+writes the packets a run of the scenario would capture, without starting any
+node. As the masters connect and close once per request, every request is an
+exchange of eight packets: the TCP handshake, the MBAP request, the response
+the slave computes from its registers, and the teardown. Each master has a
+single request in flight, so requests scheduled while the previous one is
+still running are sent as soon as it is done, as ModbusMaster.loop does.
+
+Packets are generated for a window of virtual time at once: the frames of
+each packet kind are rows of a numpy array whose fields and checksums are
+filled in for the whole window, then the records of the window are sorted by
+time and written in one go. Slaves are stateful: reads return the values
+written by earlier requests.
+"""
+
+import argparse
+import copy
+import ipaddress
+import math
+import os
+import struct
+import time
+from typing import Any, BinaryIO, NamedTuple
+
+from .modbus_codec import MBAP, TABLES, WRITE_FUNCTION_CODES, pack_bits
+from .pcap import LINKTYPE_ETHERNET, PcapWriter
+from .yaml_io import yaml_loader
+
+# One-way network delay of a packet, in seconds
+LATENCY = 0.0002
+# Time a slave takes to answer a request, in seconds
+PROCESSING = 0.0003
+# Standard deviation of the delays, as a fraction of their mean
+JITTER = 0.2
+# Requests generated per window of virtual time
+BATCH_REQUESTS = 20000
+
+EPHEMERAL_PORTS = (32768, 60999)
+WINDOW = 64240
+
+ETHERNET_HEADER_LEN = 14
+IP_HEADER_LEN = 20
+TCP_HEADER_LEN = 20
+RECORD_HEADER_LEN = 16
+HEADERS_LEN = ETHERNET_HEADER_LEN + IP_HEADER_LEN + TCP_HEADER_LEN
+
+SYN, FIN, PSH, ACK = 0x02, 0x01, 0x08, 0x10
+
+
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+ILLEGAL_DATA_VALUE = 3
+
+# Objects of a regular device identification, in order, with the defaults of the slave
+IDENTITY_OBJECTS = [
+    ("vendor_name", "Pymodbus"),
+    ("product_code", "PM"),
+    ("major_minor_revision", "1.0"),
+    ("vendor_url", "http://github.com/riptideio/pymodbus/"),
+    ("product_name", "Pymodbus Server"),
+    ("model_name", "Pymodbus Server"),
+    ("user_application_name", ""),
+]
+
+
+class Packet(NamedTuple):
+    """
+    One of the packets of a request exchange.
+
+    Attributes:
+        from_master (bool): Whether the master sends it.
+        flags (int): TCP flags.
+        latencies (int): One-way delays elapsed since the SYN when it is sent.
+        processing (bool): Whether it is sent after the slave has processed the request.
+        payload (str | None): "request", "response" or None.
+        seq (tuple[int, int, int]): Sequence number relative to the initial one of
+            the sender, as the SYN and FIN, requests and responses sent before it.
+        ack (tuple[int, int, int] | None): Acknowledgment number, likewise relative
+            to the initial sequence number of the receiver.
+    """
+
+    from_master: bool
+    flags: int
+    latencies: int
+    processing: bool
+    payload: str | None
+    seq: tuple[int, int, int]
+    ack: tuple[int, int, int] | None
+
+
+EXCHANGE = [
+    Packet(True, SYN, 0, False, None, (0, 0, 0), None),
+    Packet(False, SYN | ACK, 1, False, None, (0, 0, 0), (1, 0, 0)),
+    Packet(True, ACK, 2, False, None, (1, 0, 0), (1, 0, 0)),
+    Packet(True, PSH | ACK, 2, False, "request", (1, 0, 0), (1, 0, 0)),
+    Packet(False, PSH | ACK, 3, True, "response", (1, 0, 0), (1, 1, 0)),
+    Packet(True, FIN | ACK, 4, True, None, (1, 1, 0), (1, 0, 1)),
+    Packet(False, FIN | ACK, 5, True, None, (1, 0, 1), (2, 1, 0)),
+    Packet(True, ACK, 6, True, None, (2, 1, 0), (2, 0, 1)),
+]
+# A master sends its next request once it has received the response and closed
+BUSY_LATENCIES = 4
+
+
+class PcapSynthesizer:
+    """
+    Generates the capture of a scenario run.
+
+    Attributes:
+        scenario (dict): Scenario, as loaded from config.yaml.
+        latency (float): Mean one-way network delay, in seconds.
+        processing (float): Mean time a slave takes to answer, in seconds.
+        jitter (float): Standard deviation of the delays, as a fraction of their mean.
+        seed (int): Seed of the delays and TCP initial values.
+        start (float): Capture time at which the run starts, in seconds since the epoch.
+        skipped (int): Messages not addressed to any slave of the scenario, which are left out.
+    """
+
+    def __init__(
+        self,
+        scenario: dict[str, Any],
+        latency: float = LATENCY,
+        processing: float = PROCESSING,
+        jitter: float = JITTER,
+        seed: int = 0,
+        start: float = None,
+    ):
+        import numpy as np
+
+        self.scenario = scenario
+        self.latency = latency
+        self.processing = processing
+        self.jitter = jitter
+        self.seed = seed
+        self.start = time.time() if start is None else start
+
+        nodes = scenario.get("nodes") or []
+        masters = [node for node in nodes if node.get("role") == "master"]
+        self._slaves = {}
+        self._identities = {}
+        # Registers of every slave by table and address, as the run starts
+        self._state = []
+        for node in nodes:
+            if node.get("role") == "slave":
+                address = (node["ip"], int(node["port"]))
+                self._slaves.setdefault(address, len(self._state))
+                self._state.append(
+                    {
+                        table: _registers(node.get(table))
+                        for table in set(TABLES.values())
+                    }
+                )
+                self._identities[address] = node.get("identity") or {}
+
+        # One row per message, in the order the masters send simultaneous messages
+        rows = []
+        self.skipped = 0
+        for m, master in enumerate(masters):
+            for message in master.get("messages") or []:
+                slave = self._slaves.get((message["ip"], int(message["port"])))
+                if slave is None:
+                    self.skipped += 1
+                    continue
+                rows.append(
+                    (m, slave, _int(master["ip"]), _int(message["ip"]), message)
+                )
+
+        self._messages = [row[4] for row in rows]
+        self._master = np.array([row[0] for row in rows], dtype=np.int64)
+        self._slave = np.array([row[1] for row in rows], dtype=np.int64)
+        self._master_ip = np.array([row[2] for row in rows], dtype=np.uint32)
+        self._slave_ip = np.array([row[3] for row in rows], dtype=np.uint32)
+        self._port = np.array([int(row[4]["port"]) for row in rows], dtype=np.uint16)
+        self._timestamp = np.array([float(row[4]["timestamp"]) for row in rows])
+        self._interval = np.array(
+            [
+                float(row[4]["interval"]) if row[4].get("recurrent") else math.inf
+                for row in rows
+            ]
+        )
+        if np.any(self._interval <= 0):
+            raise ValueError("Recurrent messages must have a positive interval")
+        self._is_write = np.array(
+            [int(row[4]["function_code"]) in WRITE_FUNCTION_CODES for row in rows],
+            dtype=bool,
+        )
+        self._client = self._master * max(len(self._state), 1) + self._slave
+        self._requests = _pad([_request_adu(message) for message in self._messages])
+        self._initial_responses = [self._respond(j) for j in range(len(rows))]
+        # Values assigned by each write, and the register range each read returns
+        self._assignments = [
+            _assignments(message, self._state[row[1]])
+            for message, row in zip(self._messages, rows)
+        ]
+        self._reads = [[] for _ in self._state]
+        for j, (message, row) in enumerate(zip(self._messages, rows)):
+            function_code = int(message["function_code"])
+            if function_code in TABLES and function_code <= 4:
+                start = int(message["start_address"])
+                stop = start + int(message.get("count") or 0)
+                self._reads[row[1]].append((j, TABLES[function_code], start, stop))
+        self._masters = len(masters)
+        self._initial_state = self._state
+
+    def write(
+        self, file: BinaryIO, duration: float, batch_requests: int = BATCH_REQUESTS
+    ) -> dict[str, int]:
+        """
+        Writes the capture of the first seconds of a run.
+
+        Args:
+            file (BinaryIO): Stream the capture is written to.
+            duration (float): Seconds of the run; requests scheduled later are not sent.
+            batch_requests (int): Approximate number of requests generated at once.
+
+        Returns:
+            dict[str, int]: Number of requests, packets and bytes written.
+        """
+        import numpy as np
+
+        PcapWriter(file, LINKTYPE_ETHERNET)
+        self._rng = np.random.default_rng(self.seed)
+        self._state = copy.deepcopy(self._initial_state)
+        self._responses = list(self._initial_responses)
+        stats = {"requests": 0, "packets": 0, "bytes": 24}
+        # Requests per second of the recurrent messages, to size the windows
+        rate = float(np.sum(1 / self._interval[np.isfinite(self._interval)]))
+        window = batch_requests / rate if rate else duration
+        self._busy = np.full(self._masters, -math.inf)
+        self._sent = np.zeros(self._masters, dtype=np.int64)
+        self._transactions = np.zeros(self._client.max(initial=0) + 1, dtype=np.int64)
+        carry = None
+        begin = 0.0
+        while begin < duration or carry is not None:
+            if begin < duration:
+                end = min(begin + window, duration)
+                records = _merge(carry, self._batch(begin, end))
+                # Packets after the window may come after those of the next one
+                written, carry = (
+                    _split(records, round((self.start + end) * 1e6))
+                    if records is not None
+                    else (None, None)
+                )
+            else:
+                written, carry = carry, None
+            begin = end
+            if written is not None:
+                data = _flatten(written[1], written[2])
+                file.write(memoryview(data))
+                stats["packets"] += len(written[0])
+                stats["bytes"] += len(data)
+        stats["requests"] = stats["packets"] // len(EXCHANGE)
+        return stats
+
+    def save(self, output: str, duration: float, **kwargs) -> dict[str, int]:
+        """
+        Writes the capture of a run to a file, replacing it atomically.
+        """
+        temporary = f"{output}.tmp"
+        with open(temporary, "wb") as f:
+            stats = self.write(f, duration, **kwargs)
+        os.replace(temporary, output)
+        return stats
+
+    def _batch(self, begin: float, end: float):
+        """
+        Builds the records of the requests scheduled in [begin, end).
+
+        Returns:
+            tuple | None: Capture time of every record in microseconds, the records
+                as zero-padded rows, their lengths and tie-breaking order, or None.
+        """
+        import numpy as np
+
+        message, scheduled = self._occurrences(begin, end)
+        if not len(message):
+            return None
+
+        # Requests of a master are sent one after the other, in schedule order
+        order = np.lexsort((message, scheduled, self._master[message]))
+        message, scheduled = message[order], scheduled[order]
+        master = self._master[message]
+        n = len(message)
+        latency = self._delay(self.latency, n)
+        processing = self._delay(self.processing, n)
+        busy = BUSY_LATENCIES * latency + processing
+        sent = _serialize(master, np.maximum(scheduled, self._busy[master]), busy)
+        last = np.r_[master[1:] != master[:-1], True]
+        self._busy[master[last]] = sent[last] + busy[last]
+
+        # Source ports and transaction ids follow on from the previous window
+        rank = _rank(master)
+        source_port = EPHEMERAL_PORTS[0] + (self._sent[master] + rank) % (
+            EPHEMERAL_PORTS[1] - EPHEMERAL_PORTS[0] + 1
+        )
+        np.add.at(self._sent, master, 1)
+        by_time = np.argsort(sent, kind="stable")
+        message, sent, latency, processing, source_port = (
+            a[by_time] for a in (message, sent, latency, processing, source_port)
+        )
+        client = self._client[message]
+        by_client = np.argsort(client, kind="stable")
+        transaction = np.empty(n, dtype=np.int64)
+        transaction[by_client] = self._transactions[client[by_client]] + _rank(
+            client[by_client]
+        )
+        np.add.at(self._transactions, client, 1)
+        transaction = (transaction + 1) & 0xFFFF
+
+        response = self._respond_in_order(message)
+        requests = self._requests
+        responses = _pad(response[0])
+        response_index = response[1]
+
+        isn = self._rng.integers(0, 2**32, size=(2, n), dtype=np.uint64)
+        ip_id = self._rng.integers(0, 2**16, size=(2, n), dtype=np.uint64)
+        lengths = (
+            requests[1][message].astype(np.uint64),
+            responses[1][response_index].astype(np.uint64),
+        )
+        times, records, record_lengths, ties = [], [], [], []
+        sent_count = [0, 0]
+        for kind, packet in enumerate(EXCHANGE):
+            side = 0 if packet.from_master else 1
+            at = sent + packet.latencies * latency + processing * packet.processing
+            if packet.payload == "request":
+                payload = requests[0][message]
+                payload_length = requests[1][message]
+            elif packet.payload == "response":
+                payload = responses[0][response_index]
+                payload_length = responses[1][response_index]
+            else:
+                payload = None
+                payload_length = np.zeros(n, dtype=np.int64)
+            own, other = (0, 1) if packet.from_master else (1, 0)
+            seq = isn[own] + _offset(packet.seq, lengths)
+            ack = (
+                isn[other] + _offset(packet.ack, lengths)
+                if packet.ack is not None
+                else np.zeros(n, dtype=np.uint64)
+            )
+            if payload is not None:
+                # Transaction id of the MBAP header
+                payload = payload.copy()
+                payload[:, 0] = transaction >> 8
+                payload[:, 1] = transaction & 0xFF
+            master_ip, slave_ip = self._master_ip[message], self._slave_ip[message]
+            ports = (source_port, self._port[message])
+            microseconds = np.round((self.start + at) * 1e6).astype(np.int64)
+            frame, frame_length = _frames(
+                microseconds,
+                master_ip if packet.from_master else slave_ip,
+                slave_ip if packet.from_master else master_ip,
+                ports[own],
+                ports[other],
+                seq & 0xFFFFFFFF,
+                ack & 0xFFFFFFFF,
+                packet.flags,
+                (ip_id[side] + sent_count[side]) & 0xFFFF,
+                payload,
+                payload_length,
+            )
+            sent_count[side] += 1
+            times.append(microseconds)
+            records.append(frame)
+            record_lengths.append(frame_length)
+            ties.append(np.full(n, kind, dtype=np.int64))
+        width = max(frame.shape[1] for frame in records)
+        return (
+            np.concatenate(times),
+            np.concatenate(
+                [
+                    np.pad(frame, ((0, 0), (0, width - frame.shape[1])))
+                    for frame in records
+                ]
+            ),
+            np.concatenate(record_lengths),
+            np.concatenate(ties),
+        )
+
+    def _occurrences(self, begin: float, end: float):
+        """
+        Returns the message and scheduled time of every request in [begin, end).
+        """
+        import numpy as np
+
+        timestamp, interval = self._timestamp, self._interval
+        recurrent = np.isfinite(interval)
+        safe = np.where(recurrent, interval, 1.0)
+        first = np.where(
+            recurrent, np.ceil(np.maximum(begin - timestamp, 0) / safe), 0
+        ).astype(np.int64)
+        stop = np.where(
+            recurrent,
+            np.ceil(np.maximum(end - timestamp, 0) / safe),
+            (timestamp >= begin) & (timestamp < end),
+        ).astype(np.int64)
+        count = np.maximum(stop - first, 0)
+        message = np.repeat(np.arange(len(timestamp)), count)
+        k = np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())
+        scheduled = timestamp[message] + k * safe[message]
+        return message, scheduled
+
+    def _delay(self, mean: float, n: int):
+        import numpy as np
+
+        if not self.jitter:
+            return np.full(n, mean)
+        return np.maximum(mean * (1 + self.jitter * self._rng.standard_normal(n)), 0)
+
+    def _respond_in_order(self, message):
+        """
+        Returns the responses to the requests, sent in order, applying their writes to the slaves.
+
+        Returns:
+            tuple[list[bytes], ndarray]: Distinct responses and the index of the response to every request.
+        """
+        import numpy as np
+
+        responses = list(self._responses)
+        current = np.arange(len(responses))
+        index = np.empty(len(message), dtype=np.int64)
+        done = 0
+        for w in np.flatnonzero(self._is_write[message]):
+            j = int(message[w])
+            table, assignments = self._assignments[j]
+            registers = self._state[self._slave[j]][table]
+            changed = [a for a, value in assignments if registers[a] != value]
+            if not changed:
+                continue
+            index[done : w + 1] = current[message[done : w + 1]]
+            done = w + 1
+            for address, value in assignments:
+                registers[address] = value
+            # Later reads of the registers see the new values
+            low, high = min(changed), max(changed)
+            for k, read_table, start, stop in self._reads[self._slave[j]]:
+                if read_table == table and start <= high and low < stop:
+                    responses.append(self._respond(k))
+                    current[k] = len(responses) - 1
+        index[done:] = current[message[done:]]
+        self._responses = [responses[i] for i in current]
+        return responses, index
+
+    def _respond(self, j: int) -> bytes:
+        """
+        Returns the MBAP response of a slave to a message, with transaction id 0.
+        """
+        message = self._messages[j]
+        function_code = int(message["function_code"])
+        slave = int(self._slave[j])
+        if function_code == 43:
+            identity = self._identities[(message["ip"], int(message["port"]))]
+            pdu = _identification(identity)
+        elif function_code not in TABLES:
+            pdu = bytes([function_code | 0x80, ILLEGAL_FUNCTION])
+        else:
+            registers = self._state[slave][TABLES[function_code]]
+            pdu = _answer(message, registers)
+        return _mbap(int(message["slave_id"]), pdu)
+
+
+def _answer(message: dict[str, Any], registers: dict[int, int]) -> bytes:
+    # PDU of the response to a read or write request
+    function_code = int(message["function_code"])
+    start = int(message["start_address"])
+    count = _count(message)
+    if count <= 0:
+        return bytes([function_code | 0x80, ILLEGAL_DATA_VALUE])
+    addresses = range(start, start + count)
+    if any(address not in registers for address in addresses):
+        return bytes([function_code | 0x80, ILLEGAL_DATA_ADDRESS])
+    if function_code <= 4:
+        read = [registers[address] for address in addresses]
+        data = (
+            pack_bits(read) if function_code <= 2 else struct.pack(f"!{count}H", *read)
+        )
+        return bytes([function_code, len(data)]) + data
+    if function_code in (5, 6):
+        return _request_pdu(message)
+    return struct.pack("!BHH", function_code, start, count)
+
+
+def _assignments(message: dict[str, Any], state: dict[str, dict[int, int]]):
+    """
+    Returns the register table a write changes, and the (address, value) pairs it assigns.
+
+    Rejected writes and other requests assign nothing.
+    """
+    function_code = int(message["function_code"])
+    if function_code not in WRITE_FUNCTION_CODES:
+        return None, []
+    table = TABLES[function_code]
+    start = int(message["start_address"])
+    values = _values(message)[: _count(message)]
+    if function_code in (5, 15):
+        values = [int(bool(value)) for value in values]
+    addresses = range(start, start + len(values))
+    if not values or any(address not in state[table] for address in addresses):
+        return table, []
+    return table, list(zip(addresses, values))
+
+
+def _count(message: dict[str, Any]) -> int:
+    # Number of registers a read or write request covers
+    function_code = int(message["function_code"])
+    if function_code <= 4:
+        return int(message.get("count") or 0)
+    if function_code in (5, 6):
+        return 1 if _values(message) else 0
+    return len(_values(message))
+
+
+def _identification(identity: dict[str, Any]) -> bytes:
+    objects = b""
+    count = 0
+    for object_id, (key, default) in enumerate(IDENTITY_OBJECTS):
+        value = str(identity.get(key, default) or "").encode()[:255]
+        if value:
+            objects += bytes([object_id, len(value)]) + value
+            count += 1
+    return bytes([43, 0x0E, 0x02, 0x82, 0x00, 0x00, count]) + objects
+
+
+def _request_pdu(message: dict[str, Any]) -> bytes:
+    function_code = int(message["function_code"])
+    if function_code == 43:
+        return bytes([43, 0x0E, 0x02, 0x00])
+    start = int(message.get("start_address") or 0)
+    values = _values(message)
+    if function_code <= 4:
+        return struct.pack("!BHH", function_code, start, int(message.get("count") or 0))
+    if function_code == 5:
+        return struct.pack("!BHH", 5, start, 0xFF00 if values and values[0] else 0)
+    if function_code == 6:
+        return struct.pack("!BHH", 6, start, values[0] if values else 0)
+    if function_code == 15:
+        data = pack_bits(values)
+    else:
+        data = struct.pack(f"!{len(values)}H", *values)
+    return struct.pack("!BHHB", function_code, start, len(values), len(data)) + data
+
+
+def _request_adu(message: dict[str, Any]) -> bytes:
+    return _mbap(int(message["slave_id"]), _request_pdu(message))
+
+
+def _mbap(unit: int, pdu: bytes) -> bytes:
+    # Transaction id 0, filled in per request
+    return MBAP.pack(0, 0, len(pdu) + 1, unit & 0xFF) + pdu
+
+
+def _values(message: dict[str, Any]) -> list[int]:
+    values = message.get("values") or []
+    if isinstance(values, str):
+        values = [v for v in values.split(",") if v.strip()]
+    return [int(v) & 0xFFFF for v in values]
+
+
+def _registers(block: dict[str, Any] | None) -> dict[int, int]:
+    # Values of a register block by protocol address, as the slave serves them
+    if not block or not block.get("values"):
+        return {}
+    values = block["values"]
+    if block.get("type") == "sparse":
+        return {int(address): int(value) for address, value in values.items()}
+    if isinstance(values, str):
+        values = [v for v in values.split(",") if v.strip()]
+    return {address: int(value) for address, value in enumerate(values)}
+
+
+def _int(ip: str) -> int:
+    return int(ipaddress.ip_address(ip))
+
+
+def _pad(payloads: list[bytes]):
+    """
+    Returns payloads as the rows of a zero-padded byte matrix, and their lengths.
+    """
+    import numpy as np
+
+    width = max((len(p) for p in payloads), default=0)
+    matrix = np.zeros((len(payloads), width), dtype=np.uint8)
+    for i, payload in enumerate(payloads):
+        matrix[i, : len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+    return matrix, np.array([len(p) for p in payloads], dtype=np.int64)
+
+
+def _offset(counts: tuple[int, int, int], lengths):
+    # Sequence number offset: SYN and FIN count plus the payload bytes sent before
+    flags, requests, responses = counts
+    return flags + requests * lengths[0] + responses * lengths[1]
+
+
+def _serialize(group, scheduled, busy):
+    """
+    Returns when each request is sent, given that a group sends one at a time.
+
+    Requests are sorted by group then schedule. A request is sent at its
+    scheduled time or when the previous request of its group is done, whichever
+    is later: with B the running sum of busy times before each request,
+    sent = max over earlier requests k of (scheduled[k] - B[k]) + B.
+    """
+    import numpy as np
+
+    before = np.cumsum(busy) - busy
+    starts = np.r_[0, np.flatnonzero(group[1:] != group[:-1]) + 1]
+    before -= np.repeat(before[starts], np.diff(np.r_[starts, len(group)]))
+    slack = scheduled - before
+    # Offsetting each group above the previous one keeps the maximum from leaking across groups
+    step = np.ptp(slack) + 1 if len(slack) else 0
+    level = np.cumsum(np.r_[0, group[1:] != group[:-1]]) * step
+    return np.maximum.accumulate(slack + level) - level + before
+
+
+def _rank(group):
+    # Position of each element within its group, for elements sorted by group
+    import numpy as np
+
+    starts = np.r_[0, np.flatnonzero(group[1:] != group[:-1]) + 1]
+    sizes = np.diff(np.r_[starts, len(group)])
+    return np.arange(len(group)) - np.repeat(starts, sizes)
+
+
+def _frames(
+    microseconds,
+    src,
+    dst,
+    sport,
+    dport,
+    seq,
+    ack,
+    flags,
+    ip_id,
+    payload,
+    payload_length,
+):
+    """
+    Builds the pcap records of Ethernet/IPv4/TCP frames, one per row, with their checksums.
+
+    Returns:
+        tuple[ndarray, ndarray]: Records zero-padded to the longest one, and their lengths.
+    """
+    import numpy as np
+
+    n = len(src)
+    width = HEADERS_LEN + (payload.shape[1] if payload is not None else 0)
+    rows = np.zeros((n, RECORD_HEADER_LEN + width), dtype=np.uint8)
+    frame_length = HEADERS_LEN + payload_length
+    header = rows[:, :RECORD_HEADER_LEN].view("<u4")
+    header[:, 0] = microseconds // 1000000
+    header[:, 1] = microseconds % 1000000
+    header[:, 2] = frame_length
+    header[:, 3] = frame_length
+
+    frame = rows[:, RECORD_HEADER_LEN:]
+    # Ethernet: locally administered MACs derived from the IPs, as Docker does
+    frame[:, 0:2] = (0x02, 0x42)
+    frame[:, 2:6] = _bytes(dst, ">u4")
+    frame[:, 6:8] = (0x02, 0x42)
+    frame[:, 8:12] = _bytes(src, ">u4")
+    frame[:, 12:14] = (0x08, 0x00)
+
+    ip = frame[:, ETHERNET_HEADER_LEN : ETHERNET_HEADER_LEN + IP_HEADER_LEN]
+    ip[:, 0] = 0x45
+    ip[:, 2:4] = _bytes(IP_HEADER_LEN + TCP_HEADER_LEN + payload_length, ">u2")
+    ip[:, 4:6] = _bytes(ip_id, ">u2")
+    ip[:, 6] = 0x40  # Don't fragment
+    ip[:, 8] = 64
+    ip[:, 9] = 6
+    ip[:, 12:16] = _bytes(src, ">u4")
+    ip[:, 16:20] = _bytes(dst, ">u4")
+    ip[:, 10:12] = _bytes(_checksum(ip), ">u2")
+
+    tcp = frame[:, ETHERNET_HEADER_LEN + IP_HEADER_LEN :]
+    tcp[:, 0:2] = _bytes(sport, ">u2")
+    tcp[:, 2:4] = _bytes(dport, ">u2")
+    tcp[:, 4:8] = _bytes(seq, ">u4")
+    tcp[:, 8:12] = _bytes(ack, ">u4")
+    tcp[:, 12] = (TCP_HEADER_LEN // 4) << 4
+    tcp[:, 13] = flags
+    tcp[:, 14:16] = _bytes(np.full(n, WINDOW), ">u2")
+    if payload is not None:
+        tcp[:, TCP_HEADER_LEN:] = payload
+    # Pseudo header: addresses, protocol and TCP length
+    pseudo = (
+        (src.astype(np.uint64) >> 16)
+        + (src.astype(np.uint64) & 0xFFFF)
+        + (dst.astype(np.uint64) >> 16)
+        + (dst.astype(np.uint64) & 0xFFFF)
+        + 6
+        + TCP_HEADER_LEN
+        + payload_length.astype(np.uint64)
+    )
+    tcp[:, 16:18] = _bytes(_checksum(tcp, pseudo), ">u2")
+    return rows, RECORD_HEADER_LEN + frame_length
+
+
+def _bytes(values, dtype: str):
+    # Big-endian bytes of every value, one row per value
+    import numpy as np
+
+    values = np.asarray(values).astype(dtype)
+    return values.view(np.uint8).reshape(len(values), -1)
+
+
+def _checksum(data, initial=0):
+    """
+    Internet checksum of every row of a byte matrix, whose padding must be zeros.
+    """
+    import numpy as np
+
+    if data.shape[1] % 2:
+        data = np.pad(data, ((0, 0), (0, 1)))
+    words = data.reshape(len(data), -1, 2).astype(np.uint64)
+    total = (words[:, :, 0] << 8 | words[:, :, 1]).sum(axis=1) + initial
+    while np.any(total >> 16):
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total.astype(np.uint16)
+
+
+def _flatten(rows, lengths):
+    # The first lengths[i] bytes of every row, one after the other
+    import numpy as np
+
+    return rows[np.arange(rows.shape[1]) < lengths[:, None]]
+
+
+def _merge(first, second):
+    """
+    Merges two sets of records into one sorted by time, padding them to the same width.
+    """
+    import numpy as np
+
+    parts = [part for part in (first, second) if part is not None]
+    if not parts:
+        return None
+    width = max(part[1].shape[1] for part in parts)
+    rows = np.concatenate(
+        [np.pad(part[1], ((0, 0), (0, width - part[1].shape[1]))) for part in parts]
+    )
+    times, lengths, ties = (
+        np.concatenate([part[i] for part in parts]) for i in (0, 2, 3)
+    )
+    order = np.lexsort((ties, times))
+    return times[order], rows[order], lengths[order], ties[order]
+
+
+def _split(records, end):
+    """
+    Splits sorted records into those captured before end (in microseconds) and the rest.
+    """
+    import numpy as np
+
+    count = int(np.searchsorted(records[0], end))
+    written = tuple(field[:count] for field in records)
+    rest = tuple(field[count:] for field in records)
+    return (written if count else None), (rest if count < len(records[0]) else None)
+
+
+def _load(scenario: str) -> dict[str, Any]:
+    # A config.yaml file, or the name of a scenario of the store
+    if os.path.isfile(scenario):
+        import yaml
+
+        with open(scenario) as f:
+            return yaml.load(f, Loader=yaml_loader())
+    from .scenario_handler import get_python_scenario
+
+    return get_python_scenario(scenario)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Writes the capture of a scenario run without running it."
+    )
+    parser.add_argument("scenario", help="config.yaml file or scenario name")
+    parser.add_argument("output", help="pcap file to write")
+    parser.add_argument("--duration", type=float, required=True, help="seconds")
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--processing", type=float, default=PROCESSING)
+    parser.add_argument("--jitter", type=float, default=JITTER)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", type=float, help="capture start, epoch seconds")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    synthesizer = PcapSynthesizer(
+        _load(args.scenario),
+        args.latency,
+        args.processing,
+        args.jitter,
+        args.seed,
+        args.start,
+    )
+    stats = synthesizer.save(args.output, args.duration)
+    print(
+        f"Wrote {stats['requests']} requests ({stats['packets']} packets, "
+        f"{stats['bytes']} bytes) to {args.output} in {time.perf_counter() - started:.1f}s"
+    )
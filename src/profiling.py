@@ -0,0 +1,137 @@
+"""
+Phase-level timing of the scenario run pipeline.
+
+A ``PhaseTimer`` records the wall-clock offset and duration of every named
+phase of a run, plus point-in-time marks such as the first captured packet.
+Code deep in the pipeline reports phases through the module-level ``phase``
+helper, which records into the timer activated for the current context and
+is a no-op otherwise. Python phases can optionally be profiled with cProfile.
+"""
+
+import contextvars
+import cProfile
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any
+
+_active_timer = contextvars.ContextVar("active_timer", default=None)
+
+
+class PhaseTimer:
+    """
+    Records the timings of the phases of a scenario run.
+
+    Attributes:
+        profile (bool): Whether Python phases are profiled with cProfile.
+        started_at (datetime.datetime): Wall-clock start of the run.
+        phases (list[dict]): Recorded phases, with start offset and duration in seconds.
+        marks (dict[str, float]): Offsets of point-in-time events.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.profile = profile
+        self.started_at = datetime.datetime.now()
+        self.phases = []
+        self.marks = {}
+        self._t0 = time.perf_counter()
+        self._profiles = {}
+        self._profiling = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str, python: bool = True):
+        """
+        Times a phase of the run.
+
+        Args:
+            name (str): Name of the phase.
+            python (bool): Whether the phase runs Python code worth profiling (as opposed to waiting on a subprocess).
+        """
+        profiler = None
+        if self.profile and python and not self._profiling:
+            profiler = cProfile.Profile()
+            self._profiling = True
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if profiler:
+                profiler.disable()
+                self._profiling = False
+                self._profiles[name] = profiler
+            with self._lock:
+                self.phases.append(
+                    {
+                        "name": name,
+                        "start": round(start - self._t0, 6),
+                        "duration": round(duration, 6),
+                    }
+                )
+
+    def mark(self, name: str):
+        """
+        Records a point-in-time event, keeping only its first occurrence.
+
+        Args:
+            name (str): Name of the event.
+        """
+        with self._lock:
+            self.marks.setdefault(name, round(time.perf_counter() - self._t0, 6))
+
+    @contextmanager
+    def activate(self):
+        """
+        Makes this timer the target of the module-level ``phase`` helper in the current context.
+        """
+        token = _active_timer.set(self)
+        try:
+            yield self
+        finally:
+            _active_timer.reset(token)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": self.started_at.isoformat(),
+                "phases": list(self.phases),
+                "marks": dict(self.marks),
+            }
+
+    def save(self, base_path: str) -> str:
+        """
+        Stores the timings as ``<base>.timings.json`` and the profiles as ``<base>.<phase>.prof``.
+
+        Args:
+            base_path (str): Path of the run output (the pcap file); its extension is dropped.
+
+        Returns:
+            str: Path of the timings file.
+        """
+        base = os.path.splitext(base_path)[0]
+        os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+        timings_file = f"{base}.timings.json"
+        with open(timings_file, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        for name, profiler in self._profiles.items():
+            profiler.dump_stats(f"{base}.{name}.prof")
+        return timings_file
+
+
+def phase(name: str, python: bool = True):
+    """
+    Times a phase into the active timer, if any.
+
+    Args:
+        name (str): Name of the phase.
+        python (bool): Whether the phase runs Python code worth profiling.
+    """
+    timer = _active_timer.get()
+    if timer is None:
+        return nullcontext()
+    return timer.phase(name, python)
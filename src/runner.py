@@ -1,14 +1,20 @@
 import datetime
 import os
-import shutil
 import subprocess
 import json
 import threading
 import time
-import yaml
 import logging
 from threading import Lock
 
+from .compose_schema import content_hash
+from .native_backend import NativeBackend
+from .pcap import rescale_timestamps
+from .profiling import PhaseTimer, phase
+from .scenario_config_generator import remove_config
+from .telemetry import TelemetryPublisher
+from .yaml_io import yaml_loader
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
@@ -17,6 +23,12 @@ class ScenarioRunner:
     _lock = Lock()
     _is_running = False
     _instance = None
+    # Compose file whose containers were left running by the last run, and
+    # the hash of the networks they are attached to
+    _kept_compose_file = None
+    _kept_networks = None
+    # Thread of the last run, alive from start() until the run has finished
+    _thread = None
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -32,19 +44,57 @@ class ScenarioRunner:
         simulation_time: int,
         output_file: str = None,
         config_path: str = None,
+        backend: str = "docker",
+        scenario: dict = None,
+        timer: PhaseTimer = None,
+        keep_containers: bool = False,
+        recreate: list[str] = None,
+        time_scale: float = 1.0,
+        nominal_timestamps: bool = False,
     ):
         self.file_path = docker_compose_path
         self.simulation_time = simulation_time
+        # Simulation seconds per wall-clock second; node schedules are sped up
+        # when their configuration is generated
+        self.time_scale = time_scale
+        self.nominal_timestamps = nominal_timestamps
         self.config_path = config_path or "/tmp/ICSCommEmulator"
         self.output_folder = "outputs"
         self.output_file = os.path.join(self.output_folder, output_file)
         self.start_time = None
         self._tcpdump_process = None
+        self.telemetry = None
+        self.backend = backend
+        self.timings = timer or PhaseTimer()
+        self.keep_containers = keep_containers and backend == "docker"
+        self.recreate = recreate or []
+        self.native = (
+            NativeBackend(scenario, self.config_path) if backend == "native" else None
+        )
 
     def get_docker_network_interface(self) -> list[str]:
+        return list(self.compose_networks())[0]
+
+    def compose_networks(self) -> dict:
+        """
+        Returns the networks block of the Docker Compose file.
+
+        Generated files start with it, so the services are not parsed.
+        """
+        import yaml
+
+        header = []
         with open(self.file_path, "r") as file:
-            yaml_file = yaml.safe_load(file)
-        return list(yaml_file["networks"].keys())[0]
+            for line in file:
+                if line.startswith("services:"):
+                    break
+                header.append(line)
+        loader = yaml_loader()
+        networks = (yaml.load("".join(header), Loader=loader) or {}).get("networks")
+        if networks is None:
+            with open(self.file_path, "r") as file:
+                networks = yaml.load(file, Loader=loader)["networks"]
+        return networks
 
     def get_system_interface_name(self, docker_network_name: str) -> str:
         result = subprocess.run(
@@ -56,7 +106,9 @@ class ScenarioRunner:
         network_id = network_data[0]["Id"][:12]
         return "br-" + network_id
 
-    def start_tcpdump(self, interface_name: str) -> subprocess.Popen | None:
+    def start_tcpdump(
+        self, interface_name: str, capture_filter: str = None
+    ) -> subprocess.Popen | None:
         try:
             with open("/dev/null", "w") as stdout_file, open(
                 "/dev/null", "w"
@@ -72,6 +124,8 @@ class ScenarioRunner:
                     "not udp port 5353",  # filter mDNS
                     "and not udp port 1900",  # filter SSDP
                 ]
+                if capture_filter:
+                    command.append(f"and ({capture_filter})")
                 logger.info(
                     f"Starting tcpdump on interface '{interface_name}', saving to '{self.output_file}'"
                 )
@@ -84,37 +138,135 @@ class ScenarioRunner:
             return None
 
     def launch_docker_compose(self):
-        self.ensure_launchable()
-        logger.info("Launching docker compose...")
-        result = subprocess.run(
-            [
-                "docker",
-                "compose",
-                "-f",
-                self.file_path,
-                "up",
-                "--build",
-                "-d",
-                "--remove-orphans",
-            ],
-            capture_output=True,
-            text=True,
+        networks = content_hash(self.compose_networks())
+        incremental = (
+            ScenarioRunner._kept_compose_file == self.file_path
+            and ScenarioRunner._kept_networks == networks
         )
+        if not incremental:
+            if ScenarioRunner._kept_compose_file is not None:
+                # Kept containers are attached to a network with another subnet
+                logger.info("Network changed, stopping the kept containers...")
+                with phase("teardown", python=False):
+                    self.stop_docker_compose()
+                ScenarioRunner._kept_compose_file = None
+                ScenarioRunner._kept_networks = None
+            with phase("remove_network", python=False):
+                self.ensure_launchable()
+        logger.info("Building docker compose images...")
+        with phase("build_images", python=False):
+            result = subprocess.run(
+                ["docker", "compose", "-f", self.file_path, "build"],
+                capture_output=True,
+                text=True,
+            )
+        if result.returncode != 0:
+            logger.error(f"Failed to build docker compose images:\n{result.stderr}")
+            return
+        if incremental and self.recreate:
+            # Containers still running from the last run only need recreating
+            # when their service or their node configuration changed, or when
+            # their registers were written by the last run
+            logger.info(f"Recreating {len(self.recreate)} containers...")
+            with phase("recreate_containers", python=False):
+                result = subprocess.run(
+                    [
+                        "docker",
+                        "compose",
+                        "-f",
+                        self.file_path,
+                        "up",
+                        "-d",
+                        "--no-deps",
+                        "--force-recreate",
+                        *self.recreate,
+                    ],
+                    capture_output=True,
+                    text=True,
+                )
+            if result.returncode != 0:
+                logger.error(f"Failed to recreate containers:\n{result.stderr}")
+                return
+        logger.info("Launching docker compose...")
+        # Includes container creation and the slave healthcheck waits
+        with phase("start_containers", python=False):
+            result = subprocess.run(
+                [
+                    "docker",
+                    "compose",
+                    "-f",
+                    self.file_path,
+                    "up",
+                    "-d",
+                    "--remove-orphans",
+                ],
+                capture_output=True,
+                text=True,
+            )
         if result.returncode != 0:
             logger.error(f"Failed to launch docker compose:\n{result.stderr}")
             return
         logger.info("Starting network traffic capture...")
 
+    def launch(self):
+        if self.native:
+            logger.info("Launching native slaves...")
+            with phase("start_slaves", python=False):
+                self.native.start_slaves()
+        else:
+            self.launch_docker_compose()
+
+    def start_capture(self):
+        if self.native:
+            with phase("start_capture", python=False):
+                self._tcpdump_process = self.start_tcpdump(
+                    self.native.capture_interface, self.native.capture_filter()
+                )
+                self.wait_for_capture()
+            logger.info("Launching native masters...")
+            with phase("start_masters", python=False):
+                self.native.start_masters()
+        else:
+            with phase("start_capture", python=False):
+                iface = self.get_system_interface_name(
+                    self.get_docker_network_interface()
+                )
+                self._tcpdump_process = self.start_tcpdump(iface)
+
+    def wait_for_capture(self, timeout: float = 2.0):
+        # tcpdump creates the output file once the interface is open
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(self.output_file) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def teardown(self):
+        with phase("teardown", python=False):
+            if self.native:
+                logger.info("Stopping native processes...")
+                self.native.stop()
+                logger.info("Native processes stopped.")
+            else:
+                self.stop_docker_compose()
+                ScenarioRunner._kept_compose_file = None
+                ScenarioRunner._kept_networks = None
+
     def ensure_launchable(self):
-        with open(self.file_path, "r") as file:
-            yaml_file = yaml.safe_load(file)
-        network_name = list(yaml_file["networks"].keys())[0]
+        network_name = list(self.compose_networks())[0]
         subprocess.run(["docker", "network", "rm", network_name], text=True)
 
     def stop_docker_compose(self):
         logger.info("Stopping docker compose...")
         result = subprocess.run(
-            ["docker", "compose", "-f", self.file_path, "down", "--timeout", "3"],
+            [
+                "docker",
+                "compose",
+                "-f",
+                self.file_path,
+                "down",
+                "--remove-orphans",
+                "--timeout",
+                "3",
+            ],
             capture_output=True,
             text=True,
         )
@@ -131,47 +283,104 @@ class ScenarioRunner:
         else:
             logger.error("Tcpdump process not found.")
 
+    def start_telemetry(self):
+        self.telemetry = TelemetryPublisher(
+            self.output_file,
+            status_callback=self._progress,
+            first_packet_callback=lambda: self.timings.mark("first_packet"),
+        )
+        self.telemetry.start()
+
+    def stop_telemetry(self):
+        if self.telemetry:
+            self.telemetry.stop()
+
     def run(self):
         with ScenarioRunner._lock:
             if ScenarioRunner._is_running:
                 raise Exception("Another scenario is already running.")
             ScenarioRunner._is_running = True
             self.running = True
+            with self.timings.activate():
+                try:
+                    self.launch()
+                    self.start_capture()
+                    self.timings.mark("capture_started")
+                    self.start_time = datetime.datetime.now()
+                    self.start_telemetry()
+                    time.sleep(self.duration() + 1)
+                    logger.info("Stopping network traffic capture...")
+                    self._tcpdump_process.terminate()
+                    if self.nominal_timestamps and self.time_scale != 1:
+                        self.rescale_capture()
+                    self.running = False
+                    self.stop_telemetry()
+                    if self.keep_containers:
+                        logger.info("Leaving containers running for the next run.")
+                        ScenarioRunner._kept_compose_file = self.file_path
+                        ScenarioRunner._kept_networks = content_hash(
+                            self.compose_networks()
+                        )
+                    else:
+                        self.teardown()
+                        with phase("clean_config"):
+                            self.clean_config_folder()
+                except Exception as e:
+                    logger.error(f"Error during scenario execution: {e}")
+                    self.teardown()
+                finally:
+                    self.stop_telemetry()
+                    self.save_timings()
+                    ScenarioRunner._is_running = False
+                    self.running = False
+                    self.simulation_time = None
+                    self._tcpdump_process = None
+
+    def duration(self) -> float:
+        """
+        Returns the wall-clock seconds the simulation lasts.
+        """
+        return self.simulation_time / self.time_scale
+
+    def rescale_capture(self):
+        """
+        Rewrites the timestamps of the capture back to simulation time, once tcpdump has exited.
+        """
+        with phase("rescale_capture"):
             try:
-                self.launch_docker_compose()
-                iface = self.get_system_interface_name(
-                    self.get_docker_network_interface()
-                )
-                self._tcpdump_process = self.start_tcpdump(iface)
-                self.start_time = datetime.datetime.now()
-                time.sleep(self.simulation_time + 1)
-                logger.info("Stopping network traffic capture...")
-                self._tcpdump_process.terminate()
-                self.running = False
-                self.stop_docker_compose()
-                self.clean_config_folder()
+                self._tcpdump_process.wait(timeout=5)
+                rescale_timestamps(self.output_file, self.time_scale)
             except Exception as e:
-                logger.error(f"Error during scenario execution: {e}")
-                self.stop_docker_compose()
-            finally:
-                ScenarioRunner._is_running = False
-                self.running = False
-                self.simulation_time = None
-                self._tcpdump_process = None
+                logger.error(f"Error rescaling capture timestamps: {e}")
+
+    def save_timings(self):
+        try:
+            timings_file = self.timings.save(self.output_file)
+            logger.info(f"Run timings saved to '{timings_file}'")
+        except Exception as e:
+            logger.error(f"Error saving run timings: {e}")
 
     def clean_config_folder(self):
-        if os.path.exists(self.config_path):
-            shutil.rmtree(self.config_path)
+        remove_config(self.config_path)
 
     def status(self):
         if not self.start_time or not self.running:
             logger.warning("Simulation has not started.")
-            return {"error": "Simulation not started."}
+            response = {"error": "Simulation not started."}
+            if getattr(self, "timings", None):
+                # Timings of the last run stay available once it has finished
+                response["timings"] = self.timings.to_dict()
+            return response
+        return self._progress()
+
+    def _progress(self):
+        if not self.start_time:
+            return {"running": False}
 
         # Calculate elapsed and total time
         elapsed_time = datetime.datetime.now() - self.start_time
         elapsed_seconds = int(elapsed_time.total_seconds())
-        total_seconds = self.simulation_time
+        total_seconds = self.duration()
 
         # Get the size of the pcap file
         pcap_size = (
@@ -183,6 +392,8 @@ class ScenarioRunner:
             "total_seconds": total_seconds,
             "pcap_size": pcap_size,  # bytes
             "running": self.running,
+            "time_scale": self.time_scale,
+            "timings": self.timings.to_dict(),
         }
 
 
@@ -194,27 +405,53 @@ def start(
     simulation_time: int,
     output_file: str,
     config_path: str = None,
+    backend: str = "docker",
+    scenario: dict = None,
+    timer: PhaseTimer = None,
+    keep_containers: bool = False,
+    recreate: list[str] = None,
+    time_scale: float = 1.0,
+    nominal_timestamps: bool = False,
 ) -> str:
     global runner
     if not runner:
         runner = ScenarioRunner()
 
-    if runner._is_running:
+    if is_running():
         logger.error("A scenario is already running.")
         return
-    runner.config(docker_compose_path, simulation_time, output_file, config_path)
-    thread = threading.Thread(target=runner.run)
-    thread.start()
+    runner.config(
+        docker_compose_path,
+        simulation_time,
+        output_file,
+        config_path,
+        backend=backend,
+        scenario=scenario,
+        timer=timer,
+        keep_containers=keep_containers,
+        recreate=recreate,
+        time_scale=time_scale,
+        nominal_timestamps=nominal_timestamps,
+    )
+    ScenarioRunner._thread = threading.Thread(target=runner.run)
+    ScenarioRunner._thread.start()
     return os.path.abspath(runner.output_file)
 
 
+def is_running() -> bool:
+    # The thread is alive before run() has marked the runner as running
+    thread = ScenarioRunner._thread
+    return ScenarioRunner._is_running or (thread is not None and thread.is_alive())
+
+
 def stop():
     global runner
     if not runner:
         logger.error("No scenario is running.")
         return
-    runner.stop_docker_compose()
+    runner.teardown()
     runner.stop_tcpdump()
+    runner.stop_telemetry()
 
 
 def status():
@@ -225,5 +462,13 @@ def status():
     return runner.status()
 
 
+def telemetry_events():
+    global runner
+    if not runner or not runner.telemetry or not runner.telemetry.is_alive():
+        logger.error("No scenario is running.")
+        return
+    return runner.telemetry.events()
+
+
 if __name__ == "__main__":
     start("docker-compose.yml", 10, "output.pcap")
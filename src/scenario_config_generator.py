@@ -2,23 +2,34 @@
 ScenarioConfigGenerator is a class to generate configuration files for a given scenario.
 
 Imports:
-    - yaml: To handle YAML file operations.
+    - yaml: To handle YAML file operations (imported when first needed).
+    - yaml_io: The safe YAML dumper shared with the scenario store.
     - os: To handle file system operations.
-    - numpy as np: To handle numerical operations.
-    - pandas as pd: To handle data manipulation and analysis.
+    - hashlib, json: To track the content of the generated files.
+    - csv, io: To write the master schedules row by row.
     - shutil: To handle high-level file operations.
+    - tempfile: To create the staging directories of new generations.
+    - concurrent.futures: To render node files concurrently.
     - typing: To handle type hints.
 
 Classes:
     - ScenarioConfigGenerator: Main class to generate configuration files for masters and slaves.
 
 Methods:
-    - __init__(self, scenario: dict[str, Any], config_path: str): Initializes the generator with scenario and config path.
+    - __init__(self, scenario: dict[str, Any], config_path: str, time_scale: float = 1.0): Initializes the generator with scenario, config path and time scale.
     - _convert_to_int(x: str) -> str | int: Static method to convert a string to an integer if possible.
-    - _craft_master(self, messages: list[dict[str, Any]], i: int): Creates configuration files for master nodes.
-    - _craft_slave(self, slave: dict[str, Any], i: int): Creates configuration files for slave nodes.
+    - _csv_value(column: str, value: Any) -> Any: Static method to format a message field as a CSV cell.
+    - _craft_master(self, messages: list[dict[str, Any]], i: int): Renders the configuration file of a master node.
+    - _craft_slave(self, slave: dict[str, Any], i: int): Renders the configuration file of a slave node.
     - clean(self): Cleans the configuration path by removing existing files.
-    - generate(self): Generates the configuration files for the scenario.
+    - render(self) -> dict[str, str]: Renders the configuration files of every node.
+    - generate(self, max_workers: int = None): Stages the configuration files of a new generation and swaps it into place.
+    - install(self, source_path: str): Swaps in a copy of previously generated configuration files.
+
+Functions:
+    - copy_config(source_path: str, target_path: str): Copies the files of a configuration folder.
+    - remove_config(config_path: str): Removes a configuration path and the generation it points to.
+    - node_environment(role: str) -> dict[str, str]: Environment variables of the process of a node.
 
 Usage:
     scenario = {
@@ -28,16 +39,24 @@ Usage:
         ]
     }
     generator = ScenarioConfigGenerator(scenario, "/tmp/ICSCommEmulator")
-    generator.generate()
+    changed_nodes = generator.generate()
 """
 
+import csv
+import hashlib
+import io
+import json
+import math
 import os
 import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
-import numpy as np
-import pandas as pd
-import yaml
+from .yaml_io import yaml_dumper
+
+# Hashes of the files written by the last generation, relative to the config path
+MANIFEST_FILE = ".manifest.json"
 
 
 class ScenarioConfigGenerator:
@@ -47,18 +66,26 @@ class ScenarioConfigGenerator:
     Attributes:
         scenario (dict): Dictionary containing the scenario configuration.
         config_path (str): Path to the configuration files.
+        time_scale (float): Factor by which master schedules are sped up.
+        changed_nodes (set[tuple[str, int]]): (role, index) of the nodes whose files changed in the last generation.
     """
 
-    def __init__(self, scenario: dict[str, Any], config_path: str):
+    def __init__(
+        self, scenario: dict[str, Any], config_path: str, time_scale: float = 1.0
+    ):
         """
         Initializes the ScenarioConfigGenerator with scenario and config path.
 
         Args:
             scenario (dict): Dictionary containing the scenario configuration.
             config_path (str): Path to the configuration files.
+            time_scale (float): Factor by which master schedules are sped up: the
+                timestamps and intervals of their messages are divided by it.
         """
         self.scenario = scenario
         self.config_path = config_path
+        self.time_scale = time_scale
+        self.changed_nodes = set()
 
     @staticmethod
     def _convert_to_int(x: str) -> str | int:
@@ -73,66 +100,299 @@ class ScenarioConfigGenerator:
         """
         try:
             return int(x)
-        except ValueError:
+        except (TypeError, ValueError):
             return x
 
-    def _craft_master(self, messages: list[dict[str, Any]], i: int):
+    @staticmethod
+    def _csv_value(column: str, value: Any) -> Any:
         """
-        Creates configuration files for master nodes.
+        Static method to format a message field as a CSV cell.
+
+        Args:
+            column (str): Name of the field.
+            value (Any): Value of the field.
+
+        Returns:
+            Any: Value to write; missing values become empty cells and lists comma-separated values.
+        """
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return ""
+        if isinstance(value, (list, tuple)):
+            return ",".join(str(v) for v in value)
+        if column == "count":
+            return ScenarioConfigGenerator._convert_to_int(value)
+        return value
+
+    def _craft_master(self, messages: list[dict[str, Any]], i: int) -> tuple[str, str]:
+        """
+        Renders the configuration file of a master node.
 
         Args:
             messages (list[dict[str, Any]]): List of messages for the master node.
             i (int): Index of the master node.
+
+        Returns:
+            tuple[str, str]: Path of the file, relative to the config path, and its content.
         """
-        os.makedirs(f"{self.config_path}/masters/{i}", exist_ok=True)
-        df = pd.DataFrame(messages)
-        if not df.empty:
-            df["count"] = (
-                df["count"]
-                .astype(object)
-                .replace(np.nan, "")
-                .apply(ScenarioConfigGenerator._convert_to_int)
+        buffer = io.StringIO()
+        if messages:
+            # Columns in order of first appearance, as in the scenario messages
+            columns = list(
+                dict.fromkeys(key for message in messages for key in message)
             )
-            df.to_csv(f"{self.config_path}/masters/{i}/master.csv", index=False)
-        else:
-            with open(f"{self.config_path}/masters/{i}/master.csv", "w") as f:
-                f.write("")
+            writer = csv.writer(buffer, lineterminator="\n")
+            writer.writerow(columns)
+            if self.time_scale != 1:
+                messages = map(self._scale_message, messages)
+            for message in messages:
+                writer.writerow(
+                    ScenarioConfigGenerator._csv_value(column, message.get(column))
+                    for column in columns
+                )
+        content = buffer.getvalue()
+        return f"masters/{i}/master.csv", content
+
+    def _scale_message(self, message: dict[str, Any]) -> dict[str, Any]:
+        # Times of a message in the sped-up schedule
+        scaled = dict(message)
+        for key in ("timestamp", "interval"):
+            try:
+                scaled[key] = float(message[key]) / self.time_scale
+            except (KeyError, TypeError, ValueError):
+                pass
+        return scaled
 
-    def _craft_slave(self, slave: dict[str, Any], i: int):
+    def _craft_slave(self, slave: dict[str, Any], i: int) -> tuple[str, str]:
         """
-        Creates configuration files for slave nodes.
+        Renders the configuration file of a slave node.
 
         Args:
             slave (dict[str, Any]): Dictionary containing the slave configuration.
             i (int): Index of the slave node.
+
+        Returns:
+            tuple[str, str]: Path of the file, relative to the config path, and its content.
         """
-        os.makedirs(f"{self.config_path}/slaves/{i}", exist_ok=True)
+        # The scenario is kept intact, as it is also used to run the nodes
+        excluded = ("comment", "label", "role", "name", "id")
+        slave = {key: value for key, value in slave.items() if key not in excluded}
 
-        for key in ["comment", "label", "role", "name", "id"]:
-            if key in slave:
-                del slave[key]
+        import yaml
 
-        with open(f"{self.config_path}/slaves/{i}/slave.yaml", "w") as f:
-            yaml.dump(slave, f)
+        return f"slaves/{i}/slave.yaml", yaml.dump(slave, Dumper=yaml_dumper())
 
     def clean(self):
         """
         Cleans the configuration path by removing existing files.
         """
-        if os.path.exists(self.config_path):
-            shutil.rmtree(self.config_path)
+        remove_config(self.config_path)
+
+    def _render_node(self, role: str, node: dict[str, Any], i: int) -> tuple[str, str]:
+        if role == "master":
+            return self._craft_master(node["messages"], i)
+        return self._craft_slave(node, i)
+
+    def _nodes(self) -> list[tuple[str, dict[str, Any], int]]:
+        masters = filter(is_master, self.scenario["nodes"])
+        slaves = filter(is_slave, self.scenario["nodes"])
+        return [("master", node, i) for i, node in enumerate(masters)] + [
+            ("slave", node, i) for i, node in enumerate(slaves)
+        ]
+
+    def render(self) -> dict[str, str]:
+        """
+        Renders the configuration files of every node.
 
-    def generate(self):
+        Returns:
+            dict[str, str]: File contents, keyed by path relative to the config path.
+        """
+        return dict(self._render_node(*node) for node in self._nodes())
+
+    def generate(self, max_workers: int = None) -> set[tuple[str, int]]:
         """
         Generates the configuration files for the scenario.
+
+        Node files are rendered concurrently into a new staging directory next to
+        the config path, which is then atomically swapped in: the config path is a
+        symlink to the current generation, so containers never see a partial tree.
+        Files whose content did not change since the last generation are hard-linked
+        from it instead of being rewritten.
+
+        Args:
+            max_workers (int, optional): Number of rendering threads. Defaults to the ThreadPoolExecutor default.
+
+        Returns:
+            set[tuple[str, int]]: (role, index) of the nodes whose files were written or removed.
+        """
+        previous = self._load_manifest()
+        current = _current_generation(self.config_path) if previous else None
+        staging = self._new_generation()
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(
+                    executor.map(
+                        lambda node: self._stage_node(
+                            staging, current, previous, *node
+                        ),
+                        self._nodes(),
+                    )
+                )
+            manifest = {path: digest for path, digest, _ in results}
+            with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+                json.dump(manifest, f)
+            self._swap(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        changed = [path for path, _, written in results if written]
+        removed = [path for path in previous if path not in manifest]
+        self.changed_nodes = {_node_of(path) for path in changed + removed}
+        return self.changed_nodes
+
+    def install(self, source_path: str) -> set[tuple[str, int]]:
+        """
+        Installs the configuration files of a previous generation, such as a compiled scenario.
+
+        The files are hard-linked from the source into a new generation, which is
+        swapped in like in generate.
+
+        Args:
+            source_path (str): Folder holding the files and their manifest, as written by copy_config.
+
+        Returns:
+            set[tuple[str, int]]: (role, index) of the nodes whose files changed or were removed.
         """
-        self.clean()
+        previous = self._load_manifest()
+        staging = self._new_generation()
+        try:
+            manifest = copy_config(source_path, staging)
+            self._swap(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        changed = [path for path in manifest if previous.get(path) != manifest[path]]
+        removed = [path for path in previous if path not in manifest]
+        self.changed_nodes = {_node_of(path) for path in changed + removed}
+        return self.changed_nodes
+
+    def _stage_node(
+        self,
+        staging: str,
+        current: str | None,
+        previous: dict[str, str],
+        role: str,
+        node: dict[str, Any],
+        i: int,
+    ) -> tuple[str, str, bool]:
+        # Returns (path, hash, whether the file was written rather than linked)
+        path, content = self._render_node(role, node, i)
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        target = os.path.join(staging, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if current and previous.get(path) == digest:
+            try:
+                os.link(os.path.join(current, path), target)
+                return path, digest, False
+            except OSError:
+                pass
+        with open(target, "w") as f:
+            f.write(content)
+        return path, digest, True
+
+    def _new_generation(self) -> str:
+        parent, name = os.path.split(os.path.abspath(self.config_path))
+        parent = os.path.realpath(parent)
+        os.makedirs(parent, exist_ok=True)
+        # Leftovers of generations interrupted before their swap
+        live = _current_generation(self.config_path)
+        for entry in os.listdir(parent):
+            stale = os.path.join(parent, entry)
+            if entry.startswith(f".{name}-") and stale != live:
+                if os.path.islink(stale):
+                    os.remove(stale)
+                else:
+                    shutil.rmtree(stale, ignore_errors=True)
+        staging = tempfile.mkdtemp(prefix=f".{name}-", dir=parent)
+        os.chmod(staging, 0o755)
+        return staging
+
+    def _swap(self, staging: str):
+        """
+        Points the config path to a staged generation and removes the previous one.
+        """
+        old = _current_generation(self.config_path)
+        link = f"{staging}.link"
+        os.symlink(os.path.basename(staging), link)
+        if old and not os.path.islink(self.config_path):
+            # A plain directory cannot be replaced atomically; move it aside first
+            old = f"{staging}.old"
+            os.rename(self.config_path, old)
+        os.replace(link, self.config_path)
+        if old:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def _load_manifest(self) -> dict[str, str]:
+        try:
+            with open(os.path.join(self.config_path, MANIFEST_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+def copy_config(source_path: str, target_path: str) -> dict[str, str]:
+    """
+    Copies the files of a configuration folder listed in its manifest, hard-linking them when possible.
+
+    Generated files are never modified in place, so linked copies stay valid.
 
-        for i, node in enumerate(filter(is_master, self.scenario["nodes"])):
-            self._craft_master(node["messages"], i)
+    Args:
+        source_path (str): Configuration folder (or symlink to a generation) to copy.
+        target_path (str): Folder to copy the files to.
+
+    Returns:
+        dict[str, str]: The manifest of the copied files.
+    """
+    with open(os.path.join(source_path, MANIFEST_FILE), "r") as f:
+        manifest = json.load(f)
+    for path in [*manifest, MANIFEST_FILE]:
+        target = os.path.join(target_path, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(os.path.join(source_path, path), target)
+        except OSError:
+            shutil.copyfile(os.path.join(source_path, path), target)
+    return manifest
+
+
+def remove_config(config_path: str):
+    """
+    Removes a configuration path, along with the generation it points to.
+
+    Args:
+        config_path (str): Path to the configuration files.
+    """
+    if os.path.islink(config_path):
+        target = _current_generation(config_path)
+        os.remove(config_path)
+        if target:
+            shutil.rmtree(target, ignore_errors=True)
+    elif os.path.exists(config_path):
+        shutil.rmtree(config_path)
 
-        for i, node in enumerate(filter(is_slave, self.scenario["nodes"])):
-            self._craft_slave(node, i)
+
+def _current_generation(config_path: str) -> str | None:
+    # Directory currently holding the files of the config path, if any
+    if not os.path.isdir(config_path):
+        return None
+    return os.path.realpath(config_path)
+
+
+def _node_of(path: str) -> tuple[str, int]:
+    # "masters/3/master.csv" -> ("master", 3)
+    folder, index, _ = path.split("/")
+    return folder[:-1], int(index)
 
 
 def is_master(dic):
@@ -141,3 +401,12 @@ def is_master(dic):
 
 def is_slave(dic):
     return dic["role"] == "slave"
+
+
+def node_environment(role: str) -> dict[str, str]:
+    """
+    Returns the environment variables the process of a node runs with, whatever the backend.
+
+    Masters buffer their logs; slaves still write them unbuffered.
+    """
+    return {"PYTHONUNBUFFERED": "1"} if role == "slave" else {}
@@ -1,31 +1,271 @@
-from .cytoscape_adapter import parse_cytoscape_json
+from .compose_schema import content_hash
+from .cytoscape_adapter import cytoscape_to_scenario
+from .layout import layout_scenario
+from .scenario_config_generator import copy_config
+from .yaml_io import yaml_dumper, yaml_loader
 import os
 import json
-import yaml
-from typing import Any
+import hashlib
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, NamedTuple
 
 # SCENARIO_ROOT_FOLDER = os.path.join("web", "scenarios")
 SCENARIO_ROOT_FOLDER = "scenarios"
 os.makedirs(SCENARIO_ROOT_FOLDER, exist_ok=True)
 
+# Index of the scenario metadata; the scenario folders remain the source of truth
+INDEX_FILE = os.path.join(SCENARIO_ROOT_FOLDER, "index.sqlite3")
+INDEX_SORT_COLUMNS = ("name", "protocol", "nodes", "edges", "size", "modified")
 
-def save_scenario(name: str, raw_data: dict[str, Any]):
+_index = None
+_index_lock = threading.Lock()
+
+# Stored config.json bodies, keyed by scenario name
+BODY_CACHE_SIZE = 8
+_bodies = OrderedDict()
+_bodies_lock = threading.Lock()
+
+# Hash of the last config.json that passed ERROR-level validation
+VALIDATED_FILE = ".validated"
+
+# Compiled run artifacts are stored under <scenario>/compiled/<hash>
+COMPILED_FOLDER = "compiled"
+# Bumped whenever the generators change their output, to invalidate stored artifacts
+COMPILED_FORMAT = 1
+# Number of compiled versions kept per scenario
+COMPILED_VERSIONS = 4
+
+
+class ScenarioBody(NamedTuple):
+    etag: str
+    data: bytes
+
+
+class CompiledScenario(NamedTuple):
+    path: str
+    scenario: dict[str, Any]
+    validation: dict[str, Any]
+
+    @property
+    def docker_compose_path(self) -> str:
+        return os.path.join(self.path, "docker-compose.yml")
+
+    @property
+    def config_path(self) -> str:
+        return os.path.join(self.path, "config")
+
+
+def save_scenario(name: str, raw_data: dict[str, Any], validated: bool = False) -> str:
+    """
+    Saves a Cytoscape scenario as config.json, and its scenario form as config.yaml.
+
+    Args:
+        name (str): Name of the scenario.
+        raw_data (dict): Cytoscape scenario.
+        validated (bool): Whether the scenario passed ERROR-level validation, so
+            its stored version can be trusted without being checked again.
+
+    Returns:
+        str: ETag of the saved config.json, as returned by get_scenario_body.
+    """
     scenario_folder = os.path.join(SCENARIO_ROOT_FOLDER, name)
     os.makedirs(scenario_folder, exist_ok=True)
 
     json_file = os.path.join(scenario_folder, "config.json")
     yaml_file = os.path.join(scenario_folder, "config.yaml")
 
-    parsed_data = parse_cytoscape_json(raw_data)
+    # Positions are stored so the editor does not lay out large graphs itself
+    raw_data = layout_scenario(raw_data)
+    # dumps uses the C encoder, unlike dump
+    body = json.dumps(raw_data)
+    etag = hashlib.sha256(body.encode()).hexdigest()
+    with open(f"{json_file}.tmp", "w") as f:
+        f.write(body)
+    os.replace(f"{json_file}.tmp", json_file)
+    if validated:
+        # Only matches the config.json it was written for
+        validated_file = os.path.join(scenario_folder, VALIDATED_FILE)
+        with open(f"{validated_file}.tmp", "w") as f:
+            f.write(etag)
+        os.replace(f"{validated_file}.tmp", validated_file)
+    _write_scenario_yaml(yaml_file, cytoscape_to_scenario(raw_data))
+
+    with _index_lock:
+        _index_scenario(
+            _get_index(),
+            name,
+            raw_data.get("protocol"),
+            len(raw_data["nodes"]),
+            len(raw_data["edges"]),
+        )
+    return etag
+
+
+def save_scenario_stream(
+    name: str,
+    fields: dict[str, Any],
+    nodes: Iterable[tuple[dict[str, Any], dict[str, Any]]],
+    edges: Iterable[dict[str, Any]],
+) -> tuple[int, int]:
+    """
+    Saves a scenario produced element by element, without building it in memory.
+
+    config.json and config.yaml are written as the elements are produced, and are
+    the same as save_scenario would write for the whole scenario.
 
-    with open(json_file, "w") as f:
-        json.dump(raw_data, f)
-    with open(yaml_file, "w") as f:
-        f.write(parsed_data)
+    Args:
+        name (str): Name of the scenario.
+        fields (dict): Top-level fields of the scenario, such as protocol and ip_network.
+        nodes (Iterable[tuple[dict, dict]]): Pairs of Cytoscape node and its scenario node, as converted by cytoscape_to_scenario.
+        edges (Iterable[dict]): Cytoscape edges.
+
+    Returns:
+        tuple[int, int]: Number of nodes and edges saved.
+    """
+    scenario_folder = os.path.join(SCENARIO_ROOT_FOLDER, name)
+    created = not os.path.isdir(scenario_folder)
+    os.makedirs(scenario_folder, exist_ok=True)
+    json_file = os.path.join(scenario_folder, "config.json")
+    yaml_file = os.path.join(scenario_folder, "config.yaml")
+    try:
+        hashes, edge_count = _write_scenario_stream(
+            json_file, yaml_file, fields, nodes, edges
+        )
+    except BaseException:
+        # A failed save leaves the store as it was
+        for path in (f"{json_file}.tmp", f"{yaml_file}.tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+        if created:
+            shutil.rmtree(scenario_folder, ignore_errors=True)
+        raise
+    os.replace(f"{json_file}.tmp", json_file)
+    os.replace(f"{yaml_file}.tmp", yaml_file)
+    with open(os.path.join(scenario_folder, ".config.yaml.hashes.json"), "w") as f:
+        json.dump(hashes, f)
+
+    with _index_lock:
+        _index_scenario(
+            _get_index(), name, fields.get("protocol"), len(hashes), edge_count
+        )
+    return len(hashes), edge_count
+
+
+def _write_scenario_stream(
+    json_file: str,
+    yaml_file: str,
+    fields: dict[str, Any],
+    nodes: Iterable[tuple[dict[str, Any], dict[str, Any]]],
+    edges: Iterable[dict[str, Any]],
+) -> tuple[list[str], int]:
+    # Writes config.json.tmp and config.yaml.tmp, returns the node hashes and edge count
+    import yaml
+
+    dumper = yaml_dumper()
+    hashes = []
+    edge_count = 0
+    # The scenario only keeps these fields, as in cytoscape_to_scenario
+    scenario_fields = {key: fields[key] for key in ("protocol", "ip_network")}
+    header = {key: value for key, value in scenario_fields.items() if key < "nodes"}
+    footer = {key: value for key, value in scenario_fields.items() if key > "nodes"}
+    with open(f"{json_file}.tmp", "w") as json_out, open(
+        f"{yaml_file}.tmp", "w"
+    ) as yaml_out:
+        # Same layout as json.dumps of {**fields, "nodes": ..., "edges": ...}
+        json_out.write(json.dumps(fields)[:-1] + (", " if fields else ""))
+        json_out.write('"nodes": [')
+        if header:
+            yaml_out.write(yaml.dump(header, Dumper=dumper, default_flow_style=False))
+        for i, (node, scenario_node) in enumerate(nodes):
+            if i == 0:
+                yaml_out.write("nodes:\n")
+            json_out.write(", " * (i > 0) + json.dumps(node))
+            hashes.append(content_hash(scenario_node))
+            yaml_out.write(
+                yaml.dump([scenario_node], Dumper=dumper, default_flow_style=False)
+            )
+        if not hashes:
+            yaml_out.write("nodes: []\n")
+        if footer:
+            yaml_out.write(yaml.dump(footer, Dumper=dumper, default_flow_style=False))
+        json_out.write('], "edges": [')
+        for edge in edges:
+            json_out.write(", " * (edge_count > 0) + json.dumps(edge))
+            edge_count += 1
+        json_out.write("]}")
+    return hashes, edge_count
 
 
 def get_created_scenarios() -> list[str]:
-    return os.listdir(SCENARIO_ROOT_FOLDER)
+    with _index_lock:
+        return [
+            row[0]
+            for row in _get_index().execute("SELECT name FROM scenarios ORDER BY name")
+        ]
+
+
+def list_scenarios(
+    offset: int = 0,
+    limit: int = 100,
+    protocol: str = None,
+    search: str = None,
+    sort: str = "name",
+    descending: bool = False,
+) -> tuple[int, list[dict[str, Any]]]:
+    """
+    Lists the metadata of the saved scenarios from the index, without reading them.
+
+    Args:
+        offset (int): Number of matching scenarios to skip.
+        limit (int): Maximum number of scenarios to return.
+        protocol (str, optional): Only list scenarios of this protocol.
+        search (str, optional): Only list scenarios whose name contains this text.
+        sort (str): Column to sort by, one of INDEX_SORT_COLUMNS.
+        descending (bool): Sort in descending order.
+
+    Returns:
+        tuple[int, list[dict]]: Number of matching scenarios, and the requested page of their metadata.
+    """
+    if sort not in INDEX_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort scenarios by {sort}")
+    conditions, parameters = [], []
+    if protocol:
+        conditions.append("protocol = ?")
+        parameters.append(protocol)
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("name LIKE ? ESCAPE '\\'")
+        parameters.append(f"%{escaped}%")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = f"{sort} {'DESC' if descending else 'ASC'}, name"
+
+    with _index_lock:
+        index = _get_index()
+        (total,) = index.execute(
+            f"SELECT COUNT(*) FROM scenarios {where}", parameters
+        ).fetchone()
+        cursor = index.execute(
+            f"SELECT {', '.join(INDEX_SORT_COLUMNS)} FROM scenarios {where} "
+            f"ORDER BY {order} LIMIT ? OFFSET ?",
+            [*parameters, limit, offset],
+        )
+        rows = [dict(zip(INDEX_SORT_COLUMNS, row)) for row in cursor]
+    return total, rows
+
+
+def sync_scenario_index():
+    """
+    Brings the index up to date with the scenario folders.
+
+    Only scenarios whose config.json changed since they were indexed are read.
+    """
+    with _index_lock:
+        _sync_index(_get_index())
 
 
 def get_cytoscape_scenario(name: str) -> dict[str, Any]:
@@ -35,6 +275,66 @@ def get_cytoscape_scenario(name: str) -> dict[str, Any]:
         return json.load(f)
 
 
+def get_stored_scenario(name: str) -> tuple[dict[str, Any], bool]:
+    """
+    Loads the stored config.json of a scenario, and whether it passed validation when saved.
+
+    Scenarios generated or imported without going through validation, or whose
+    config.json changed since, are reported as not validated.
+
+    Args:
+        name (str): Name of the scenario.
+
+    Returns:
+        tuple[dict, bool]: The Cytoscape scenario, and whether it is known to pass ERROR-level validation.
+
+    Raises:
+        OSError: If the scenario does not exist.
+    """
+    body = get_scenario_body(name)
+    try:
+        with open(os.path.join(SCENARIO_ROOT_FOLDER, name, VALIDATED_FILE)) as f:
+            validated = f.read().strip() == body.etag
+    except OSError:
+        validated = False
+    return json.loads(body.data), validated
+
+
+def get_scenario_body(name: str) -> ScenarioBody:
+    """
+    Returns the stored config.json of a scenario as bytes, along with a hash of its content.
+
+    Bodies are cached in memory for as long as the file is unchanged.
+
+    Args:
+        name (str): Name of the scenario.
+
+    Returns:
+        ScenarioBody: ETag (hex SHA-256 of the content) and content of config.json.
+
+    Raises:
+        OSError: If the scenario does not exist.
+    """
+    json_file = os.path.join(SCENARIO_ROOT_FOLDER, name, "config.json")
+    stat = os.stat(json_file)
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _bodies_lock:
+        cached = _bodies.get(name)
+        if cached and cached[0] == key:
+            _bodies.move_to_end(name)
+            return cached[1]
+
+    with open(json_file, "rb") as f:
+        data = f.read()
+    body = ScenarioBody(hashlib.sha256(data).hexdigest(), data)
+    with _bodies_lock:
+        _bodies[name] = (key, body)
+        _bodies.move_to_end(name)
+        if len(_bodies) > BODY_CACHE_SIZE:
+            _bodies.popitem(last=False)
+    return body
+
+
 def check_scenario_exists(name: str) -> bool:
     return os.path.exists(os.path.join(SCENARIO_ROOT_FOLDER, name))
 
@@ -42,5 +342,271 @@ def check_scenario_exists(name: str) -> bool:
 def get_python_scenario(name: str) -> dict[str, Any]:
     scenario_folder = os.path.join(SCENARIO_ROOT_FOLDER, name)
     yaml_file = os.path.join(scenario_folder, "config.yaml")
+    import yaml
+
     with open(yaml_file, "r") as f:
-        return yaml.safe_load(f)
+        return yaml.load(f, Loader=yaml_loader())
+
+
+def get_scenario_hash(name: str, *context: str) -> str:
+    """
+    Hashes the content of a scenario, without parsing it.
+
+    Args:
+        name (str): Name of the scenario.
+        *context (str): Run settings the compiled artifacts depend on, such as the config path.
+
+    Returns:
+        str: Hex SHA-256 digest identifying the compiled artifacts of the scenario.
+    """
+    digest = hashlib.sha256(f"{COMPILED_FORMAT}\0".encode())
+    for value in context:
+        digest.update(f"{value}\0".encode())
+    with open(os.path.join(SCENARIO_ROOT_FOLDER, name, "config.yaml"), "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def get_compiled_scenario(name: str, key: str) -> CompiledScenario | None:
+    """
+    Loads the compiled artifacts of a scenario, if they were stored.
+
+    Args:
+        name (str): Name of the scenario.
+        key (str): Hash returned by get_scenario_hash.
+
+    Returns:
+        CompiledScenario | None: The compiled scenario, or None if there is none for this hash.
+    """
+    path = os.path.join(SCENARIO_ROOT_FOLDER, name, COMPILED_FOLDER, key)
+    try:
+        with open(os.path.join(path, "validation.json"), "r") as f:
+            validation = json.load(f)
+        with open(os.path.join(path, "scenario.json"), "r") as f:
+            scenario = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Keeps recently used versions from being pruned
+    os.utime(path)
+    return CompiledScenario(path, scenario, validation)
+
+
+def store_compiled_scenario(
+    name: str,
+    key: str,
+    scenario: dict[str, Any],
+    docker_compose_path: str,
+    config_path: str,
+    validation: dict[str, Any],
+) -> CompiledScenario:
+    """
+    Stores the artifacts generated for a scenario, to be reused by later runs.
+
+    The artifacts are written to a temporary folder that is renamed into place,
+    so a compiled scenario is either complete or absent.
+
+    Args:
+        name (str): Name of the scenario.
+        key (str): Hash returned by get_scenario_hash.
+        scenario (dict): Parsed scenario.
+        docker_compose_path (str): Generated Docker Compose file.
+        config_path (str): Generated node configuration files.
+        validation (dict): Result of the validation of the Docker Compose file.
+
+    Returns:
+        CompiledScenario: The stored compiled scenario.
+    """
+    compiled_folder = os.path.join(SCENARIO_ROOT_FOLDER, name, COMPILED_FOLDER)
+    os.makedirs(compiled_folder, exist_ok=True)
+    path = os.path.join(compiled_folder, key)
+    staging = tempfile.mkdtemp(prefix=f".{key}-", dir=compiled_folder)
+    try:
+        compiled = CompiledScenario(staging, scenario, validation)
+        folder, file_name = os.path.split(docker_compose_path)
+        shutil.copyfile(docker_compose_path, compiled.docker_compose_path)
+        shutil.copyfile(
+            os.path.join(folder, f".{file_name}.hashes.json"),
+            os.path.join(staging, ".docker-compose.yml.hashes.json"),
+        )
+        copy_config(config_path, compiled.config_path)
+        with open(os.path.join(staging, "scenario.json"), "w") as f:
+            json.dump(scenario, f)
+        with open(os.path.join(staging, "validation.json"), "w") as f:
+            json.dump(validation, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    _prune_compiled(compiled_folder)
+    return CompiledScenario(path, scenario, validation)
+
+
+def update_compiled_validation(compiled: CompiledScenario, validation: dict[str, Any]):
+    validation_file = os.path.join(compiled.path, "validation.json")
+    with open(f"{validation_file}.tmp", "w") as f:
+        json.dump(validation, f)
+    os.replace(f"{validation_file}.tmp", validation_file)
+
+
+def _prune_compiled(compiled_folder: str):
+    versions = sorted(
+        (
+            entry
+            for entry in os.scandir(compiled_folder)
+            if entry.is_dir() and not entry.name.startswith(".")
+        ),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in versions[COMPILED_VERSIONS:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _get_index() -> sqlite3.Connection:
+    # Opened and synchronized with the scenario folders on first use
+    global _index
+    if _index is None:
+        index = sqlite3.connect(INDEX_FILE, check_same_thread=False)
+        with index:
+            index.execute("""CREATE TABLE IF NOT EXISTS scenarios (
+                    name TEXT PRIMARY KEY,
+                    protocol TEXT,
+                    nodes INTEGER,
+                    edges INTEGER,
+                    size INTEGER,
+                    modified REAL
+                )""")
+            index.execute(
+                "CREATE INDEX IF NOT EXISTS scenarios_protocol ON scenarios (protocol)"
+            )
+            index.execute(
+                "CREATE INDEX IF NOT EXISTS scenarios_modified ON scenarios (modified)"
+            )
+        _sync_index(index)
+        _index = index
+    return _index
+
+
+def _sync_index(index: sqlite3.Connection):
+    indexed = {
+        name: (size, modified)
+        for name, size, modified in index.execute(
+            "SELECT name, size, modified FROM scenarios"
+        )
+    }
+    found = set()
+    rows = []
+    for entry in os.scandir(SCENARIO_ROOT_FOLDER):
+        if not entry.is_dir():
+            continue
+        try:
+            size, modified = _scenario_stat(entry.name)
+        except OSError:
+            continue
+        found.add(entry.name)
+        if indexed.get(entry.name) != (size, modified):
+            try:
+                data = get_cytoscape_scenario(entry.name)
+                rows.append(
+                    _index_row(
+                        entry.name,
+                        data.get("protocol"),
+                        len(data["nodes"]),
+                        len(data["edges"]),
+                    )
+                )
+            except (OSError, ValueError, KeyError, TypeError):
+                found.discard(entry.name)
+    removed = [(name,) for name in indexed if name not in found]
+    with index:
+        index.executemany(
+            "INSERT OR REPLACE INTO scenarios VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        index.executemany("DELETE FROM scenarios WHERE name = ?", removed)
+
+
+def _scenario_stat(name: str) -> tuple[int, float]:
+    scenario_folder = os.path.join(SCENARIO_ROOT_FOLDER, name)
+    json_stat = os.stat(os.path.join(scenario_folder, "config.json"))
+    size = json_stat.st_size
+    try:
+        size += os.stat(os.path.join(scenario_folder, "config.yaml")).st_size
+    except OSError:
+        pass
+    return size, json_stat.st_mtime
+
+
+def _index_scenario(
+    index: sqlite3.Connection, name: str, protocol: str, nodes: int, edges: int
+):
+    with index:
+        index.execute(
+            "INSERT OR REPLACE INTO scenarios VALUES (?, ?, ?, ?, ?, ?)",
+            _index_row(name, protocol, nodes, edges),
+        )
+
+
+def _index_row(name: str, protocol: str, nodes: int, edges: int) -> tuple:
+    size, modified = _scenario_stat(name)
+    return (name, protocol, nodes, edges, size, modified)
+
+
+def _write_scenario_yaml(yaml_file: str, scenario: dict[str, Any]):
+    """
+    Writes the YAML form of a scenario, as parse_cytoscape_json would.
+
+    Every node is a separate block of the ``nodes`` sequence; blocks of nodes
+    whose content did not change since the last write are reused rather than
+    dumped again. Their hashes are kept in a ``.config.yaml.hashes.json`` sidecar.
+    """
+    import yaml
+
+    dumper = yaml_dumper()
+    folder, file_name = os.path.split(yaml_file)
+    hashes_file = os.path.join(folder, f".{file_name}.hashes.json")
+
+    hashes = [content_hash(node) for node in scenario["nodes"]]
+    previous = _load_yaml_blocks(yaml_file, hashes_file)
+    blocks = [
+        previous.get(digest)
+        or yaml.dump([node], Dumper=dumper, default_flow_style=False)
+        for node, digest in zip(scenario["nodes"], hashes)
+    ]
+
+    header = {key: value for key, value in scenario.items() if key < "nodes"}
+    footer = {key: value for key, value in scenario.items() if key > "nodes"}
+    with open(f"{yaml_file}.tmp", "w") as f:
+        if header:
+            f.write(yaml.dump(header, Dumper=dumper, default_flow_style=False))
+        f.write("nodes:\n" if blocks else "nodes: []\n")
+        f.writelines(blocks)
+        if footer:
+            f.write(yaml.dump(footer, Dumper=dumper, default_flow_style=False))
+    os.replace(f"{yaml_file}.tmp", yaml_file)
+    with open(hashes_file, "w") as f:
+        json.dump(hashes, f)
+
+
+def _load_yaml_blocks(yaml_file: str, hashes_file: str) -> dict[str, str]:
+    # Node blocks of the previous YAML file, keyed by the hash of the node
+    try:
+        with open(hashes_file, "r") as f:
+            hashes = json.load(f)
+        with open(yaml_file, "r") as f:
+            text = f.read()
+    except (OSError, ValueError):
+        return {}
+
+    start = text.find("nodes:\n")
+    if start != 0 and text[start - 1 : start] != "\n":
+        return {}
+    start += len("nodes:\n")
+    # The sequence ends at the next top-level key
+    end = re.search(r"^[^\s-]", text[start:], re.MULTILINE)
+    nodes = text[start : start + end.start()] if end else text[start:]
+    blocks = re.split(r"^(?=- )", nodes, flags=re.MULTILINE)[1:]
+    if len(blocks) != len(hashes):
+        # The file was edited by hand or is not ours
+        return {}
+    return dict(zip(hashes, blocks))
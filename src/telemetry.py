@@ -0,0 +1,245 @@
+"""
+Live run telemetry.
+
+A single ``TelemetryPublisher`` thread follows the capture written by tcpdump,
+feeds every decoded packet into a ``PacketCounter`` and publishes one snapshot
+per interval to every subscriber. Dashboard clients receive the snapshots as
+Server-Sent Events, so the capture is read once no matter how many clients are
+watching a run.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable
+
+from .pcap import PcapStreamParser, decode_packet, is_modbus_request
+
+logger = logging.getLogger(__name__)
+
+
+class PacketCounter:
+    """
+    Thread-safe traffic counters, reported as rates between consecutive snapshots.
+
+    Attributes:
+        modbus_ports (tuple[int]): Ports on which Modbus servers listen.
+    """
+
+    def __init__(self, modbus_ports=(502,)):
+        self.modbus_ports = tuple(modbus_ports)
+        self._lock = threading.Lock()
+        self._packets = 0
+        self._bytes = 0
+        self._modbus_requests = 0
+        self._nodes = {}
+        self._last = (time.monotonic(), 0, 0, 0, {})
+
+    def update(self, packet):
+        """
+        Accounts a decoded packet.
+
+        Args:
+            packet (PacketInfo): Packet decoded from the capture.
+        """
+        with self._lock:
+            self._packets += 1
+            self._bytes += packet.length
+            if is_modbus_request(packet, self.modbus_ports):
+                self._modbus_requests += 1
+            # [packets sent, bytes sent, packets received, bytes received]
+            src = self._nodes.setdefault(packet.src, [0, 0, 0, 0])
+            src[0] += 1
+            src[1] += packet.length
+            dst = self._nodes.setdefault(packet.dst, [0, 0, 0, 0])
+            dst[2] += 1
+            dst[3] += packet.length
+
+    @property
+    def packets(self) -> int:
+        return self._packets
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Returns totals and per-second rates since the previous snapshot.
+
+        Returns:
+            dict[str, Any]: Traffic totals, rates and per-node activity.
+        """
+        now = time.monotonic()
+        with self._lock:
+            packets, nbytes, requests = (
+                self._packets,
+                self._bytes,
+                self._modbus_requests,
+            )
+            nodes = {ip: list(c) for ip, c in self._nodes.items()}
+            last_time, last_packets, last_bytes, last_requests, last_nodes = self._last
+            self._last = (now, packets, nbytes, requests, nodes)
+
+        elapsed = max(now - last_time, 1e-6)
+        node_activity = {}
+        for ip, (sent, bytes_sent, received, bytes_received) in nodes.items():
+            previous = last_nodes.get(ip, (0, 0, 0, 0))
+            node_activity[ip] = {
+                "packets_sent": sent,
+                "packets_received": received,
+                "bytes_sent": bytes_sent,
+                "bytes_received": bytes_received,
+                "packets_per_second": round(
+                    (sent + received - previous[0] - previous[2]) / elapsed, 2
+                ),
+            }
+
+        return {
+            "packets": packets,
+            "bytes": nbytes,
+            "modbus_requests": requests,
+            "packets_per_second": round((packets - last_packets) / elapsed, 2),
+            "bytes_per_second": round((nbytes - last_bytes) / elapsed, 2),
+            "modbus_requests_per_second": round(
+                (requests - last_requests) / elapsed, 2
+            ),
+            "nodes": node_activity,
+        }
+
+
+class TelemetryPublisher(threading.Thread):
+    """
+    Follows a growing pcap file and broadcasts traffic snapshots to subscribers.
+
+    Attributes:
+        capture_file (str): Path of the capture being written by tcpdump.
+        counter (PacketCounter): Counter fed with every captured packet.
+        interval (float): Seconds between published snapshots.
+        status_callback (Callable): Returns run status fields merged into every snapshot.
+        first_packet_callback (Callable): Called once, when the first packet is captured.
+    """
+
+    def __init__(
+        self,
+        capture_file: str,
+        interval: float = 1.0,
+        status_callback: Callable[[], dict[str, Any]] = None,
+        modbus_ports=(502,),
+        first_packet_callback: Callable[[], None] = None,
+    ):
+        super().__init__(daemon=True)
+        self.capture_file = capture_file
+        self.counter = PacketCounter(modbus_ports)
+        self.interval = interval
+        self.status_callback = status_callback
+        self.first_packet_callback = first_packet_callback
+        self.latest = None
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def subscribe(self, maxsize: int = 16) -> queue.Queue:
+        """
+        Registers a new subscriber.
+
+        Args:
+            maxsize (int): Snapshots buffered for a slow client before older ones are dropped.
+
+        Returns:
+            queue.Queue: Queue receiving snapshots, and None once the run has finished.
+        """
+        subscriber = queue.Queue(maxsize=maxsize)
+        with self._subscribers_lock:
+            self._subscribers.add(subscriber)
+        if self.latest is not None:
+            subscriber.put_nowait(self.latest)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._subscribers_lock:
+            self._subscribers.discard(subscriber)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        parser = PcapStreamParser()
+        next_publish = time.monotonic() + self.interval
+        capture = None
+        try:
+            while not self._stop_event.is_set():
+                if capture is None and os.path.exists(self.capture_file):
+                    capture = open(self.capture_file, "rb")
+                chunk = capture.read(1 << 16) if capture else b""
+                if chunk:
+                    for record in parser.feed(chunk):
+                        packet = decode_packet(parser.linktype, record)
+                        if packet:
+                            self.counter.update(packet)
+                    if self.first_packet_callback and self.counter.packets:
+                        self.first_packet_callback()
+                        self.first_packet_callback = None
+                if time.monotonic() >= next_publish:
+                    self._publish(self._build_snapshot())
+                    next_publish += self.interval
+                if not chunk:
+                    self._stop_event.wait(min(0.1, self.interval))
+        except Exception as e:
+            logger.error(f"Error reading capture for telemetry: {e}")
+        finally:
+            if capture:
+                capture.close()
+            final = self._build_snapshot()
+            final["running"] = False
+            self._publish(final)
+            self._publish(None)
+
+    def _build_snapshot(self) -> dict[str, Any]:
+        snapshot = self.counter.snapshot()
+        if self.status_callback:
+            try:
+                snapshot.update(self.status_callback())
+            except Exception as e:
+                logger.warning(f"Could not fetch run status for telemetry: {e}")
+        return snapshot
+
+    def _publish(self, snapshot: dict[str, Any] | None):
+        if snapshot is not None:
+            self.latest = snapshot
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(snapshot)
+            except queue.Full:
+                # Drop the oldest snapshot so slow clients always get recent data
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait(snapshot)
+
+    def events(self, heartbeat: float = 15.0):
+        """
+        Yields the snapshots of this run formatted as Server-Sent Events.
+
+        Args:
+            heartbeat (float): Seconds of silence after which a keep-alive comment is sent.
+
+        Yields:
+            str: SSE-formatted messages, ending after the final snapshot.
+        """
+        subscriber = self.subscribe()
+        try:
+            while True:
+                try:
+                    snapshot = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if snapshot is None:
+                    yield "event: end\ndata: {}\n\n"
+                    return
+                yield f"data: {json.dumps(snapshot)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
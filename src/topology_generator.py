@@ -0,0 +1,301 @@
+"""
+Procedural generation of large scenarios.
+
+``TopologyGenerator`` describes a scenario by parameters: numbers of masters
+and slaves, how masters are assigned to slaves (fan-out pattern), which
+messages every master sends to each of its slaves (polling profile) and which
+registers the slaves expose (register template). Nodes and edges are produced
+as lazy streams and saved with ``save_scenario_stream``, so scenarios of
+hundreds of thousands of elements never exist in memory as a whole: only the
+slave indices polled by each master are kept.
+"""
+
+import ipaddress
+import random
+from array import array
+from typing import Any, Iterator
+
+from .cytoscape_adapter import (
+    PROTOCOL,
+    REGISTER_KEYS,
+    cytoscape_node,
+    scenario_message,
+    scenario_node,
+)
+from .layout import layered_position
+from .scenario_handler import save_scenario_stream
+
+FANOUT_PATTERNS = ("round_robin", "block", "random", "full")
+
+
+def _read(function_code, start_address, interval, count=1, timestamp=0):
+    return {
+        "timestamp": timestamp,
+        "recurrent": True,
+        "interval": interval,
+        "function_code": function_code,
+        "start_address": start_address,
+        "count": count,
+        "values": [],
+    }
+
+
+# Messages sent by a master to each of its slaves
+POLLING_PROFILES = {
+    "periodic": [_read(3, 0, 1, count=10)],
+    "mixed": [
+        _read(3, 0, 1, count=10),
+        _read(1, 0, 2, count=8),
+        _read(4, 0, 5, count=4, timestamp=1),
+        {
+            "timestamp": 2,
+            "recurrent": False,
+            "interval": 1,
+            "function_code": 6,
+            "start_address": 0,
+            "count": 1,
+            "values": [1],
+        },
+    ],
+    "sparse": [_read(3, 0, 10, count=2)],
+}
+
+
+def _registers(values):
+    return {"type": "sequential", "values": values}
+
+
+# Registers exposed by every slave
+REGISTER_TEMPLATES = {
+    "empty": {key: _registers("") for key in REGISTER_KEYS},
+    "counters": {
+        "holding_registers": _registers(list(range(10))),
+        "coils": _registers([0, 1] * 4),
+        "discrete_inputs": _registers([1, 0] * 4),
+        "input_registers": _registers(list(range(100, 104))),
+    },
+}
+
+
+class TopologyGenerator:
+    """
+    Generates a scenario of masters polling slaves from a few parameters.
+
+    Masters get the first addresses of the network, from the third one on, followed
+    by the slaves, as in generate_network_nodes. Every node is given its position
+    in the layered layout.
+
+    Attributes:
+        protocol (str): Protocol of the scenario.
+        ip_network (ipaddress.IPv4Network): Network of the scenario.
+        masters (int): Number of masters.
+        slaves (int): Number of slaves.
+        fanout (str): How masters are assigned to slaves, one of FANOUT_PATTERNS:
+            round_robin (slave j is polled by master j mod masters and the next ones),
+            block (contiguous groups of slaves per master), random or full (every
+            master polls every slave).
+        masters_per_slave (int): Number of masters polling each slave; ignored by full.
+        polling (list[dict]): Messages sent by a master to each of its slaves.
+        registers (dict): Registers of every slave.
+        seed (int): Seed of the random fan-out.
+    """
+
+    def __init__(
+        self,
+        masters: int,
+        slaves: int,
+        ip_network: str = "10.0.0.0/16",
+        protocol: str = PROTOCOL.MODBUS.value,
+        fanout: str = "round_robin",
+        masters_per_slave: int = 1,
+        polling: str | list[dict[str, Any]] = "periodic",
+        registers: str | dict[str, Any] = "empty",
+        seed: int = 0,
+    ):
+        """
+        Raises:
+            ValueError: If a parameter is invalid or the nodes do not fit in the network.
+        """
+        self.protocol = PROTOCOL(protocol).value
+        self.ip_network = ipaddress.ip_network(ip_network)
+        self.masters = int(masters)
+        self.slaves = int(slaves)
+        if self.masters < 1 or self.slaves < 0:
+            raise ValueError("A topology needs at least one master")
+        if self.masters + self.slaves > self.ip_network.num_addresses - 3:
+            raise ValueError(
+                f"{self.masters + self.slaves} nodes do not fit in {self.ip_network}"
+            )
+        if fanout not in FANOUT_PATTERNS:
+            raise ValueError(f"Unknown fan-out pattern: {fanout}")
+        self.fanout = fanout
+        self.masters_per_slave = (
+            self.masters
+            if fanout == "full"
+            else min(max(1, int(masters_per_slave)), self.masters)
+        )
+        self.polling = _template(POLLING_PROFILES, polling, "polling profile")
+        _check_polling(self.polling)
+        self.registers = _template(REGISTER_TEMPLATES, registers, "register template")
+        _check_registers(self.registers)
+        self.seed = seed
+        self._targets = None
+        self._ranks = None
+
+    def polled_by(self, slave: int) -> list[int]:
+        """
+        Returns the indices of the masters polling a slave.
+        """
+        count = self.masters_per_slave
+        if self.fanout == "random":
+            rng = random.Random(f"{self.seed}:{slave}")
+            return sorted(rng.sample(range(self.masters), count))
+        if self.fanout == "block":
+            first = slave * self.masters // max(self.slaves, 1)
+        else:
+            first = slave
+        return [(first + k) % self.masters for k in range(count)]
+
+    def targets(self, master: int) -> array:
+        """
+        Returns the indices of the slaves polled by a master, in increasing order.
+        """
+        if self._targets is None:
+            self._assign()
+        return self._targets[master]
+
+    def _assign(self):
+        targets = [array("I") for _ in range(self.masters)]
+        first = array("I", bytes(4 * self.slaves))
+        for slave in range(self.slaves):
+            polling_masters = self.polled_by(slave)
+            first[slave] = polling_masters[0]
+            for polling_master in polling_masters:
+                targets[polling_master].append(slave)
+        # Slaves are laid out next to the other slaves of their first master
+        ranks = array("I", bytes(4 * self.slaves))
+        for rank, slave in enumerate(sorted(range(self.slaves), key=first.__getitem__)):
+            ranks[slave] = rank
+        self._targets = targets
+        self._ranks = ranks
+
+    def nodes(self) -> Iterator[tuple[dict[str, Any], dict[str, Any]]]:
+        """
+        Yields every node, masters first.
+
+        Yields:
+            tuple[dict, dict]: The Cytoscape node and its scenario node, with the messages of masters.
+        """
+        for i in range(self.masters):
+            node = self._node("master", i)
+            messages = []
+            for slave in self.targets(i):
+                slave_data = self._slave_data(slave)
+                for message in self.polling:
+                    message = scenario_message(message, slave_data)
+                    # Shared objects would be dumped as YAML aliases
+                    message["values"] = list(message["values"])
+                    messages.append(message)
+            yield node, scenario_node(node["data"], messages)
+        if self._targets is None:
+            self._assign()
+        for j in range(self.slaves):
+            node = self._node("slave", j)
+            yield node, scenario_node(node["data"])
+
+    def edges(self) -> Iterator[dict[str, Any]]:
+        """
+        Yields every edge, grouped by master. Edges share the messages of the polling profile.
+        """
+        for i in range(self.masters):
+            for j in self.targets(i):
+                yield {
+                    "data": {
+                        "id": f"edge_{i}_{j}",
+                        "source": f"master_{i}",
+                        "target": f"slave_{j}",
+                        "messages": self.polling,
+                    }
+                }
+
+    def save(self, name: str) -> tuple[int, int]:
+        """
+        Saves the generated scenario to the scenario store.
+
+        Args:
+            name (str): Name of the scenario.
+
+        Returns:
+            tuple[int, int]: Number of nodes and edges saved.
+        """
+        fields = {"protocol": self.protocol, "ip_network": str(self.ip_network)}
+        return save_scenario_stream(name, fields, self.nodes(), self.edges())
+
+    def _ip(self, role: str, index: int) -> str:
+        offset = index if role == "master" else self.masters + index
+        return str(self.ip_network.network_address + 2 + offset)
+
+    def _slave_data(self, index: int) -> dict[str, Any]:
+        # Fields of a slave used to address messages to it
+        return {"ip": self._ip("slave", index), "port": "502", "slave_id": "1"}
+
+    def _node(self, role: str, index: int) -> dict[str, Any]:
+        modbus_slave = role == "slave" and self.protocol == PROTOCOL.MODBUS.value
+        return cytoscape_node(
+            role,
+            index,
+            self._ip(role, index),
+            layered_position(
+                role,
+                index if role == "master" else self._ranks[index],
+                self.masters,
+                self.slaves,
+            ),
+            self._slave_data(index) if modbus_slave else None,
+            self.registers,
+        )
+
+
+def _template(templates: dict[str, Any], value: str | Any, kind: str) -> Any:
+    if isinstance(value, str):
+        if value not in templates:
+            raise ValueError(f"Unknown {kind}: {value}")
+        return templates[value]
+    return value
+
+
+# Fields of a polling message, as read by scenario_message
+_MESSAGE_FIELDS = {
+    "timestamp": (int, float),
+    "recurrent": bool,
+    "interval": (int, float),
+    "function_code": int,
+    "start_address": int,
+}
+
+
+def _check_polling(polling: Any):
+    # Custom profiles come from the API: reject them before anything is written
+    if not isinstance(polling, list) or not all(isinstance(m, dict) for m in polling):
+        raise ValueError("A polling profile must be a list of messages")
+    for number, message in enumerate(polling):
+        for field, types in _MESSAGE_FIELDS.items():
+            if not isinstance(message.get(field), types):
+                raise ValueError(f"Polling message {number}: invalid {field}")
+        if not isinstance(message.get("count", 0), int):
+            raise ValueError(f"Polling message {number}: invalid count")
+        if not isinstance(message.get("values", []), list):
+            raise ValueError(f"Polling message {number}: invalid values")
+
+
+def _check_registers(registers: Any):
+    if not isinstance(registers, dict):
+        raise ValueError("A register template must be an object")
+    unknown = registers.keys() - set(REGISTER_KEYS)
+    if unknown:
+        # They would overwrite other fields of the slaves
+        raise ValueError(f"Register template: unknown keys {sorted(unknown)}")
+    for key in REGISTER_KEYS:
+        register = registers.get(key)
+        if not isinstance(register, dict) or not {"type", "values"} <= register.keys():
+            raise ValueError(f"Register template: {key} needs a type and values")
@@ -0,0 +1,20 @@
+"""
+YAML dumper and loader shared by the scenario store and the generators.
+
+Only safe ones are used: everything written is read back with the safe
+loader, by the store as well as by the nodes.
+"""
+
+
+def yaml_dumper():
+    import yaml
+
+    # libyaml's emitter produces the same output as the pure Python one, much faster
+    return getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+def yaml_loader():
+    import yaml
+
+    # libyaml's parser gives the same result as safe_load, much faster
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
@@ -0,0 +1,137 @@
+import copy
+import ipaddress
+import unittest
+
+from src.cytoscape_adapter import (
+    LEVEL,
+    ScenarioValidator,
+    apply_patch,
+    cytoscape_to_scenario,
+    generate_network_nodes,
+)
+
+
+class TestCytoscapeConversion(unittest.TestCase):
+    def test_messages_are_routed_to_their_master(self):
+        """
+        Test that edge messages end up in their master with the target slave address, without changing the graph.
+        """
+        nodes, edges = generate_network_nodes(
+            "modbus", ipaddress.ip_address("10.0.0.2"), 2, 2
+        )
+        nodes[3]["data"]["port"] = "5020"
+        for master, slave in [(0, 1), (1, 0), (1, 1)]:
+            edges.append(
+                {
+                    "data": {
+                        "id": f"edge_{master}_{slave}",
+                        "source": f"master_{master}",
+                        "target": f"slave_{slave}",
+                        "messages": [
+                            {
+                                "timestamp": 0,
+                                "recurrent": True,
+                                "interval": 1,
+                                "function_code": 3,
+                                "start_address": 0,
+                            }
+                        ],
+                    }
+                }
+            )
+        graph = {
+            "protocol": "modbus",
+            "ip_network": "10.0.0.0/24",
+            "nodes": nodes,
+            "edges": edges,
+        }
+        original = copy.deepcopy(graph)
+
+        scenario = cytoscape_to_scenario(graph)
+
+        self.assertEqual(graph, original)
+        masters = [n for n in scenario["nodes"] if n["role"] == "master"]
+        self.assertEqual(
+            [m["ip"] for m in masters[0]["messages"]], [nodes[3]["data"]["ip"]]
+        )
+        self.assertEqual([m["port"] for m in masters[1]["messages"]], [502, 5020])
+        self.assertEqual(scenario["nodes"][2]["slave_id"], 1)
+
+    def test_validator_rechecks_changed_elements(self):
+        """
+        Test that cached results follow the edits of nodes and edges between saves.
+        """
+        nodes, edges = generate_network_nodes(
+            "modbus", ipaddress.ip_address("10.0.0.2"), 1, 2
+        )
+        edges.append({"data": {"id": "e", "source": "master_0", "target": "slave_0"}})
+        graph = {"ip_network": "10.0.0.0/24", "nodes": nodes, "edges": edges}
+        validator = ScenarioValidator(accepted=copy.deepcopy(graph))
+        self.assertEqual(validator.validate(graph, LEVEL.ERROR), [])
+
+        graph = copy.deepcopy(graph)
+        graph["nodes"][1]["data"]["ip"] = "10.0.1.2"
+        graph["nodes"][2]["data"]["role"] = "master"
+        graph["edges"][0]["data"]["target"] = "slave_1"
+        self.assertEqual(
+            validator.validate(graph, LEVEL.ERROR),
+            [
+                "[ERROR] Edge e connects nodes with the same role (master)",
+                "[ERROR] IP 10.0.1.2 of node slave_0 is out of range",
+            ],
+        )
+
+        graph = copy.deepcopy(graph)
+        graph["ip_network"] = "10.0.0.0/16"
+        graph["nodes"][2]["data"]["role"] = "slave"
+        self.assertEqual(validator.validate(graph, LEVEL.ERROR), [])
+
+    def test_patch_operations_address_elements_by_id(self):
+        """
+        Test that patches add, change and remove elements without touching the original ones.
+        """
+        nodes, _ = generate_network_nodes(
+            "modbus", ipaddress.ip_address("10.0.0.2"), 1, 2
+        )
+        graph = {"ip_network": "10.0.0.0/24", "nodes": nodes, "edges": []}
+        original = copy.deepcopy(graph)
+        patched = copy.deepcopy(graph)
+
+        affected = apply_patch(
+            patched,
+            [
+                {"op": "replace", "path": "/nodes/slave_0/data/port", "value": "5020"},
+                {"op": "remove", "path": "/nodes/slave_1"},
+                {
+                    "op": "add",
+                    "path": "/edges/e",
+                    "value": {"data": {"source": "master_0", "target": "slave_0"}},
+                },
+                {"op": "replace", "path": "/ip_network", "value": "10.0.0.0/16"},
+            ],
+        )
+
+        self.assertEqual(
+            affected, {("node", "slave_0"), ("node", "slave_1"), ("edge", "e")}
+        )
+        self.assertEqual(
+            [n["data"]["id"] for n in patched["nodes"]], ["master_0", "slave_0"]
+        )
+        self.assertEqual(patched["nodes"][1]["data"]["port"], "5020")
+        self.assertEqual(patched["edges"][0]["data"]["id"], "e")
+        self.assertEqual(patched["ip_network"], "10.0.0.0/16")
+        self.assertEqual(nodes[1]["data"]["port"], "502")
+
+        with self.assertRaises(ValueError):
+            apply_patch(
+                graph,
+                [
+                    {"op": "remove", "path": "/nodes/slave_0"},
+                    {"op": "remove", "path": "/nodes/missing"},
+                ],
+            )
+        self.assertEqual(graph, original)
+
+
+if __name__ == "__main__":
+    unittest.main()
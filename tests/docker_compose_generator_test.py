@@ -2,6 +2,13 @@ import unittest
 import yaml
 import os
 from src.docker_compose_generator import DockerComposeGenerator
+from src.ip_allocator import IPAllocationError
+from src.scenario_config_generator import node_environment
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
 
 
 class TestDockerComposeGeneration(unittest.TestCase):
@@ -25,6 +32,9 @@ class TestDockerComposeGeneration(unittest.TestCase):
             )
         for i in range(num_slaves):
             generator.add_node("slave", i, mac=mac_addresses.pop())
+        # The compose file and its service hashes sidecar are removed even if the test fails
+        for path in (file_path, generator._hashes_path()):
+            self.addCleanup(_remove, path)
         generator.generate()
 
         with open(file_path, "r") as file:
@@ -40,7 +50,133 @@ class TestDockerComposeGeneration(unittest.TestCase):
 
         self.assertTrue(generator.validate())
 
-        os.remove(file_path)
+    def test_each_role_image_is_built_once(self):
+        """
+        Test that only one service per role declares a build and the others reuse its image.
+        """
+        generator = DockerComposeGenerator(
+            "modbus", "tests/docker-compose_test.yml", "/tmp/ICSCommEmulator"
+        )
+        generator.add_network("ics_network", "172.28.0.0/16")
+        generator.add_node("master", 0, dependencies={"slave": [0, 1, 2]})
+        for i in range(3):
+            generator.add_node("slave", i)
+
+        builds = [
+            name for name, service in generator.services.items() if "build" in service
+        ]
+        self.assertEqual(sorted(builds), ["modbus_master_0", "modbus_slave_0"])
+        self.assertEqual(
+            generator.services["modbus_slave_2"]["image"],
+            generator.services["modbus_slave_0"]["image"],
+        )
+        self.assertTrue(generator.validate())
+
+    def test_validate_rejects_inconsistent_configuration(self):
+        """
+        Test that the in-process validation catches dangling dependencies without writing the file.
+        """
+        generator = DockerComposeGenerator(
+            "modbus", "tests/docker-compose_test.yml", "/tmp/ICSCommEmulator"
+        )
+        generator.add_network("ics_network", "172.28.0.0/16")
+        generator.add_node("master", 0, dependencies={"slave": [1]})
+        generator.add_node("slave", 0)
+
+        self.assertFalse(generator.validate())
+        self.assertTrue(
+            any("undefined service" in error for error in generator.validation_errors)
+        )
+        self.assertFalse(os.path.exists("tests/docker-compose_test.yml"))
+
+    def test_ip_allocation_avoids_explicit_ips(self):
+        """
+        Test that dynamic IPs skip explicit ones and that every IP conflict is reported at once.
+        """
+        generator = DockerComposeGenerator(
+            "modbus", "tests/docker-compose_test.yml", "/tmp/ICSCommEmulator"
+        )
+        generator.add_network("ics_network", "172.28.0.0/16")
+        ips = generator.assign_addresses(
+            [{"role": "master"}],
+            [{"role": "slave", "ip": "172.28.0.2"}, {"role": "slave"}],
+        )
+        self.assertEqual(ips[("slave", 0)], "172.28.0.2")
+        self.assertEqual(
+            {str(ips[("master", 0)]), str(ips[("slave", 1)])},
+            {"172.28.0.3", "172.28.0.4"},
+        )
+
+        generator = DockerComposeGenerator(
+            "modbus", "tests/docker-compose_test.yml", "/tmp/ICSCommEmulator"
+        )
+        generator.add_network("ics_network", "172.28.0.0/16")
+        with self.assertRaises(IPAllocationError) as context:
+            generator.assign_addresses(
+                [{"role": "master", "ip": "10.0.0.2"}],
+                [
+                    {"role": "slave", "ip": "172.28.0.5"},
+                    {"role": "slave", "ip": "172.28.0.5"},
+                ],
+            )
+        self.assertIn("out of range", str(context.exception))
+        self.assertIn("already used", str(context.exception))
+
+    def test_nodes_added_one_at_a_time_get_free_ips(self):
+        """
+        Test that nodes added one by one skip addresses reserved ahead of the allocation.
+        """
+        generator = DockerComposeGenerator(
+            "modbus", "tests/docker-compose_test.yml", "/tmp/ICSCommEmulator"
+        )
+        generator.add_network("ics_network", "172.28.0.0/29")
+        allocator = generator.ip_allocator
+        allocator.reserve("172.28.0.3", "explicit_0")
+        allocator.reserve("172.28.0.5", "explicit_1")
+        allocated = [str(allocator.allocate(f"node_{i}")) for i in range(3)]
+        self.assertEqual(allocated, ["172.28.0.2", "172.28.0.4", "172.28.0.6"])
+        self.assertEqual(list(allocator.free_ranges()), [])
+        with self.assertRaises(IPAllocationError):
+            allocator.allocate("node_3")
+
+    def test_services_get_the_environment_of_their_role(self):
+        """
+        Test that services run with the same per-role environment as native processes.
+        """
+        generator = DockerComposeGenerator(
+            "modbus", "tests/docker-compose_test.yml", "/tmp/ICSCommEmulator"
+        )
+        generator.add_network("ics_network", "172.28.0.0/16")
+        generator.add_node("master", 0, dependencies={"slave": [0]})
+        generator.add_node("slave", 0)
+        self.assertNotIn("environment", generator.services["modbus_master_0"])
+        self.assertEqual(
+            generator.services["modbus_slave_0"]["environment"],
+            [f"{key}={value}" for key, value in node_environment("slave").items()],
+        )
+
+    def test_written_slaves_are_listed(self):
+        """
+        Test that only the slaves masters write to are listed for recreation.
+        """
+
+        def message(ip, function_code):
+            return {"ip": ip, "port": 502, "function_code": function_code}
+
+        scenario = {
+            "nodes": [
+                {
+                    "role": "master",
+                    "messages": [message("10.0.0.3", 3), message("10.0.0.4", 6)],
+                },
+                {"role": "slave", "ip": "10.0.0.3", "port": 502},
+                {"role": "slave", "ip": "10.0.0.4", "port": 502},
+            ]
+        }
+        generator = DockerComposeGenerator(
+            "modbus", "tests/docker-compose_test.yml", "/tmp/ICSCommEmulator"
+        )
+        self.assertEqual(generator.written_services(scenario), {"modbus_slave_1"})
 
 
 if __name__ == "__main__":
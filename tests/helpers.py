@@ -0,0 +1,35 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src import scenario_handler
+
+
+def use_scenario_store(test: unittest.TestCase) -> str:
+    """
+    Points the scenario store and its index to a temporary folder for the duration of a test.
+
+    Returns:
+        str: The temporary folder, removed once the test is over.
+    """
+    folder = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, folder)
+    for patch in (
+        mock.patch.object(scenario_handler, "SCENARIO_ROOT_FOLDER", folder),
+        mock.patch.object(
+            scenario_handler, "INDEX_FILE", os.path.join(folder, "index.sqlite3")
+        ),
+        mock.patch.object(scenario_handler, "_index", None),
+    ):
+        patch.start()
+        test.addCleanup(patch.stop)
+    # Cleanups run last in, first out: the index is closed before it is unpatched
+    test.addCleanup(_close_index)
+    return folder
+
+
+def _close_index():
+    if scenario_handler._index is not None:
+        scenario_handler._index.close()
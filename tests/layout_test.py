@@ -0,0 +1,68 @@
+import ipaddress
+import unittest
+
+from src.cytoscape_adapter import generate_network_nodes
+from src.layout import LAYER_SPACING, layout_scenario
+
+
+def _graph(masters, slaves):
+    nodes, edges = generate_network_nodes(
+        "modbus", ipaddress.ip_address("10.0.0.2"), masters, slaves
+    )
+    for i in range(slaves):
+        edges.append(
+            {
+                "data": {
+                    "id": f"edge_{i}",
+                    "source": f"master_{i % masters}",
+                    "target": f"slave_{i}",
+                }
+            }
+        )
+    return {"protocol": "modbus", "nodes": nodes, "edges": edges}
+
+
+def _positions(data):
+    return {
+        node["data"]["id"]: (node["position"]["x"], node["position"]["y"])
+        for node in data["nodes"]
+    }
+
+
+class TestLayout(unittest.TestCase):
+    def test_scenario_is_laid_out_in_layers(self):
+        """
+        Test that masters are placed above the slaves, every node on its own slot, without changing the scenario.
+        """
+        data = _graph(3, 40)
+        laid_out = layout_scenario(data)
+        positions = _positions(laid_out)
+
+        self.assertNotIn("position", data["nodes"][0])
+        self.assertEqual(len(set(positions.values())), len(positions))
+        self.assertTrue(all(positions[f"master_{i}"][1] == 0 for i in range(3)))
+        self.assertTrue(all(positions[f"slave_{i}"][1] > 0 for i in range(40)))
+
+    def test_only_new_nodes_are_placed(self):
+        """
+        Test that existing positions are kept and that new nodes are placed below their master, on a free slot.
+        """
+        laid_out = layout_scenario(_graph(3, 40))
+        laid_out["nodes"][0] = {**laid_out["nodes"][0], "position": {"x": 5, "y": -7}}
+        before = _positions(laid_out)
+        laid_out["nodes"].append({"data": {"id": "new", "role": "slave"}})
+        laid_out["edges"].append(
+            {"data": {"id": "edge_new", "source": "master_0", "target": "new"}}
+        )
+
+        updated = layout_scenario(laid_out)
+        after = _positions(updated)
+
+        self.assertEqual({k: after[k] for k in before}, before)
+        self.assertGreaterEqual(after["new"][1], -7 + LAYER_SPACING / 2)
+        self.assertNotIn(after["new"], before.values())
+        self.assertIs(layout_scenario(updated), updated)
+
+
+if __name__ == "__main__":
+    unittest.main()
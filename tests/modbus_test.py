@@ -1,5 +1,6 @@
 import os
 import signal
+import tempfile
 import unittest
 import threading
 import time
@@ -49,6 +50,75 @@ class TestModbusConsumer(unittest.TestCase):
         except Exception as e:
             self.fail(f"Error during Modbus message reception test: {e}")
 
+    def test_master_source_address(self):
+        """
+        The master binds its connections to its source address, if any.
+        """
+        client = ModbusMaster("tests/modbus_master.csv")
+        for modbus_client in client._clients.values():
+            self.assertIsNone(modbus_client.comm_params.source_address)
+
+        client = ModbusMaster("tests/modbus_master.csv", source_address="127.0.0.2")
+        for modbus_client in client._clients.values():
+            self.assertEqual(modbus_client.comm_params.source_address, ("127.0.0.2", 0))
+        client.loop()
+        self.assertEqual(len(client.responses), 1)
+        self.assertFalse(client.responses[0].isError())
+
+    def test_master_metrics(self):
+        """
+        The master exports the outcome, duration and lateness of its requests.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            csv_file = os.path.join(folder, "master.csv")
+            with open("tests/modbus_master.csv") as f:
+                rows = f.read().splitlines()
+            with open(csv_file, "w") as f:
+                # The same request, then one to a port nothing listens on
+                f.write("\n".join(rows + [rows[1].replace(",502,", ",15999,")]))
+            metrics_file = os.path.join(folder, "metrics.prom")
+            client = ModbusMaster(csv_file, metrics_file=metrics_file)
+            client.loop()
+            with open(metrics_file) as f:
+                metrics = f.read().splitlines()
+
+        self.assertIsNone(client.responses[1])
+        served = '{target="localhost:502",function_code="1"'
+        refused = '{target="localhost:15999",function_code="1"'
+        for line in [
+            f"modbus_master_requests_total{served}}} 1",
+            f"modbus_master_requests_total{refused}}} 1",
+            f"modbus_master_exception_responses_total{served}}} 0",
+            f"modbus_master_connection_failures_total{served}}} 0",
+            f"modbus_master_connection_failures_total{refused}}} 1",
+            f'modbus_master_request_duration_seconds_bucket{served},le="+Inf"}} 1',
+            f'modbus_master_request_duration_seconds_bucket{refused},le="+Inf"}} 0',
+            'modbus_master_lateness_seconds_bucket{le="+Inf"} 2',
+            "modbus_master_lateness_seconds_count 2",
+        ]:
+            self.assertIn(line, metrics)
+
+    def test_master_log_sampling(self):
+        """
+        The master logs one request in log_sample, and a summary of all of them.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            csv_file = os.path.join(folder, "master.csv")
+            with open("tests/modbus_master.csv") as f:
+                header, row = f.read().splitlines()
+            with open(csv_file, "w") as f:
+                f.write("\n".join([header] + [row] * 5))
+            client = ModbusMaster(csv_file, log_sample=2)
+            with self.assertLogs("protocols.modbus.master.master", "INFO") as logs:
+                client.loop()
+
+        sends = [line for line in logs.output if ":send " in line]
+        summaries = [line for line in logs.output if ":summary " in line]
+        self.assertEqual(len(sends), 3)
+        self.assertEqual(len(summaries), 1)
+        self.assertIn("requests=5 ", summaries[0])
+        self.assertIn("failures=0 ", summaries[0])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,156 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from src import native_backend
+from src.native_backend import NativeBackend
+from src.scenario_config_generator import ScenarioConfigGenerator
+
+
+def _scenario():
+    return {
+        "protocol": "modbus",
+        "ip_network": "10.0.0.0/24",
+        "nodes": [
+            {"role": "master", "name": "m0", "ip": "10.0.0.2", "messages": []},
+            {"role": "master", "name": "m1", "ip": "127.0.0.1", "messages": []},
+            {
+                "role": "slave",
+                "name": "s0",
+                "id": "s0",
+                "ip": "10.0.0.3",
+                "port": 502,
+                "coils": {"type": "sequential", "values": ""},
+            },
+            {
+                "role": "slave",
+                "name": "s1",
+                "id": "s1",
+                "ip": "10.0.0.4",
+                "port": 502,
+                "coils": {"type": "sequential", "values": ""},
+            },
+        ],
+    }
+
+
+class TestNativeBackend(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.calls = []
+        patch = mock.patch.object(native_backend, "_ip", side_effect=self._ip)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _ip(self, *args, check=True):
+        self.calls.append(args)
+        return subprocess.CompletedProcess(["ip", *args], 0, "", "")
+
+    def test_aliases_are_added_and_removed(self):
+        """
+        Test that only scenario IPs not already assigned or loopback get an alias, removed on stop.
+        """
+        backend = NativeBackend(_scenario(), self.folder)
+        with mock.patch.object(
+            native_backend, "_assigned_addresses", return_value={"10.0.0.4"}
+        ):
+            backend._setup_addresses()
+        self.assertEqual(
+            self.calls,
+            [
+                ("addr", "add", "10.0.0.2/32", "dev", "lo"),
+                ("addr", "add", "10.0.0.3/32", "dev", "lo"),
+            ],
+        )
+
+        self.calls.clear()
+        backend.stop()
+        self.assertEqual(
+            self.calls,
+            [
+                ("addr", "del", "10.0.0.2/32", "dev", "lo"),
+                ("addr", "del", "10.0.0.3/32", "dev", "lo"),
+            ],
+        )
+        self.assertEqual(backend.capture_filter(), "net 10.0.0.0/24")
+
+    def test_dummy_interface_is_created_and_removed(self):
+        backend = NativeBackend(_scenario(), self.folder, alias_interface="ics0")
+        with mock.patch.object(
+            native_backend, "_assigned_addresses", return_value=set()
+        ), mock.patch.object(native_backend, "_interface_exists", return_value=False):
+            backend._setup_addresses()
+            backend.stop()
+        self.assertEqual(
+            self.calls[:2],
+            [
+                ("link", "add", "ics0", "type", "dummy"),
+                ("link", "set", "ics0", "up"),
+            ],
+        )
+        self.assertEqual(self.calls[-1], ("link", "del", "ics0"))
+
+    def test_nodes_without_ip_are_rejected(self):
+        scenario = _scenario()
+        del scenario["nodes"][2]["ip"]
+        backend = NativeBackend(scenario, self.folder)
+        with mock.patch.object(
+            native_backend, "_assigned_addresses", return_value=set()
+        ), self.assertRaisesRegex(Exception, "s0 needs an IP"):
+            backend._setup_addresses()
+
+    def test_processes_are_spawned_and_stopped(self):
+        """
+        Test that nodes run from their config folders, masters with their IP as source address.
+        """
+        scenario = _scenario()
+        config_path = os.path.join(self.folder, "config")
+        ScenarioConfigGenerator(scenario, config_path).generate()
+        # Generating the configuration leaves the nodes usable by the backend
+        backend = NativeBackend(scenario, config_path)
+
+        processes = []
+
+        def popen(args, cwd, env, stdout, stderr):
+            process = mock.Mock()
+            process.args, process.cwd, process.env = args, cwd, env
+            process.poll.return_value = None
+            processes.append(process)
+            if args[1].endswith("slave.py"):
+                # Slaves touch their lock file once they serve requests
+                open(os.path.join(cwd, "app_running.lock"), "w").close()
+            return process
+
+        with mock.patch.object(
+            native_backend.subprocess, "Popen", side_effect=popen
+        ), mock.patch.object(
+            native_backend, "_assigned_addresses", return_value=set()
+        ), mock.patch.object(
+            native_backend, "_accepts_connections", return_value=True
+        ):
+            backend.start_slaves()
+            backend.start_masters()
+            backend.stop()
+
+        slaves, masters = processes[:2], processes[2:]
+        for i, process in enumerate(slaves):
+            self.assertTrue(process.args[1].endswith("modbus/slave/slave.py"))
+            self.assertEqual(process.cwd, os.path.join(config_path, "slaves", str(i)))
+            self.assertEqual(process.env["PYTHONUNBUFFERED"], "1")
+        self.assertTrue(masters[0].args[1].endswith("modbus/master/master.py"))
+        self.assertEqual(masters[0].env["MODBUS_SOURCE_ADDRESS"], "10.0.0.2")
+        self.assertEqual(masters[1].env["MODBUS_SOURCE_ADDRESS"], "127.0.0.1")
+        for process in processes:
+            process.terminate.assert_called_once()
+            process.wait.assert_called()
+        self.assertEqual(self.calls[-1], ("addr", "del", "10.0.0.4/32", "dev", "lo"))
+
+
+if __name__ == "__main__":
+    unittest.main()
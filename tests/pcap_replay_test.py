@@ -0,0 +1,191 @@
+import os
+import socket
+import struct
+import unittest
+
+from src import scenario_handler
+from src.cytoscape_adapter import LEVEL, ScenarioValidator
+from src.pcap_replay import PcapReplay
+from tests.helpers import use_scenario_store
+
+
+def _frame(src, dst, sport, dport, payload):
+    ip_header = struct.pack(
+        "!BBHHHBBH4s4s",
+        0x45,
+        0,
+        20 + 20 + len(payload),
+        0,
+        0,
+        64,
+        6,
+        0,
+        socket.inet_aton(src),
+        socket.inet_aton(dst),
+    )
+    tcp_header = struct.pack("!HHIIBBHHH", sport, dport, 0, 0, 5 << 4, 0x18, 0, 0, 0)
+    return b"\x00" * 12 + b"\x08\x00" + ip_header + tcp_header + payload
+
+
+def _mbap(transaction, pdu):
+    return struct.pack("!HHHB", transaction, 0, len(pdu) + 1, 1) + pdu
+
+
+class TestPcapReplay(unittest.TestCase):
+    def setUp(self):
+        self.folder = use_scenario_store(self)
+
+    def write_capture(self, packets):
+        """
+        Writes (time, frame) pairs as a pcap file and returns its path.
+        """
+        path = os.path.join(self.folder, "capture.pcap")
+        with open(path, "wb") as f:
+            f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+            for timestamp, frame in packets:
+                seconds, micros = divmod(round((100 + timestamp) * 1e6), 10**6)
+                f.write(struct.pack("<IIII", seconds, micros, len(frame), len(frame)))
+                f.write(frame)
+        return path
+
+    def exchange(self, timestamp, transaction, request, response=None):
+        """
+        Returns the frames of a request from 10.0.0.2 to 10.0.0.3 and of its response.
+        """
+        frames = [
+            (
+                timestamp,
+                _frame("10.0.0.2", "10.0.0.3", 40000, 502, _mbap(transaction, request)),
+            )
+        ]
+        if response is not None:
+            frames.append(
+                (
+                    timestamp + 0.001,
+                    _frame(
+                        "10.0.0.3", "10.0.0.2", 502, 40000, _mbap(transaction, response)
+                    ),
+                )
+            )
+        return frames
+
+    def test_capture_compiles_to_scenario(self):
+        """
+        Test that periodic requests become recurrent messages, other requests keep their times, and slaves serve the values seen.
+        """
+        packets = []
+        for i in range(4):
+            # Read of holding registers 0 and 1, every second
+            packets += self.exchange(
+                i, i, bytes.fromhex("0300000002"), bytes.fromhex("030400070008")
+            )
+        # Write of holding register 5, twice, and a single read of coils 0 to 2
+        packets += self.exchange(0.5, 10, bytes.fromhex("060005002a"))
+        packets += self.exchange(
+            1.5, 11, bytes.fromhex("0100000003"), bytes.fromhex("010105")
+        )
+        packets += self.exchange(2.7, 12, bytes.fromhex("060005002b"))
+        packets.sort(key=lambda packet: packet[0])
+
+        replay = PcapReplay(self.write_capture(packets))
+        self.assertEqual(replay.save("replayed"), (2, 1))
+
+        scenario = scenario_handler.get_python_scenario("replayed")
+        self.assertEqual(scenario["ip_network"], "10.0.0.0/24")
+        master, slave = scenario["nodes"]
+        target = {"ip": "10.0.0.3", "port": 502, "slave_id": 1}
+        self.assertEqual(
+            master["messages"],
+            [
+                {
+                    "timestamp": 0.0,
+                    "recurrent": True,
+                    "interval": 1.0,
+                    **target,
+                    "function_code": 3,
+                    "start_address": 0,
+                    "count": 2,
+                    "values": [],
+                },
+                {
+                    "timestamp": 0.5,
+                    "recurrent": False,
+                    "interval": 1,
+                    **target,
+                    "function_code": 6,
+                    "start_address": 5,
+                    "count": 0,
+                    "values": [42],
+                },
+                {
+                    "timestamp": 1.5,
+                    "recurrent": False,
+                    "interval": 1,
+                    **target,
+                    "function_code": 1,
+                    "start_address": 0,
+                    "count": 3,
+                    "values": [],
+                },
+                {
+                    "timestamp": 2.7,
+                    "recurrent": False,
+                    "interval": 1,
+                    **target,
+                    "function_code": 6,
+                    "start_address": 5,
+                    "count": 0,
+                    "values": [43],
+                },
+            ],
+        )
+        self.assertEqual(slave["ip"], "10.0.0.3")
+        self.assertEqual(
+            slave["holding_registers"],
+            {"type": "sequential", "values": [7, 8, 0, 0, 0, 42]},
+        )
+        self.assertEqual(slave["coils"], {"type": "sequential", "values": [1, 0, 1]})
+        self.assertEqual(slave["input_registers"], {"type": "sequential", "values": ""})
+
+        data = scenario_handler.get_cytoscape_scenario("replayed")
+        self.assertEqual(ScenarioValidator().validate(data, LEVEL.ERROR), [])
+
+    def assert_rejected(self, packets, message, ip_network=None):
+        replay = PcapReplay(self.write_capture(packets))
+        with self.assertRaisesRegex(ValueError, message):
+            replay.save("rejected", ip_network)
+        self.assertFalse(scenario_handler.check_scenario_exists("rejected"))
+
+    def test_device_on_the_gateway_address_is_rejected(self):
+        read = _mbap(0, bytes.fromhex("0300000002"))
+        packets = [(0, _frame("10.0.0.2", "10.0.0.1", 40000, 502, read))]
+        self.assert_rejected(
+            packets, "IP 10.0.0.1 of slave_0 .* reserved for the gateway"
+        )
+        packets = [(0, _frame("10.0.0.2", "10.0.0.3", 40000, 502, read))]
+        self.assert_rejected(packets, "out of range 10.1.0.0/24", "10.1.0.0/24")
+
+    def test_server_on_two_ports_is_rejected(self):
+        read = _mbap(0, bytes.fromhex("0300000002"))
+        packets = [
+            (0, _frame("10.0.0.2", "10.0.0.3", 40000, 502, read)),
+            (1, _frame("10.0.0.2", "10.0.0.3", 40001, 5020, read)),
+        ]
+        replay = PcapReplay(self.write_capture(packets), ports=(502, 5020))
+        with self.assertRaisesRegex(
+            ValueError, r"slave_1 \(port 5020\) is already used by slave_0 \(port 502\)"
+        ):
+            replay.save("rejected")
+
+    def test_hosts_of_unrelated_subnets_are_rejected(self):
+        read = _mbap(0, bytes.fromhex("0300000002"))
+        packets = [(0, _frame("10.0.0.2", "192.168.0.3", 40000, 502, read))]
+        self.assert_rejected(packets, "span 0.0.0.0/0, wider than a /16")
+        # Hosts of a /16 still make a network
+        packets = [(0, _frame("10.0.0.2", "10.0.200.3", 40000, 502, read))]
+        replay = PcapReplay(self.write_capture(packets))
+        self.assertEqual(str(replay.scan().ip_network()), "10.0.0.0/16")
+
+
+if __name__ == "__main__":
+    unittest.main()
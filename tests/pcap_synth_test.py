@@ -0,0 +1,177 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from src.pcap import decode_packet, iter_records
+from src.pcap_replay import PcapReplay
+from src.pcap_synth import EXCHANGE, PcapSynthesizer
+
+TARGET = {"ip": "10.0.0.3", "port": 502, "slave_id": 1}
+
+
+def _message(timestamp, function_code, start_address, count=0, values=(), **kwargs):
+    return {
+        "timestamp": timestamp,
+        "recurrent": False,
+        "interval": 1,
+        **TARGET,
+        "function_code": function_code,
+        "start_address": start_address,
+        "count": count,
+        "values": list(values),
+        **kwargs,
+    }
+
+
+def _scenario(*messages):
+    return {
+        "ip_network": "10.0.0.0/24",
+        "nodes": [
+            {"role": "master", "ip": "10.0.0.2", "messages": list(messages)},
+            {
+                "role": "slave",
+                "ip": "10.0.0.3",
+                "port": 502,
+                "holding_registers": {"type": "sequential", "values": [7, 8, 9]},
+                "coils": {"type": "sparse", "values": {"4": 1}},
+            },
+        ],
+    }
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+
+class TestPcapSynthesizer(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def synthesize(self, scenario, duration, **kwargs):
+        """
+        Writes the capture of a scenario and returns its path and decoded packets.
+        """
+        path = os.path.join(self.folder, "synthetic.pcap")
+        synthesizer = PcapSynthesizer(scenario, start=100, **kwargs)
+        stats = synthesizer.save(path, duration, batch_requests=2)
+        records = list(iter_records(path))
+        self.assertEqual(stats["packets"], len(records))
+        self.assertEqual(stats["bytes"], os.path.getsize(path))
+        return path, records
+
+    def test_requests_are_tcp_exchanges(self):
+        """
+        Test that every request is a handshake, request, response and teardown with valid checksums.
+        """
+        scenario = _scenario(
+            {**_message(0.0, 3, 0, count=2), "recurrent": True, "interval": 1.0}
+        )
+        _, records = self.synthesize(scenario, 3, jitter=0)
+        self.assertEqual(len(records), 3 * len(EXCHANGE))
+
+        flags = []
+        for parser, record in records:
+            ip, tcp = record.data[14:34], record.data[34:]
+            pseudo = ip[12:20] + struct.pack("!BBH", 0, 6, len(tcp))
+            self.assertEqual(_checksum(ip), 0xFFFF)
+            self.assertEqual(_checksum(pseudo + tcp), 0xFFFF)
+            flags.append(tcp[13])
+        self.assertEqual(flags[:8], [0x02, 0x12, 0x10, 0x18, 0x18, 0x11, 0x11, 0x10])
+        times = [record.timestamp for _, record in records]
+        self.assertEqual(times, sorted(times))
+        self.assertAlmostEqual(times[8] - times[0], 1.0, places=5)
+
+        packets = [decode_packet(parser.linktype, r) for parser, r in records]
+        request, response = packets[3], packets[4]
+        self.assertEqual((request.src, request.dport), ("10.0.0.2", 502))
+        self.assertEqual((response.src, response.dport), ("10.0.0.3", request.sport))
+        self.assertEqual(request.payload, bytes.fromhex("000100000006010300000002"))
+        self.assertEqual(response.payload, bytes.fromhex("00010000000701030400070008"))
+        # Sequence numbers follow the payloads, and every connection has its own port
+        seq, ack = struct.unpack("!II", records[5][1].data[38:46])
+        self.assertEqual(ack, struct.unpack("!I", records[4][1].data[38:42])[0] + 13)
+        self.assertEqual(seq, struct.unpack("!I", records[3][1].data[38:42])[0] + 12)
+        self.assertNotEqual(packets[8].sport, request.sport)
+        self.assertEqual(packets[11].payload[:2], b"\x00\x02")
+
+    def test_slaves_serve_written_values(self):
+        """
+        Test that reads return the values written before them, and errors for missing registers.
+        """
+        scenario = _scenario(
+            _message(0.0, 3, 0, count=2),
+            _message(0.5, 6, 1, values=[42]),
+            _message(1.0, 3, 0, count=2),
+            _message(1.5, 3, 2, count=2),
+            _message(2.0, 15, 4, values=[0]),
+            _message(2.5, 1, 4, count=1),
+        )
+        _, records = self.synthesize(scenario, 3, jitter=0)
+        responses = [
+            decode_packet(parser.linktype, record).payload[7:]
+            for parser, record in records[4 :: len(EXCHANGE)]
+        ]
+        self.assertEqual(
+            responses,
+            [
+                bytes.fromhex("030400070008"),
+                bytes.fromhex("060001002a"),
+                bytes.fromhex("03040007002a"),
+                bytes.fromhex("8302"),
+                bytes.fromhex("0f00040001"),
+                bytes.fromhex("010100"),
+            ],
+        )
+
+    def test_masters_send_one_request_at_a_time(self):
+        """
+        Test that a request scheduled while another one runs is sent once it is done.
+        """
+        scenario = _scenario(_message(0.0, 3, 0, count=1), _message(0.0, 3, 1, count=1))
+        _, records = self.synthesize(scenario, 1, latency=0.01, processing=0.02)
+        syn = [r.timestamp for _, r in records if r.data[47] == 0x02]
+        # The master closes its side of the first connection, then opens the second
+        closed = [r.timestamp for _, r in records if r.data[47] == 0x11]
+        self.assertEqual(len(syn), 2)
+        self.assertGreaterEqual(syn[1], closed[0])
+        self.assertGreater(syn[1] - syn[0], 0.05)
+
+    def test_unknown_slaves_are_skipped(self):
+        scenario = _scenario(_message(0.0, 3, 0, count=1))
+        scenario["nodes"][0]["messages"].append(
+            {**scenario["nodes"][0]["messages"][0], "ip": "10.0.0.9"}
+        )
+        synthesizer = PcapSynthesizer(scenario, start=100)
+        stats = synthesizer.write(io.BytesIO(), 1)
+        self.assertEqual((synthesizer.skipped, stats["requests"]), (1, 1))
+
+    def test_capture_replays_to_scenario(self):
+        """
+        Test that the synthetic capture of recurrent reads compiles back to the same schedule.
+        """
+        scenario = _scenario(
+            {**_message(0.2, 3, 0, count=3), "recurrent": True, "interval": 0.5}
+        )
+        path, _ = self.synthesize(scenario, 5)
+        replay = PcapReplay(path).scan()
+        ((_, message),) = replay.messages("10.0.0.2")
+        self.assertTrue(message["recurrent"])
+        self.assertAlmostEqual(message["interval"], 0.5, places=2)
+        self.assertEqual(
+            replay.registers[("10.0.0.3", 502)]["holding_registers"], {0: 7, 1: 8, 2: 9}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
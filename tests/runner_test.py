@@ -0,0 +1,101 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from src import runner
+from src.docker_compose_generator import DockerComposeGenerator
+from src.runner import ScenarioRunner
+
+
+class TestKeptContainers(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "docker-compose.yml")
+        self.commands = []
+        patch = mock.patch.object(runner.subprocess, "run", side_effect=self._run)
+        patch.start()
+        self.addCleanup(patch.stop)
+        for attribute in ("_kept_compose_file", "_kept_networks"):
+            patch = mock.patch.object(ScenarioRunner, attribute, None)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _run(self, command, **kwargs):
+        self.commands.append(command)
+        return subprocess.CompletedProcess(command, 0, "", "")
+
+    def generate(self, ip_network):
+        generator = DockerComposeGenerator("modbus", self.path, self.folder)
+        generator.add_network("icscommemulator", ip_network)
+        generator.add_node("master", 0, dependencies={"slave": [0]})
+        generator.add_node("slave", 0)
+        generator.generate()
+
+    def runner(self, recreate=()):
+        scenario_runner = ScenarioRunner()
+        scenario_runner.config(
+            self.path, 5, "test.pcap", self.folder, recreate=list(recreate)
+        )
+        return scenario_runner
+
+    def launch(self, recreate=()):
+        """
+        Launches the Docker Compose file and returns the compose subcommands run.
+        """
+        self.commands.clear()
+        self.runner(recreate).launch_docker_compose()
+        return [
+            command[command.index("-f") + 2 :]
+            for command in self.commands
+            if command[:2] == ["docker", "compose"]
+        ]
+
+    def keep(self):
+        # As a run with keep_containers leaves them
+        ScenarioRunner._kept_compose_file = self.path
+        ScenarioRunner._kept_networks = runner.content_hash(
+            self.runner().compose_networks()
+        )
+
+    def test_kept_containers_are_reused_on_the_same_network(self):
+        """
+        Test that containers kept on the same network are only recreated where needed.
+        """
+        self.generate("10.0.0.0/24")
+        self.keep()
+        self.assertEqual(
+            self.launch(["modbus_slave_0"]),
+            [
+                ["build"],
+                ["up", "-d", "--no-deps", "--force-recreate", "modbus_slave_0"],
+                ["up", "-d", "--remove-orphans"],
+            ],
+        )
+
+    def test_kept_containers_are_removed_when_the_network_changes(self):
+        """
+        Test that a run on another subnet stops the kept containers and removes their network.
+        """
+        self.generate("10.0.0.0/24")
+        self.keep()
+        self.generate("10.1.0.0/24")
+        self.assertEqual(
+            self.launch(["modbus_slave_0"]),
+            [
+                ["down", "--remove-orphans", "--timeout", "3"],
+                ["build"],
+                ["up", "-d", "--remove-orphans"],
+            ],
+        )
+        self.assertIn(["docker", "network", "rm", "icscommemulator"], self.commands)
+        self.assertIsNone(ScenarioRunner._kept_compose_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
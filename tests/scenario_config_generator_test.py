@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src.scenario_config_generator import (
+    ScenarioConfigGenerator,
+    copy_config,
+    remove_config,
+)
+
+
+def _scenario(value):
+    return {
+        "nodes": [
+            {
+                "role": "master",
+                "messages": [{"slave_id": 0, "function": 3, "count": "1"}],
+            },
+            {"role": "slave", "ip": "172.28.0.3", "port": 502, "holding": value},
+            {"role": "slave", "ip": "172.28.0.4", "port": 502, "holding": 0},
+        ]
+    }
+
+
+class TestScenarioConfigGeneration(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.folder, "ICSCommEmulator")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_generation_is_swapped_in_atomically(self):
+        """
+        Test that the config path points to a complete generation and that unchanged files are reused.
+        """
+        changed = ScenarioConfigGenerator(_scenario(1), self.config_path).generate()
+        self.assertTrue(os.path.islink(self.config_path))
+        self.assertEqual(changed, {("master", 0), ("slave", 0), ("slave", 1)})
+        unchanged_file = os.path.join(self.config_path, "slaves/1/slave.yaml")
+        inode = os.stat(unchanged_file).st_ino
+
+        changed = ScenarioConfigGenerator(_scenario(2), self.config_path).generate()
+        self.assertEqual(changed, {("slave", 0)})
+        self.assertEqual(os.stat(unchanged_file).st_ino, inode)
+        # Only the live generation is left next to the config path
+        self.assertEqual(len(os.listdir(self.folder)), 2)
+
+        remove_config(self.config_path)
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_failed_generation_keeps_previous_files(self):
+        """
+        Test that an error while rendering leaves the live configuration untouched.
+        """
+        ScenarioConfigGenerator(_scenario(1), self.config_path).generate()
+        generator = ScenarioConfigGenerator(_scenario(2), self.config_path)
+        with mock.patch.object(
+            generator, "_craft_slave", side_effect=RuntimeError("render failed")
+        ):
+            with self.assertRaises(RuntimeError):
+                generator.generate()
+
+        with open(os.path.join(self.config_path, "slaves/0/slave.yaml")) as f:
+            self.assertIn("holding: 1", f.read())
+        self.assertEqual(len(os.listdir(self.folder)), 2)
+
+    def test_plain_directory_is_replaced(self):
+        """
+        Test that a configuration folder written by a previous version is replaced by a generation.
+        """
+        os.makedirs(os.path.join(self.config_path, "masters/0"))
+        ScenarioConfigGenerator(_scenario(1), self.config_path).generate()
+        self.assertTrue(os.path.islink(self.config_path))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.config_path, "masters/0/master.csv"))
+        )
+
+    def test_install_copies_stored_generation(self):
+        """
+        Test that a copied configuration can be installed later, reporting the nodes that differ.
+        """
+        ScenarioConfigGenerator(_scenario(1), self.config_path).generate()
+        stored = os.path.join(self.folder, "compiled")
+        copy_config(self.config_path, stored)
+        ScenarioConfigGenerator(_scenario(2), self.config_path).generate()
+
+        changed = ScenarioConfigGenerator(None, self.config_path).install(stored)
+        self.assertEqual(changed, {("slave", 0)})
+        with open(os.path.join(self.config_path, "slaves/0/slave.yaml")) as f:
+            self.assertIn("holding: 1", f.read())
+        self.assertTrue(os.path.exists(os.path.join(stored, "slaves/0/slave.yaml")))
+
+    def test_time_scale_speeds_up_master_schedules(self):
+        """
+        Test that the timestamps and intervals of master messages are divided by the time scale.
+        """
+        scenario = _scenario(1)
+        scenario["nodes"][0]["messages"][0].update(timestamp=48, interval="12")
+        files = ScenarioConfigGenerator(scenario, self.config_path, 24).render()
+        self.assertEqual(files["masters/0/master.csv"].splitlines()[1], "0,3,1,2.0,0.5")
+        files = ScenarioConfigGenerator(scenario, self.config_path).render()
+        self.assertEqual(files["masters/0/master.csv"].splitlines()[1], "0,3,1,48,12")
+
+
+if __name__ == "__main__":
+    unittest.main()
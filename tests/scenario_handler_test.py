@@ -0,0 +1,74 @@
+import ipaddress
+import os
+import shutil
+import unittest
+
+from src import scenario_handler
+from src.cytoscape_adapter import generate_network_nodes, parse_cytoscape_json
+from tests.helpers import use_scenario_store
+
+
+def _graph(protocol, masters, slaves):
+    nodes, edges = generate_network_nodes(
+        protocol, ipaddress.ip_address("10.0.0.2"), masters, slaves
+    )
+    return {
+        "protocol": protocol,
+        "ip_network": "10.0.0.0/24",
+        "nodes": nodes,
+        "edges": edges,
+    }
+
+
+class TestScenarioIndex(unittest.TestCase):
+    def setUp(self):
+        self.folder = use_scenario_store(self)
+
+    def test_listing_is_paginated_and_filtered(self):
+        """
+        Test that saved scenarios are listed from the index with their metadata.
+        """
+        for i in range(5):
+            scenario_handler.save_scenario(f"plant_{i}", _graph("modbus", 1, i + 1))
+        scenario_handler.save_scenario("other", _graph("modbus", 1, 1))
+
+        total, page = scenario_handler.list_scenarios(
+            offset=1, limit=2, search="plant_", sort="nodes", descending=True
+        )
+        self.assertEqual(total, 5)
+        self.assertEqual([row["name"] for row in page], ["plant_3", "plant_2"])
+        self.assertEqual(page[0]["nodes"], 5)
+        self.assertEqual(page[0]["protocol"], "modbus")
+
+    def test_index_follows_the_scenario_folders(self):
+        """
+        Test that scenarios added or removed outside of save_scenario are picked up by a sync.
+        """
+        scenario_handler.save_scenario("kept", _graph("modbus", 1, 1))
+        scenario_handler.save_scenario("removed", _graph("modbus", 1, 1))
+        shutil.rmtree(os.path.join(self.folder, "removed"))
+        os.makedirs(os.path.join(self.folder, "copied"))
+        shutil.copy(
+            os.path.join(self.folder, "kept", "config.json"),
+            os.path.join(self.folder, "copied", "config.json"),
+        )
+
+        scenario_handler.sync_scenario_index()
+        self.assertEqual(scenario_handler.get_created_scenarios(), ["copied", "kept"])
+
+    def test_yaml_is_rewritten_incrementally(self):
+        """
+        Test that reusing the blocks of unchanged nodes gives the same YAML as a full conversion.
+        """
+        graph = _graph("modbus", 2, 3)
+        scenario_handler.save_scenario("plant", graph)
+        graph["nodes"][3]["data"]["port"] = "5020"
+        del graph["nodes"][1]
+        scenario_handler.save_scenario("plant", graph)
+
+        with open(os.path.join(self.folder, "plant", "config.yaml")) as f:
+            self.assertEqual(f.read(), parse_cytoscape_json(graph))
+
+
+if __name__ == "__main__":
+    unittest.main()
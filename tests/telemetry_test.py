@@ -0,0 +1,121 @@
+import os
+import socket
+import struct
+import tempfile
+import time
+import unittest
+
+from src.pcap import PcapStreamParser, decode_packet, iter_records, rescale_timestamps
+from src.telemetry import PacketCounter, TelemetryPublisher
+
+
+def _frame(src, dst, dport, payload):
+    ip_header = struct.pack(
+        "!BBHHHBBH4s4s",
+        0x45,
+        0,
+        20 + 20 + len(payload),
+        0,
+        0,
+        64,
+        6,
+        0,
+        socket.inet_aton(src),
+        socket.inet_aton(dst),
+    )
+    tcp_header = struct.pack("!HHIIBBHHH", 40000, dport, 0, 0, 5 << 4, 0x18, 0, 0, 0)
+    return b"\x00" * 12 + b"\x08\x00" + ip_header + tcp_header + payload
+
+
+def _pcap(frames):
+    data = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+    for i, frame in enumerate(frames):
+        data += struct.pack("<IIII", i, 0, len(frame), len(frame)) + frame
+    return data
+
+
+MODBUS_READ = bytes.fromhex("000100000006010300000001")
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_stream_parser_handles_partial_chunks(self):
+        """
+        Records split across chunks are returned once complete.
+        """
+        data = _pcap([_frame("10.0.0.2", "10.0.0.3", 502, MODBUS_READ)] * 3)
+        parser = PcapStreamParser()
+        records = []
+        for i in range(0, len(data), 7):
+            records.extend(parser.feed(data[i : i + 7]))
+
+        self.assertEqual(len(records), 3)
+        packet = decode_packet(parser.linktype, records[0])
+        self.assertEqual(
+            (packet.src, packet.dst, packet.dport), ("10.0.0.2", "10.0.0.3", 502)
+        )
+        self.assertEqual(packet.payload, MODBUS_READ)
+
+    def test_timestamps_are_rescaled_in_place(self):
+        """
+        Time since the first record is stretched by the factor; frames are kept.
+        """
+        frame = _frame("10.0.0.2", "10.0.0.3", 502, MODBUS_READ)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "capture.pcap")
+            with open(path, "wb") as f:
+                f.write(_pcap([frame] * 3))
+            rescale_timestamps(path, 24)
+            records = [record for _, record in iter_records(path)]
+
+        self.assertEqual([record.timestamp for record in records], [0, 24, 48])
+        self.assertEqual({record.data for record in records}, {frame})
+
+    def test_counter_counts_modbus_requests_and_nodes(self):
+        """
+        Requests to the Modbus port are counted separately from other traffic.
+        """
+        parser = PcapStreamParser()
+        records = parser.feed(
+            _pcap(
+                [
+                    _frame("10.0.0.2", "10.0.0.3", 502, MODBUS_READ),
+                    _frame("10.0.0.3", "10.0.0.2", 40000, MODBUS_READ),
+                ]
+            )
+        )
+        counter = PacketCounter()
+        for record in records:
+            counter.update(decode_packet(parser.linktype, record))
+
+        snapshot = counter.snapshot()
+        self.assertEqual(snapshot["packets"], 2)
+        self.assertEqual(snapshot["modbus_requests"], 1)
+        self.assertEqual(snapshot["nodes"]["10.0.0.2"]["packets_sent"], 1)
+        self.assertEqual(snapshot["nodes"]["10.0.0.2"]["packets_received"], 1)
+
+    def test_publisher_streams_events_until_stopped(self):
+        """
+        Subscribers receive SSE snapshots of a growing capture and an end event.
+        """
+        capture = "tests/telemetry_test.pcap"
+        with open(capture, "wb") as f:
+            f.write(_pcap([_frame("10.0.0.2", "10.0.0.3", 502, MODBUS_READ)]))
+        publisher = TelemetryPublisher(capture, interval=0.05)
+        events = publisher.events()
+        publisher.start()
+        try:
+            first = next(events)
+            self.assertTrue(first.startswith("data: "))
+            time.sleep(0.1)
+            publisher.stop()
+            remaining = list(events)
+            self.assertTrue(remaining[-1].startswith("event: end"))
+            self.assertEqual(publisher.latest["packets"], 1)
+        finally:
+            publisher.stop()
+            publisher.join(timeout=1)
+            os.remove(capture)
+
+
+if __name__ == "__main__":
+    unittest.main()
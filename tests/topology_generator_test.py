@@ -0,0 +1,119 @@
+import os
+import unittest
+
+from src import scenario_handler
+from src.cytoscape_adapter import LEVEL, REGISTER_KEYS, ScenarioValidator
+from src.topology_generator import TopologyGenerator
+from tests.helpers import use_scenario_store
+
+
+class TestTopologyGenerator(unittest.TestCase):
+    def setUp(self):
+        self.folder = use_scenario_store(self)
+
+    def read(self, name, file_name):
+        with open(os.path.join(self.folder, name, file_name)) as f:
+            return f.read()
+
+    def test_streamed_scenario_matches_saved_scenario(self):
+        """
+        Test that a generated scenario is stored exactly as save_scenario would store it, and passes validation.
+        """
+        for fanout in ("round_robin", "block", "random", "full"):
+            generator = TopologyGenerator(
+                3,
+                20,
+                fanout=fanout,
+                masters_per_slave=2,
+                polling="mixed",
+                registers="counters",
+            )
+            self.assertEqual(
+                generator.save("generated"), (23, 60 if fanout == "full" else 40)
+            )
+
+            data = scenario_handler.get_cytoscape_scenario("generated")
+            self.assertEqual(ScenarioValidator().validate(data, LEVEL.ERROR), [])
+            scenario_handler.save_scenario("saved", data)
+            for file_name in ("config.json", "config.yaml", ".config.yaml.hashes.json"):
+                self.assertEqual(
+                    self.read("generated", file_name),
+                    self.read("saved", file_name),
+                    f"{fanout}: {file_name}",
+                )
+
+        total, rows = scenario_handler.list_scenarios(search="generated")
+        self.assertEqual((rows[0]["nodes"], rows[0]["edges"]), (23, 60))
+
+    def test_fanout_patterns(self):
+        """
+        Test that every slave is polled by the requested number of distinct masters, with contiguous groups for block.
+        """
+        for fanout in ("round_robin", "block", "random"):
+            generator = TopologyGenerator(4, 40, fanout=fanout, masters_per_slave=2)
+            for slave in range(40):
+                self.assertEqual(len(set(generator.polled_by(slave))), 2)
+            polled = sum(len(generator.targets(master)) for master in range(4))
+            self.assertEqual(polled, 80)
+
+        block = TopologyGenerator(4, 40, fanout="block")
+        self.assertEqual(list(block.targets(1)), list(range(10, 20)))
+        with self.assertRaises(ValueError):
+            TopologyGenerator(10, 300, ip_network="10.0.0.0/24")
+
+    def test_malformed_templates_are_rejected(self):
+        """
+        Test that custom polling profiles and register templates are checked before anything is saved.
+        """
+        message = {
+            "timestamp": 0,
+            "recurrent": True,
+            "interval": 1,
+            "function_code": 3,
+            "start_address": 0,
+        }
+        TopologyGenerator(1, 1, polling=[message]).save("custom")
+        for polling in ([{"function_code": 3}], [{**message, "values": 1}], {}):
+            with self.assertRaises(ValueError):
+                TopologyGenerator(1, 1, polling=polling)
+        registers = {key: {"type": "sequential", "values": ""} for key in REGISTER_KEYS}
+        for template in (
+            {**registers, "coils": []},
+            {key: registers[key] for key in REGISTER_KEYS[1:]},
+            {**registers, "ip": "10.0.0.2"},
+        ):
+            with self.assertRaises(ValueError):
+                TopologyGenerator(1, 1, registers=template)
+
+    def test_failed_save_leaves_no_files(self):
+        """
+        Test that a save interrupted by an error removes its temporary files and the folder it created.
+        """
+
+        def failing_edges():
+            yield {"data": {"id": "edge"}}
+            raise RuntimeError("interrupted")
+
+        generator = TopologyGenerator(2, 2)
+        fields = {"protocol": "modbus", "ip_network": "10.0.0.0/16"}
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                scenario_handler.save_scenario_stream(
+                    "broken", fields, generator.nodes(), failing_edges()
+                )
+            self.assertFalse(os.path.exists(os.path.join(self.folder, "broken")))
+
+        # An existing scenario is kept as it was
+        generator.save("kept")
+        files = sorted(os.listdir(os.path.join(self.folder, "kept")))
+        config = self.read("kept", "config.json")
+        with self.assertRaises(RuntimeError):
+            scenario_handler.save_scenario_stream(
+                "kept", fields, generator.nodes(), failing_edges()
+            )
+        self.assertEqual(sorted(os.listdir(os.path.join(self.folder, "kept"))), files)
+        self.assertEqual(self.read("kept", "config.json"), config)
+
+
+if __name__ == "__main__":
+    unittest.main()
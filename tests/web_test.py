@@ -0,0 +1,336 @@
+import gzip
+import ipaddress
+import json
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src import scenario_handler
+from src.cytoscape_adapter import generate_network_nodes
+from src.topology_generator import TopologyGenerator
+from tests.helpers import use_scenario_store
+from web import web
+from web.web import NetworkAPI
+
+
+class TestScenarioResponses(unittest.TestCase):
+    def setUp(self):
+        self.folder = use_scenario_store(self)
+        nodes, edges = generate_network_nodes(
+            "modbus", ipaddress.ip_address("10.0.0.2"), 5, 50
+        )
+        self.graph = {
+            "protocol": "modbus",
+            "ip_network": "10.0.0.0/24",
+            "nodes": nodes,
+            "edges": edges,
+        }
+        scenario_handler.save_scenario("plant", self.graph)
+        self.api = NetworkAPI()
+        self.client = self.api.app.test_client()
+
+    def test_scenario_is_compressed_and_revalidated(self):
+        """
+        Test that scenarios are gzip-compressed and that a matching ETag gets a 304 until the scenario changes.
+        """
+        response = self.client.get(
+            "/api/networks/plant", headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(
+            json.loads(gzip.decompress(response.data)),
+            scenario_handler.get_cytoscape_scenario("plant"),
+        )
+        etag = response.headers["ETag"]
+
+        response = self.client.get(
+            "/api/networks/plant", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+
+        self.graph["ip_network"] = "10.0.0.0/16"
+        scenario_handler.save_scenario("plant", self.graph)
+        response = self.client.get(
+            "/api/networks/plant", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["ip_network"], "10.0.0.0/16")
+
+    def test_unvalidated_scenarios_are_checked_before_being_trusted(self):
+        """
+        Test that errors of a scenario stored without validation are reported, and that only validated saves are trusted.
+        """
+        broken = self.graph["nodes"][0]["data"]
+        broken["ip"] = "192.168.0.2"
+        scenario_handler.save_scenario("imported", self.graph)
+        self.assertFalse(scenario_handler.get_stored_scenario("imported")[1])
+
+        # A patch of another node goes through, but the error still counts
+        response = self.client.patch(
+            "/api/networks/imported",
+            json={
+                "operations": [
+                    {
+                        "op": "replace",
+                        "path": f"/nodes/{self.graph['nodes'][1]['data']['id']}/data/label",
+                        "value": "renamed",
+                    }
+                ]
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(scenario_handler.get_stored_scenario("imported")[1])
+
+        data = scenario_handler.get_cytoscape_scenario("imported")
+        response = self.client.put("/api/networks/imported", json=data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f"node {broken['id']} is out of range", str(response.get_json()))
+
+        data["nodes"][0]["data"]["ip"] = "10.0.0.200"
+        response = self.client.put("/api/networks/imported", json=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(scenario_handler.get_stored_scenario("imported")[1])
+
+    def test_validators_are_bounded_and_follow_the_stored_scenario(self):
+        """
+        Test that validators are kept for the last edited scenarios only, and replaced with the scenario they validate.
+        """
+        for i in range(web.VALIDATOR_CACHE_SIZE + 2):
+            response = self.client.put(f"/api/networks/plant_{i}", json=self.graph)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.api.validators), web.VALIDATOR_CACHE_SIZE)
+        self.assertNotIn("plant_0", self.api.validators)
+
+        # A scenario replaced outside of the API, as by a capture replay, is validated again
+        name = f"plant_{web.VALIDATOR_CACHE_SIZE + 1}"
+        validator = self.api.get_validator(name)
+        self.assertIs(self.api.get_validator(name), validator)
+        TopologyGenerator(2, 3, ip_network="10.0.0.0/24").save(name)
+        self.assertIsNot(self.api.get_validator(name), validator)
+
+        # A scenario created by POST does not keep the validator of a former one
+        self.api.get_validator("created")
+        response = self.client.post(
+            "/api/networks/",
+            json={
+                "projectName": "created",
+                "ipSubrange": "10.0.0.0/24",
+                "protocol": "modbus",
+                "masterNodes": 1,
+                "slaveNodes": 1,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("created", self.api.validators)
+
+    def test_put_waits_for_patches_in_flight(self):
+        """
+        Test that a PUT is validated and saved only once the scenario is no longer being patched.
+        """
+        self.graph["ip_network"] = "10.0.0.0/16"
+        responses = []
+        with self.api.save_lock:
+            thread = threading.Thread(
+                target=lambda: responses.append(
+                    self.client.put("/api/networks/plant", json=self.graph)
+                )
+            )
+            thread.start()
+            thread.join(timeout=0.2)
+            self.assertTrue(thread.is_alive())
+            self.assertEqual(
+                scenario_handler.get_cytoscape_scenario("plant")["ip_network"],
+                "10.0.0.0/24",
+            )
+        thread.join(timeout=5)
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(
+            scenario_handler.get_cytoscape_scenario("plant")["ip_network"],
+            "10.0.0.0/16",
+        )
+
+    def test_malformed_topology_templates_are_rejected(self):
+        """
+        Test that a generated scenario with a malformed custom template gets a 400 and is not created.
+        """
+        payload = {
+            "projectName": "generated",
+            "ipSubrange": "10.0.0.0/24",
+            "protocol": "modbus",
+            "masterNodes": 2,
+            "slaveNodes": 4,
+        }
+        for topology in ({"polling": [{"function_code": 3}]}, {"registers": {}}):
+            response = self.client.post(
+                "/api/networks/", json={**payload, "topology": topology}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(scenario_handler.check_scenario_exists("generated"))
+
+        response = self.client.post(
+            "/api/networks/", json={**payload, "topology": {"polling": "sparse"}}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class TestRunJobs(unittest.TestCase):
+    def setUp(self):
+        self.folder = use_scenario_store(self)
+        for patch in (
+            mock.patch.object(
+                web, "DOCKER_COMPOSE_PATH", os.path.join(self.folder, "compose.yml")
+            ),
+            mock.patch.object(web, "CONFIG_PATH", os.path.join(self.folder, "config")),
+            mock.patch.object(web, "is_running", return_value=False),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        nodes, edges = generate_network_nodes(
+            "modbus", ipaddress.ip_address("10.0.0.2"), 3, 10
+        )
+        scenario_handler.save_scenario(
+            "plant",
+            {
+                "protocol": "modbus",
+                "ip_network": "10.0.0.0/24",
+                "nodes": nodes,
+                "edges": edges,
+            },
+        )
+        self.api = NetworkAPI()
+        self.client = self.api.app.test_client()
+
+    def tearDown(self):
+        self.api.jobs.shutdown()
+
+    def wait_for(self, job_id):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            job = self.client.get(f"/api/run/jobs/{job_id}").get_json()
+            if job["state"] in ("succeeded", "failed"):
+                return job
+            time.sleep(0.01)
+        self.fail(f"Job {job_id} did not finish")
+
+    def test_run_is_prepared_in_background(self):
+        """
+        Test that a run submission returns 202 right away and that its job reports the preparation stages.
+        """
+        started = mock.MagicMock(return_value="/outputs/plant.pcap")
+        with mock.patch.object(web, "start", started):
+            response = self.client.post(
+                "/api/run/plant", json={"simulation_time": 5, "backend": "native"}
+            )
+            self.assertEqual(response.status_code, 202)
+            job_id = response.get_json()["job"]["id"]
+            self.assertEqual(response.headers["Location"], f"/api/run/jobs/{job_id}")
+            job = self.wait_for(job_id)
+            response = self.client.post("/api/run/plant", json={"simulation_time": 5})
+            rerun = self.wait_for(response.get_json()["job"]["id"])
+
+        self.assertEqual(job["state"], "succeeded", job["error"])
+        self.assertEqual(job["result"]["file_path"], "/outputs/plant.pcap")
+        self.assertEqual(
+            [stage["name"] for stage in job["stages"]],
+            [
+                "load_scenario",
+                "compile_scenario",
+                "waiting_for_launch",
+                "install_scenario",
+                "launch",
+            ],
+        )
+        # The artifacts compiled by the first run are reused
+        self.assertEqual(rerun["state"], "succeeded", rerun["error"])
+        self.assertNotIn("compile_scenario", [s["name"] for s in rerun["stages"]])
+        self.assertTrue(os.path.exists(web.DOCKER_COMPOSE_PATH))
+        self.assertTrue(os.path.isdir(os.path.join(web.CONFIG_PATH, "slaves")))
+        # The compilation workspace is removed once its artifacts are stored
+        self.assertFalse([e for e in os.listdir(self.folder) if job_id in e])
+
+    def test_failed_launch_is_reported(self):
+        """
+        Test that a job fails, without installing anything, while another scenario is running.
+        """
+        with mock.patch.object(web, "is_running", return_value=True):
+            response = self.client.post("/api/run/plant", json={"simulation_time": 5})
+            job = self.wait_for(response.get_json()["job"]["id"])
+
+        self.assertEqual(job["state"], "failed")
+        self.assertEqual(job["stage"], "waiting_for_launch")
+        self.assertIn("already running", job["error"])
+        self.assertFalse(os.path.exists(web.DOCKER_COMPOSE_PATH))
+
+    def test_time_scale_is_compiled_and_passed_to_the_run(self):
+        """
+        Test that a sped-up run gets artifacts of its own and the time scale, and that invalid scales are rejected.
+        """
+        started = mock.MagicMock(return_value="/outputs/plant.pcap")
+        with mock.patch.object(web, "start", started):
+            for time_scale in (1, 24):
+                response = self.client.post(
+                    "/api/run/plant",
+                    json={"simulation_time": 5, "time_scale": time_scale},
+                )
+                job = self.wait_for(response.get_json()["job"]["id"])
+                self.assertEqual(job["state"], "succeeded", job["error"])
+                self.assertIn("compile_scenario", [s["name"] for s in job["stages"]])
+                self.assertEqual(started.call_args.kwargs["time_scale"], time_scale)
+        # Compilation locks do not outlive their compilations
+        self.assertEqual(self.api.compile_locks, {})
+
+        for time_scale in (0, -1, "fast"):
+            response = self.client.post(
+                "/api/run/plant", json={"simulation_time": 5, "time_scale": time_scale}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_invalid_run_requests_are_rejected(self):
+        """
+        Test that a run without a positive simulation time, or without a JSON body, is rejected before any job is submitted.
+        """
+        with mock.patch.object(self.api.jobs, "submit") as submit:
+            for simulation_time in (None, "5", 0, -1, True, float("nan")):
+                response = self.client.post(
+                    "/api/run/plant", json={"simulation_time": simulation_time}
+                )
+                self.assertEqual(response.status_code, 400, simulation_time)
+            for body in ({"data": "5", "content_type": "text/plain"}, {"json": [5]}):
+                response = self.client.post("/api/run/plant", **body)
+                self.assertEqual(response.status_code, 400)
+        submit.assert_not_called()
+
+    def test_compile_locks_are_shared_then_removed(self):
+        """
+        Test that jobs compiling the same key share its lock, which is removed once none of them uses it.
+        """
+        holding = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with self.api.compile_lock("key"):
+                holding.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        holding.wait(5)
+        lock, users = self.api.compile_locks["key"]
+        self.assertTrue(lock.locked())
+        self.assertEqual(users, 1)
+        release.set()
+        thread.join(5)
+        with self.api.compile_lock("key"):
+            self.assertEqual(self.api.compile_locks["key"][1], 1)
+        self.assertEqual(self.api.compile_locks, {})
+
+    def test_unknown_job_and_scenario(self):
+        self.assertEqual(self.client.get("/api/run/jobs/missing").status_code, 404)
+        response = self.client.post("/api/run/missing", json={"simulation_time": 5})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
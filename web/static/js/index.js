@@ -122,20 +122,37 @@ function getNextIpInSubnet(ipAddress, subnet) {
     }
 }
 
-function fetchScenarios() {
-    fetch('/api/networks/')
+const SCENARIO_PAGE_SIZE = 100;
+
+function fetchScenarios(offset = 0) {
+    fetch('/api/networks/?offset=' + offset + '&limit=' + SCENARIO_PAGE_SIZE)
         .then(response => response.json())
         .then(data => {
             const scenarioList = document.getElementById('scenario-list');
-            scenarioList.innerHTML = ''; // Clear previous content
-            data.forEach(scenario => {
+            if (offset === 0) {
+                scenarioList.innerHTML = ''; // Clear previous content
+            }
+            const previousMore = document.getElementById('scenario-list-more');
+            if (previousMore) {
+                previousMore.remove();
+            }
+            data.scenarios.forEach(scenario => {
                 const scenarioItem = document.createElement('div');
-                scenarioItem.textContent = scenario;
-                scenarioList.appendChild(scenarioItem);
+                scenarioItem.textContent = scenario.name;
+                scenarioItem.title = scenario.protocol + ' · ' + scenario.nodes + ' nodes · ' + scenario.edges + ' links';
                 scenarioItem.classList.add('scenario-item');
-                scenarioItem.addEventListener('click', () => loadSelectedScenario(scenario));
+                scenarioItem.addEventListener('click', () => loadSelectedScenario(scenario.name));
                 scenarioList.appendChild(scenarioItem);
             });
+            const loaded = data.offset + data.scenarios.length;
+            if (loaded < data.total) {
+                // Next page of the index
+                const moreItem = document.createElement('div');
+                moreItem.id = 'scenario-list-more';
+                moreItem.textContent = 'Show more (' + (data.total - loaded) + ')';
+                moreItem.addEventListener('click', () => fetchScenarios(loaded));
+                scenarioList.appendChild(moreItem);
+            }
         })
         .catch(error => {
             console.error('Error fetching scenarios:', error);
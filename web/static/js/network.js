@@ -72,6 +72,7 @@ const SLAVE = 'slave';
 const TRIANGLE = 'triangle';
 
 let FILE_PATH;
+const RUN_JOB_POLL_INTERVAL = 500;
 
 const LEVEL = {
     ERROR: 1,
@@ -79,6 +80,7 @@ const LEVEL = {
 }
 
 const scenarioId = getCurrentId();
+let savedSnapshot = snapshotNetwork(currentNetwork());
 
 let nodeCount = 3;
 let edgeCount = 2;
@@ -90,6 +92,7 @@ let lastTaphold = 0;
 let canvasDragHandler;
 
 let intervalId;
+let eventSource;
 
 const nodeConfigPopup = document.getElementById('configPopup');
 const edgeConfigPopup = document.getElementById('edgeConfigPopup');
@@ -145,6 +148,8 @@ const runOverlayContentElement = document.getElementById('run_overlay_content');
 const timeProgressElement = document.getElementById('time_progress');
 const percentageProgressElement = document.getElementById('percentage_progress');
 const pcapSizeElement = document.getElementById('pcap_size');
+const packetsRateElement = document.getElementById('packets_rate');
+const modbusRateElement = document.getElementById('modbus_rate');
 
 // Add node on taphold on canvas
 cy.on('taphold', function (evt) {
@@ -1140,10 +1145,9 @@ function simulate() {
     })
         .then(response => response.json().then(data => ({ status: response.status, body: data })))
         .then(({ status, body }) => {
-            if (status === 200) {
+            if (status === 202) {
                 runSettingsElement.style.display = 'none';
-                FILE_PATH = body.file_path;
-                start(simulation_time);
+                waitForRunJob(body.status_url, simulation_time);
             } else {
                 alert(`Error starting the simulation: ${body.error}}`);
             }
@@ -1154,24 +1158,87 @@ function simulate() {
         });
 }
 
+function waitForRunJob(statusUrl, simulation_time) {
+    // The scenario is prepared and launched in the background
+    fetch(statusUrl)
+        .then(response => response.json())
+        .then(job => {
+            if (job.state === 'succeeded') {
+                FILE_PATH = job.result.file_path;
+                start(simulation_time);
+            } else if (job.state === 'failed') {
+                alert(`Error starting the simulation: ${job.error}`);
+            } else {
+                setTimeout(() => waitForRunJob(statusUrl, simulation_time), RUN_JOB_POLL_INTERVAL);
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            alert('Error starting the simulation');
+        });
+}
+
 async function start() {
     runOverlayElement.style.display = 'block';
     setRunOverlayContentLocatiton();
     reserRunOverlayContent();
 
-    intervalId = setInterval(fetchRunData, 1000);
+    if (window.EventSource) {
+        subscribeRunEvents();
+    } else {
+        intervalId = setInterval(fetchRunData, 1000);
+    }
+}
+
+function subscribeRunEvents() {
+    eventSource = new EventSource('/api/run/events');
+    eventSource.onmessage = event => {
+        const data = JSON.parse(event.data);
+        if (data.running) {
+            updateRunOverlay(data);
+        }
+    };
+    eventSource.addEventListener('end', () => {
+        alert('Simulation completed. Saved to ' + FILE_PATH);
+        cleanRunOverlay();
+    });
+    eventSource.onerror = () => {
+        // The stream only becomes available once the capture has started
+        if (eventSource.readyState === EventSource.CLOSED) {
+            intervalId = setTimeout(subscribeRunEvents, 1000);
+        }
+    };
 }
 
 function reserRunOverlayContent() {
     timeProgressElement.innerText = '00:00:00 / 00:00:00';
     percentageProgressElement.innerText = '0%';
     pcapSizeElement.innerText = '0';
+    packetsRateElement.innerText = '0';
+    modbusRateElement.innerText = '0';
 }
 
 function setRunOverlayContentLocatiton() {
     setElementCenter(runOverlayContentElement);
 }
 
+function updateRunOverlay(data) {
+    const elapsedSeconds = data.elapsed_seconds;
+    const totalSeconds = data.total_seconds;
+
+    // Format time in hh:mm:ss
+    const formatTime = seconds => new Date(seconds * 1000).toISOString().substr(11, 8);
+
+    timeProgressElement.innerText = `${formatTime(elapsedSeconds)} / ${formatTime(totalSeconds)}`;
+    percentageProgressElement.innerText = `${((elapsedSeconds / totalSeconds) * 100).toFixed(2)}%`;
+    pcapSizeElement.innerText = `${data.pcap_size}`;
+    if (data.packets_per_second !== undefined) {
+        packetsRateElement.innerText = `${data.packets_per_second}`;
+        modbusRateElement.innerText = `${data.modbus_requests_per_second}`;
+    }
+    setRunOverlayContentLocatiton();
+}
+
 function fetchRunData() {
     try {
         fetch('/api/run/', {
@@ -1179,27 +1246,14 @@ function fetchRunData() {
         })
             .then(response => response.json())
             .then(data => {
-                const elapsedSeconds = data.elapsed_seconds;
-                const totalSeconds = data.total_seconds;
-                const pcapSize = data.pcap_size;
-                const running = data.running;
-
-                if (running) {
-                    if (elapsedSeconds >= totalSeconds) {
+                if (data.running) {
+                    if (data.elapsed_seconds >= data.total_seconds) {
                         alert('Simulation completed. Saved to ' + FILE_PATH);
                         cleanRunOverlay();
-
                     } else {
-                        // Format time in hh:mm:ss
-                        const formatTime = seconds => new Date(seconds * 1000).toISOString().substr(11, 8);
-
-                        timeProgressElement.innerText = `${formatTime(elapsedSeconds)} / ${formatTime(totalSeconds)}`;
-                        percentageProgressElement.innerText = `${((elapsedSeconds / totalSeconds) * 100).toFixed(2)}%`;
-                        pcapSizeElement.innerText = `${pcapSize}`;
-
+                        updateRunOverlay(data);
                     }
                 }
-                setRunOverlayContentLocatiton();
                 console.log(data);
             });
     } catch (error) {
@@ -1216,6 +1270,11 @@ function stop() {
 
 function cleanRunOverlay() {
     clearInterval(intervalId);
+    clearTimeout(intervalId);
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
     runOverlayElement.style.display = 'none';
 }
 
@@ -1224,6 +1283,18 @@ function cancel() {
 }
 
 function save() {
+    let network = currentNetwork();
+    let logs = verifyNetworkData(network);
+    let permission = true;
+    if (logs.length > 0) {
+        permission = askForConfirmation(logs);
+    }
+    if (permission) {
+        saveNetwork(network);
+    }
+}
+
+function currentNetwork() {
     let nodes = cy.nodes().jsons();
     let edges = cy.edges().jsons();
 
@@ -1232,16 +1303,9 @@ function save() {
     }
 
     let network = { nodes: nodes, edges: edges };
-    let logs = verifyNetworkData(network);
     network.protocol = networkData.protocol
     network.ip_network = networkData.ip_network
-    let permission = true;
-    if (logs.length > 0) {
-        permission = askForConfirmation(logs);
-    }
-    if (permission) {
-        saveNetwork(network);
-    }
+    return network;
 }
 
 function getCurrentId() {
@@ -1251,21 +1315,58 @@ function getCurrentId() {
     return id;
 }
 
-function saveNetwork(json) {
-    let network = JSON.stringify(json);
+// Serialized elements of the last saved network, keyed by patch path
+function snapshotNetwork(network) {
+    const snapshot = new Map();
+    const escape = id => String(id).replace(/~/g, '~0').replace(/\//g, '~1');
+    for (const key of ['nodes', 'edges']) {
+        for (const element of network[key]) {
+            snapshot.set('/' + key + '/' + escape(element.data.id), JSON.stringify(element));
+        }
+    }
+    return snapshot;
+}
+
+function networkPatch(snapshot) {
+    const operations = [];
+    for (const path of savedSnapshot.keys()) {
+        if (!snapshot.has(path)) {
+            operations.push({ op: 'remove', path: path });
+        }
+    }
+    for (const [path, element] of snapshot) {
+        const saved = savedSnapshot.get(path);
+        if (saved !== element) {
+            operations.push({ op: saved === undefined ? 'add' : 'replace', path: path, value: JSON.parse(element) });
+        }
+    }
+    return operations;
+}
+
+function saveNetwork(network) {
+    // Only the elements changed since the last save are sent
+    const snapshot = snapshotNetwork(network);
+    const operations = networkPatch(snapshot);
+    if (operations.length === 0) {
+        alert("Network saved successfully");
+        return;
+    }
     fetch('/api/networks/' + scenarioId, {
-        method: 'PUT',
+        method: 'PATCH',
         headers: {
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify(network)
-    }).then(response => {
-        if (response.ok) {
-            alert("Network saved successfully");
-        } else {
-            configError('Error saving the network: ' + response.statusText);
-        }
-    });
+        body: JSON.stringify({ operations: operations })
+    })
+        .then(response => response.json().then(data => ({ ok: response.ok, body: data })))
+        .then(({ ok, body }) => {
+            if (ok) {
+                savedSnapshot = snapshot;
+                alert("Network saved successfully");
+            } else {
+                configError('Error saving the network: ' + body.error);
+            }
+        });
 }
 
 function verifyNetworkData(data) {
@@ -1,28 +1,88 @@
-from flask import Flask, render_template, request, jsonify, abort
+from flask import (
+    Flask,
+    Response,
+    abort,
+    jsonify,
+    render_template,
+    request,
+    stream_with_context,
+)
+import gzip
 import json
 import ipaddress
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from markupsafe import Markup
+
+try:
+    import brotli
+except ImportError:  # Optional: responses are gzip-compressed without it
+    brotli = None
 
 from src.cytoscape_adapter import (
-    validate_cytoscape_scenario,
+    ScenarioValidator,
+    apply_patch,
     generate_network_nodes,
     LEVEL,
 )
 from src.docker_compose_generator import DockerComposeGenerator
-from src.scenario_config_generator import ScenarioConfigGenerator
+from src.jobs import JobPool
+from src.scenario_config_generator import ScenarioConfigGenerator, remove_config
+from src.topology_generator import TopologyGenerator
 from src.scenario_handler import (
     get_python_scenario,
     save_scenario,
     get_cytoscape_scenario,
-    get_created_scenarios,
+    get_scenario_body,
+    get_stored_scenario,
+    list_scenarios,
     check_scenario_exists,
+    get_scenario_hash,
+    get_compiled_scenario,
+    store_compiled_scenario,
+    update_compiled_validation,
 )
 
-from src.runner import start, stop, status
+from src.profiling import PhaseTimer, phase
+from src.runner import is_running, start, stop, status, telemetry_events
+
+RUN_BACKENDS = ("docker", "native")
+# Where the scenario being run is installed
+DOCKER_COMPOSE_PATH = "docker-compose.yml"
+CONFIG_PATH = "/tmp/ICSCommEmulator"
+MAX_PAGE_SIZE = 1000
+# Number of run submissions prepared at the same time
+RUN_WORKERS = 4
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESSED_SIZE = 1024
+# Number of encoded response bodies kept in memory
+ENCODED_CACHE_SIZE = 16
+# Number of scenarios whose validation results are kept in memory
+VALIDATOR_CACHE_SIZE = 8
 
 
 class NetworkAPI:
     def __init__(self):
         self.app = Flask(__name__)
+        # Validation results of the scenarios edited last, keyed by name, with
+        # the ETag of the stored version they match
+        self.validators = OrderedDict()
+        self.validators_lock = threading.Lock()
+        # Held while a scenario is validated and saved, so PUT and PATCH do not interleave
+        self.save_lock = threading.Lock()
+        # Rendered pages and compressed bodies, keyed by (ETag, encoding)
+        self.encoded_bodies = OrderedDict()
+        self.encoded_lock = threading.Lock()
+        # Run preparations in flight; launches happen one at a time
+        self.jobs = JobPool(max_workers=RUN_WORKERS)
+        self.launch_lock = threading.Lock()
+        # Locks of the compilations in flight, with the number of jobs using each
+        self.compile_locks = {}
+        self.compile_locks_guard = threading.Lock()
         self.setup_routes()
 
     def setup_routes(self):
@@ -32,7 +92,7 @@ class NetworkAPI:
         self.app.add_url_rule(
             "/api/networks/<name>",
             view_func=self.handle_network,
-            methods=["GET", "PUT"],
+            methods=["GET", "PUT", "PATCH"],
         )
         self.app.add_url_rule("/", view_func=self.home)
         self.app.add_url_rule("/index.html", view_func=self.home)
@@ -43,18 +103,50 @@ class NetworkAPI:
         self.app.add_url_rule(
             "/api/run/<name>", view_func=self.handle_run, methods=["POST"]
         )
+        self.app.add_url_rule(
+            "/api/run/events", view_func=self.run_events, methods=["GET"]
+        )
+        self.app.add_url_rule(
+            "/api/run/jobs/<job_id>", view_func=self.handle_job, methods=["GET"]
+        )
 
     def handle_network(self, name=None):
         if request.method == "GET":
             if name:
                 try:
-                    scenario = get_cytoscape_scenario(name)
-                    return jsonify(scenario), 200
-                except:
+                    body = get_scenario_body(name)
+                except OSError:
                     return jsonify({"status": 404, "error": "Network not found"}), 404
+                return self.cached_response(
+                    body.etag, lambda: body.data, "application/json"
+                )
             else:
-                scenarios = get_created_scenarios()
-                return jsonify(scenarios), 200
+                try:
+                    offset = max(0, int(request.args.get("offset", 0)))
+                    limit = min(
+                        max(1, int(request.args.get("limit", 100))), MAX_PAGE_SIZE
+                    )
+                    total, scenarios = list_scenarios(
+                        offset,
+                        limit,
+                        protocol=request.args.get("protocol"),
+                        search=request.args.get("q"),
+                        sort=request.args.get("sort", "name"),
+                        descending=request.args.get("order") == "desc",
+                    )
+                except ValueError as e:
+                    return jsonify({"status": 400, "error": str(e)}), 400
+                return (
+                    jsonify(
+                        {
+                            "total": total,
+                            "offset": offset,
+                            "limit": limit,
+                            "scenarios": scenarios,
+                        }
+                    ),
+                    200,
+                )
         elif request.method == "POST":
             data = request.get_json()
             name = data.get("projectName")
@@ -83,6 +175,35 @@ class NetworkAPI:
             except ValueError:
                 return jsonify({"status": 400, "error": "Invalid IP range"}), 400
 
+            topology = data.get("topology")
+            if isinstance(topology, dict):
+                # Edges and messages are generated too, streamed to the store
+                try:
+                    generator = TopologyGenerator(
+                        master_nodes,
+                        slave_nodes,
+                        ip_network=str(ip_network),
+                        protocol=protocol,
+                        fanout=topology.get("fanout", "round_robin"),
+                        masters_per_slave=topology.get("mastersPerSlave", 1),
+                        polling=topology.get("polling", "periodic"),
+                        registers=topology.get("registers", "empty"),
+                        seed=topology.get("seed", 0),
+                    )
+                except (TypeError, ValueError) as e:
+                    return jsonify({"status": 400, "error": str(e)}), 400
+                generator.save(name)
+                self.forget_validator(name)
+                return (
+                    jsonify(
+                        {
+                            "message": f"Network created and saved as {name}",
+                            "status": 200,
+                        }
+                    ),
+                    200,
+                )
+
             nodes, edges = generate_network_nodes(
                 protocol, ip_network.network_address + 2, master_nodes, slave_nodes
             )
@@ -94,6 +215,7 @@ class NetworkAPI:
             }
 
             save_scenario(name, network)
+            self.forget_validator(name)
             return (
                 jsonify(
                     {"message": f"Network created and saved as {name}", "status": 200}
@@ -106,61 +228,244 @@ class NetworkAPI:
             if isinstance(data, str):
                 data = json.loads(data)
 
+            with self.save_lock:
+                validator = self.get_validator(name)
+                try:
+                    logs = validator.validate(data, LEVEL.ERROR)
+                    if logs:
+                        return jsonify({"status": 400, "error": logs}), 400
+                except Exception:
+                    return (
+                        jsonify({"status": 400, "error": "error validating json"}),
+                        400,
+                    )
+
+                etag = save_scenario(name, data, validated=True)
+                self.keep_validator(name, etag, validator)
+            return jsonify({"message": f"Scenario saved as {name}"}), 200
+
+        elif request.method == "PATCH":
+            return self.patch_network(name)
+
+    def patch_network(self, name):
+        operations = (request.get_json(silent=True) or {}).get("operations")
+        if not isinstance(operations, list):
+            return jsonify({"status": 400, "error": "Missing operations"}), 400
+        level = LEVEL.WARNING if request.args.get("level") == "warning" else LEVEL.ERROR
+
+        # Patches are read-modify-write of the stored scenario
+        with self.save_lock:
             try:
-                logs = validate_cytoscape_scenario(data, LEVEL.ERROR)
-                if logs:
-                    return jsonify({"status": 400, "error": logs}), 400
+                data = get_cytoscape_scenario(name)
+            except Exception:
+                return jsonify({"status": 404, "error": "Network not found"}), 404
+            validator = self.get_validator(name)
+            try:
+                affected = apply_patch(data, operations)
+                logs = validator.validate(data, level, affected)
+            except ValueError as e:
+                return jsonify({"status": 400, "error": str(e)}), 400
             except Exception:
                 return jsonify({"status": 400, "error": "error validating json"}), 400
 
-            save_scenario(name, data)
-            return jsonify({"message": f"Scenario saved as {name}"}), 200
+            errors = [log for log in logs if log.startswith("[ERROR]")]
+            if errors:
+                return jsonify({"status": 400, "error": errors}), 400
+
+            # Errors of elements the patch left alone are not reported, but still count
+            etag = save_scenario(name, data, validated=validator.error_free())
+            self.keep_validator(name, etag, validator)
+        return (
+            jsonify({"message": f"Scenario saved as {name}", "validation": logs}),
+            200,
+        )
+
+    def get_validator(self, name):
+        """
+        Returns the validator of a scenario, whose results match its stored version.
+
+        A scenario replaced since its validator was kept, e.g. by a capture
+        replay, gets a new one.
+        """
+        try:
+            etag = get_scenario_body(name).etag
+        except OSError:
+            etag = None
+        with self.validators_lock:
+            cached = self.validators.get(name)
+            if cached and cached[0] == etag:
+                self.validators.move_to_end(name)
+                return cached[1]
+        try:
+            stored, validated = get_stored_scenario(name)
+        except Exception:
+            stored, validated = None, False
+        if validated:
+            validator = ScenarioValidator(stored)
+        else:
+            # Generated and imported scenarios are checked once, in full
+            validator = ScenarioValidator()
+            try:
+                if stored is not None:
+                    validator.validate(stored, LEVEL.ERROR)
+            except Exception:
+                validator = ScenarioValidator()
+        self.keep_validator(name, etag, validator)
+        return validator
+
+    def keep_validator(self, name, etag, validator):
+        """
+        Keeps the validator of a scenario for its stored version with the given ETag.
+        """
+        with self.validators_lock:
+            self.validators[name] = (etag, validator)
+            self.validators.move_to_end(name)
+            if len(self.validators) > VALIDATOR_CACHE_SIZE:
+                self.validators.popitem(last=False)
+
+    def forget_validator(self, name):
+        with self.validators_lock:
+            self.validators.pop(name, None)
 
     def home(self):
         return render_template("index.html")
 
     def network(self, id):
         try:
-            network_data = get_cytoscape_scenario(id)
-        except Exception:
+            body = get_scenario_body(id)
+        except OSError:
             abort(404)
-        return render_template("network.html", network_data=network_data)
+
+        def render():
+            # The stored JSON is embedded as is, escaped like the tojson filter does
+            network_data = (
+                body.data.decode()
+                .replace("<", "\\u003c")
+                .replace(">", "\\u003e")
+                .replace("&", "\\u0026")
+                .replace("'", "\\u0027")
+            )
+            return render_template(
+                "network.html", network_data=Markup(network_data)
+            ).encode()
+
+        return self.cached_response(f"page-{body.etag}", render, "text/html")
+
+    def cached_response(self, etag, render, mimetype):
+        """
+        Builds a cacheable response for a body identified by its ETag.
+
+        Clients holding the current version get a 304. Otherwise the body is
+        compressed with the best encoding the client accepts; rendered and
+        compressed bodies are kept in memory.
+
+        Args:
+            etag (str): Hash of the content the body is generated from.
+            render (Callable[[], bytes]): Generates the uncompressed body.
+            mimetype (str): Media type of the body.
+        """
+        if request.if_none_match.contains_weak(etag) or any(
+            request.if_none_match.contains_weak(f"{etag}-{encoding}")
+            for encoding in ("br", "gzip")
+        ):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            response.vary.add("Accept-Encoding")
+            return response
+
+        data = self.encoded_body(etag, "identity", render)
+        encoding = "identity"
+        if len(data) >= MIN_COMPRESSED_SIZE:
+            if brotli is not None and request.accept_encodings["br"]:
+                encoding = "br"
+            elif request.accept_encodings["gzip"]:
+                encoding = "gzip"
+        if encoding != "identity":
+            identity = data
+            data = self.encoded_body(etag, encoding, lambda: identity)
+
+        response = Response(data, mimetype=mimetype)
+        response.set_etag(etag if encoding == "identity" else f"{etag}-{encoding}")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def encoded_body(self, etag, encoding, render):
+        with self.encoded_lock:
+            data = self.encoded_bodies.get((etag, encoding))
+            if data is not None:
+                self.encoded_bodies.move_to_end((etag, encoding))
+                return data
+        data = render()
+        if encoding == "gzip":
+            data = gzip.compress(data, compresslevel=6)
+        elif encoding == "br":
+            data = brotli.compress(data, quality=5)
+        with self.encoded_lock:
+            self.encoded_bodies[(etag, encoding)] = data
+            if len(self.encoded_bodies) > ENCODED_CACHE_SIZE:
+                self.encoded_bodies.popitem(last=False)
+        return data
 
     def handle_run(self, name=None):
         if request.method == "POST":
-            data = request.get_json()
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({"status": 400, "error": "Invalid JSON body"}), 400
+            # Runs are prepared in the background: bad values must fail here
             simulation_time = data.get("simulation_time")
-            try:
-                scenario = get_python_scenario(name)
-            except Exception as e:
+            if (
+                not isinstance(simulation_time, (int, float))
+                or isinstance(simulation_time, bool)
+                or not 0 < simulation_time < float("inf")
+            ):
                 return (
-                    jsonify({"status": 404, "error": f"Scenario not found: {e}"}),
-                    404,
+                    jsonify(
+                        {
+                            "status": 400,
+                            "error": f"Invalid simulation time: {simulation_time}",
+                        }
+                    ),
+                    400,
+                )
+            backend = data.get("backend", "docker")
+            if backend not in RUN_BACKENDS:
+                return (
+                    jsonify({"status": 400, "error": f"Unknown backend: {backend}"}),
+                    400,
                 )
             try:
-                docker_compose_path = "docker-compose.yml"
-                config_path = "/tmp/ICSCommEmulator"
-                self.generate_docker_compose(scenario, docker_compose_path, config_path)
-                self.generate_scenario_config(scenario, config_path)
-                file_path = start(
-                    docker_compose_path, simulation_time, f"{name}.pcap", config_path
+                time_scale = float(data.get("time_scale", 1))
+            except (TypeError, ValueError):
+                time_scale = 0
+            if not 0 < time_scale < float("inf"):
+                return (
+                    jsonify(
+                        {
+                            "status": 400,
+                            "error": f"Invalid time scale: {data.get('time_scale')}",
+                        }
+                    ),
+                    400,
                 )
-            except Exception as e:
+            if not check_scenario_exists(name):
                 return (
-                    jsonify({"status": 500, "error": f"Error running scenario: {e}"}),
-                    500,
+                    jsonify({"status": 404, "error": f"Scenario not found: {name}"}),
+                    404,
                 )
-
-            return (
-                jsonify(
-                    {
-                        "message": "Scenario running",
-                        "simulation_time": simulation_time,
-                        "file_path": file_path,
-                    }
-                ),
-                200,
+            job = self.jobs.submit(name, self.run_job, name, data)
+            response = jsonify(
+                {
+                    "message": "Scenario run submitted",
+                    "job": job.to_dict(),
+                    "status_url": f"/api/run/jobs/{job.id}",
+                }
             )
+            response.headers["Location"] = f"/api/run/jobs/{job.id}"
+            return response, 202
 
         elif request.method == "GET":
             try:
@@ -186,6 +491,198 @@ class NetworkAPI:
 
             return jsonify({"message": "Scenario stopped"}), 200
 
+    def handle_job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return jsonify({"status": 404, "error": f"Job not found: {job_id}"}), 404
+        return jsonify(job.to_dict()), 200
+
+    def run_events(self):
+        events = telemetry_events()
+        if events is None:
+            return jsonify({"status": 404, "error": "No scenario is running"}), 404
+        return Response(
+            stream_with_context(events),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    def run_job(self, job, name, data):
+        """
+        Prepares and launches a scenario run, in a background job.
+
+        Several scenarios can be compiled at the same time, each in a workspace
+        of its own; installing the artifacts and launching the run are done one
+        job at a time, as runs share the Docker Compose file and config folder.
+
+        Returns:
+            dict: Description of the started run.
+        """
+        simulation_time = data.get("simulation_time")
+        backend = data.get("backend", "docker")
+        cli_validation = bool(data.get("cli_validation", False))
+        time_scale = float(data.get("time_scale", 1))
+        timer = PhaseTimer(profile=bool(data.get("profile", False)))
+        docker_compose_path = DOCKER_COMPOSE_PATH
+        config_path = CONFIG_PATH
+        # Node schedules depend on the time scale; unscaled runs keep their key
+        context = [config_path] + (
+            [f"time_scale={time_scale}"] if time_scale != 1 else []
+        )
+
+        job.set_stage("load_scenario")
+        with timer.phase("load_scenario"):
+            key = get_scenario_hash(name, *context)
+            compiled = get_compiled_scenario(name, key)
+        if compiled is None:
+            job.set_stage("compile_scenario")
+            with timer.activate(), self.compile_lock(key):
+                # Another job may have compiled the same scenario meanwhile
+                compiled = get_compiled_scenario(name, key) or self.compile_scenario(
+                    name,
+                    key,
+                    job.id,
+                    docker_compose_path,
+                    config_path,
+                    cli_validation,
+                    time_scale,
+                )
+
+        job.set_stage("waiting_for_launch")
+        with self.launch_lock:
+            if is_running():
+                raise Exception("Another scenario is already running.")
+            job.set_stage("install_scenario")
+            with timer.activate():
+                recreate = self.install_scenario(
+                    compiled, docker_compose_path, config_path, cli_validation
+                )
+            if backend != "docker":
+                recreate = []
+            job.set_stage("launch")
+            file_path = start(
+                docker_compose_path,
+                simulation_time,
+                f"{name}.pcap",
+                config_path,
+                backend=backend,
+                scenario=compiled.scenario,
+                timer=timer,
+                keep_containers=bool(data.get("keep_containers", False)),
+                recreate=recreate,
+                time_scale=time_scale,
+                nominal_timestamps=bool(data.get("nominal_timestamps", False)),
+            )
+        return {
+            "simulation_time": simulation_time,
+            "time_scale": time_scale,
+            "backend": backend,
+            "file_path": file_path,
+        }
+
+    @contextmanager
+    def compile_lock(self, key):
+        """
+        Holds the lock of a compilation key, removing it once no job uses it.
+        """
+        with self.compile_locks_guard:
+            entry = self.compile_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.compile_locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.compile_locks[key]
+
+    def compile_scenario(
+        self,
+        name,
+        key,
+        workspace,
+        docker_compose_path,
+        config_path,
+        cli_validation,
+        time_scale=1.0,
+    ):
+        """
+        Generates the Docker Compose file and node configs of a scenario into the compiled artifact cache.
+
+        The artifacts are generated into a workspace next to the Docker Compose
+        file and config folder, so the run in progress is not affected.
+
+        Returns:
+            CompiledScenario: The stored artifacts.
+        """
+        with phase("load_python_scenario"):
+            scenario = get_python_scenario(name)
+        folder, file_name = os.path.split(docker_compose_path)
+        workspace_compose_path = os.path.join(folder, f".{workspace}.{file_name}")
+        workspace_config_path = f"{config_path}.{workspace}"
+        try:
+            with phase("generate_docker_compose"):
+                # Volumes point to the config folder the artifacts are installed to
+                self.generate_docker_compose(
+                    scenario, workspace_compose_path, config_path, cli_validation
+                )
+            with phase("generate_scenario_config"):
+                self.generate_scenario_config(
+                    scenario, workspace_config_path, time_scale
+                )
+            with phase("store_compiled_scenario"):
+                return store_compiled_scenario(
+                    name,
+                    key,
+                    scenario,
+                    workspace_compose_path,
+                    workspace_config_path,
+                    {"errors": [], "cli": cli_validation},
+                )
+        finally:
+            remove_config(workspace_config_path)
+            for path in (
+                workspace_compose_path,
+                os.path.join(
+                    folder, f".{os.path.basename(workspace_compose_path)}.hashes.json"
+                ),
+            ):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def install_scenario(
+        self, compiled, docker_compose_path, config_path, cli_validation=False
+    ):
+        """
+        Puts the compiled Docker Compose file and node configs of a scenario in place.
+
+        Returns:
+            list[str]: Services to recreate when the containers of the previous run are kept.
+        """
+        scenario = compiled.scenario
+        with phase("install_compiled_scenario"):
+            dcg = DockerComposeGenerator(
+                scenario["protocol"], docker_compose_path, config_path
+            )
+            services = dcg.install(compiled.docker_compose_path)
+            changed_nodes = ScenarioConfigGenerator(None, config_path).install(
+                compiled.config_path
+            )
+        if cli_validation and not compiled.validation["cli"]:
+            if not dcg.validate_file(docker_compose_path, cli=True):
+                raise Exception(
+                    "Invalid docker-compose file: rejected by docker compose"
+                )
+            update_compiled_validation(compiled, {**compiled.validation, "cli": True})
+
+        affected = dcg.changed_services | {
+            dcg.service_name(role, i) for role, i in changed_nodes
+        }
+        # Slaves written to by the last run are reset to their configured registers
+        affected |= dcg.written_services(scenario)
+        return sorted(affected & services)
+
     def get_scenario_status(self):
         return status()
 
@@ -193,26 +690,34 @@ class NetworkAPI:
         stop()
 
     def generate_scenario_config(
-        self, scenario, scenario_config_path="/tmp/ICSCommEmulator"
+        self, scenario, scenario_config_path="/tmp/ICSCommEmulator", time_scale=1.0
     ):
-        scg = ScenarioConfigGenerator(scenario, scenario_config_path)
-        scg.generate()
+        scg = ScenarioConfigGenerator(scenario, scenario_config_path, time_scale)
+        return scg.generate()
 
     def generate_docker_compose(
         self,
         scenario,
         docker_compose_path="docker-compose.yml",
         scenario_config_path="/tmp/ICSCommEmulator",
+        cli_validation=False,
     ):
         dcg = DockerComposeGenerator(
             scenario["protocol"], docker_compose_path, scenario_config_path
         )
-        dcg.parse(scenario)
+        dcg.parse(
+            scenario,
+            docker_compose_path,
+            scenario_config_path,
+            cli_validation=cli_validation,
+        )
+        return dcg
 
-    def run(self, host="127.0.0.1", port=8080):
+    def run(self, host="127.0.0.1", port=8080, threads=16):
         from waitress import serve
 
-        serve(self.app, host=host, port=port)
+        # Every telemetry stream holds a worker thread for the length of a run
+        serve(self.app, host=host, port=port, threads=threads)
 
 
 # To use this class, create an instance and call run() or import and use it in another module: